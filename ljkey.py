@@ -8,6 +8,9 @@ import ssl
 
 import websockets
 
+from src.model import codec
+from src.presenter.cache import VaultCache
+from src.presenter.connection import Connection
 from src.view import console
 
 
@@ -17,6 +20,8 @@ def create_config() -> None:
     config["Client"] = {
         "host": "0.0.0.0",
         "port": "5039",
+        "cache_dir": f"{current_dir}/cache",
+        "max_message_size": str(codec.MAX_MESSAGE_SIZE),
     }
 
     with open(f"{current_dir}/client.conf", "w") as configfile:
@@ -35,6 +40,9 @@ def arg_parser() -> argparse.Namespace:
     parser.add_argument("-p", "--port", help="Port to connect to")
     parser.add_argument("--set-host", help="Set the host in the config file")
     parser.add_argument("--set-port", help="Set the port in the config file")
+    parser.add_argument(
+        "--max-message-size", help="Largest message the server may send, in bytes"
+    )
 
     args = parser.parse_args()
     return args
@@ -55,14 +63,23 @@ def load_args(
         args.host = config["Client"]["host"]
     if not args.port:
         args.port = config["Client"]["port"]
+    args.cache_dir = config["Client"].get("cache_dir", f"{current_dir}/cache")
+    if not args.max_message_size:
+        args.max_message_size = config["Client"].get(
+            "max_message_size", str(codec.MAX_MESSAGE_SIZE)
+        )
     return args
 
 
-def start(screen: curses.window, host: str, port: int) -> None:
-    asyncio.run(main(screen, host, port))
+def start(
+    screen: curses.window, host: str, port: int, cache_dir: str, max_message_size: int
+) -> None:
+    asyncio.run(main(screen, host, port, cache_dir, max_message_size))
 
 
-async def main(screen: curses.window, host: str, port: int) -> None:
+async def main(
+    screen: curses.window, host: str, port: int, cache_dir: str, max_message_size: int
+) -> None:
     try:
         ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
         ssl_cert = ssl.get_server_certificate((host, port))
@@ -74,9 +91,10 @@ async def main(screen: curses.window, host: str, port: int) -> None:
         uri = f"ws://{host}:{port}"
 
     async with websockets.connect(
-        uri, ping_interval=None, ssl=ssl_context
+        uri, ping_interval=None, ssl=ssl_context, max_size=max_message_size
     ) as websocket:
-        await console.run(screen, websocket)
+        cache = VaultCache(pathlib.Path(cache_dir))
+        await console.run(screen, Connection(websocket), cache)
 
 
 if __name__ == "__main__":
@@ -87,6 +105,8 @@ if __name__ == "__main__":
     args = load_args(config, current_dir)
 
     try:
-        curses.wrapper(start, args.host, args.port)
+        curses.wrapper(
+            start, args.host, args.port, args.cache_dir, int(args.max_message_size)
+        )
     except ConnectionRefusedError:
         print("Cannot connect to server, make sure it is running")
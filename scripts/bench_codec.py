@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+import os
+import pickle
+import sys
+import timeit
+from pathlib import Path
+from typing import Any, Callable, Dict
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.model import codec  # noqa: E402
+
+MESSAGES: Dict[str, Dict[str, Any]] = {
+    "auth response": {
+        "status": "success",
+        "id": 7,
+        "user": {"id": 1, "email": "user@example.com", "auth_key": "$argon2id$" * 8},
+    },
+    "get_vault request": {"command": "get_vault", "id": 8, "uid": 1, "vault_name": "a"},
+    "1 MiB vault": {
+        "command": "save_vault",
+        "id": 9,
+        "uid": 1,
+        "vault_name": "personal",
+        "data": os.urandom(1024 * 1024),
+    },
+    "8 MiB vault": {
+        "status": "success",
+        "id": 10,
+        "vault": {
+            "id": 1,
+            "uid": 1,
+            "name": "work",
+            "key": os.urandom(60),
+            "data": os.urandom(8 * 1024 * 1024),
+        },
+    },
+}
+
+
+def best(func: Callable[[], Any], number: int) -> float:
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1e6
+
+
+def main() -> None:
+    print(
+        f"{'message':<20}{'format':<8}{'size (B)':>12}"
+        f"{'encode (us)':>14}{'decode (us)':>14}"
+    )
+    for name, msg in MESSAGES.items():
+        number = 10 if "MiB" in name else 10000
+        pickled = pickle.dumps(msg)
+        encoded = codec.dumps(msg)
+        rows = [
+            (
+                "pickle",
+                len(pickled),
+                best(lambda: pickle.dumps(msg), number),
+                best(lambda: pickle.loads(pickled), number),
+            ),
+            (
+                "codec",
+                len(encoded),
+                best(lambda: codec.encode(msg), number),
+                best(lambda: codec.decode(encoded), number),
+            ),
+        ]
+        for fmt, size, encode_time, decode_time in rows:
+            print(
+                f"{name:<20}{fmt:<8}{size:>12}{encode_time:>14.2f}{decode_time:>14.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
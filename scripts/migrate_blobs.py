@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.model.blob_store import BLOB_THRESHOLD, BlobStore  # noqa: E402
+from src.model.db import Database  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Move large inline vault data into the blob store. "
+        "Stop the server before running this."
+    )
+    parser.add_argument("database", metavar="DATABASE", help="Path to users.db")
+    parser.add_argument("blob_dir", metavar="BLOB_DIR", help="Path to the blob store")
+    parser.add_argument(
+        "--threshold",
+        metavar="BYTES",
+        type=int,
+        default=BLOB_THRESHOLD,
+        help="Move vault data of at least this size",
+    )
+    args = parser.parse_args()
+
+    database = Database(
+        Path(args.database),
+        blobs=BlobStore(Path(args.blob_dir)),
+        blob_threshold=args.threshold,
+    )
+    try:
+        moved = database.move_blobs()
+        removed = database.collect_blobs()
+        database.cursor.execute("""VACUUM""")
+    finally:
+        database.close()
+    print(f"Moved {moved} vaults into {args.blob_dir}")
+    print(f"Removed {removed} unreferenced blobs")
+
+
+if __name__ == "__main__":
+    main()
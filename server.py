@@ -4,92 +4,306 @@ import asyncio
 import configparser
 import functools
 import logging
+import multiprocessing
+import os
 import pathlib
-import pickle
+import signal
+import sqlite3
 import ssl
-from datetime import datetime
+import sys
+import time
 from os import mkdir, path
-from typing import Optional, cast
+from typing import Any, Dict, Optional, Set, Tuple, cast
 
 from websockets import ServerConnection, serve
-from websockets.exceptions import ConnectionClosedOK
+from websockets.exceptions import ConnectionClosed, ConnectionClosedOK
 
-from src.model import db, handlers
+from src.model import codec, handlers
+from src.model.async_db import AsyncDatabase
+from src.model.backup_store import BackupStore
+from src.model.blob_store import BLOB_THRESHOLD, BlobStore
+from src.model.cache import CACHE_SIZE, CACHE_TTL
+from src.model.commands import COMMANDS, Command
+from src.model.db import Database
+from src.model.hasher import Hasher
+from src.model.logs import parse_levels, setup_logging, setup_worker_logging
+from src.model.metrics import (
+    Metrics,
+    cache_collector,
+    current_response,
+    scheduler_collector,
+    usage_collector,
+)
+from src.model.monitor import LoopMonitor
+from src.model.ratelimit import RateLimiter, SharedRateLimiter, shared_buckets
+from src.model.scheduler import HASH, Scheduler, SchedulerBusy
+from src.model.session import InvalidSession, Sessions
+from src.model.supervisor import Supervisor
 
+logger = logging.getLogger("ljk.server")
+access = logging.getLogger("ljk.access")
+ERROR_STATUSES = {None, "failed", "unauthorized"}
 
-async def handler(ws: ServerConnection, database: db.Database) -> None:
+
+async def handler(
+    ws: ServerConnection,
+    database: AsyncDatabase,
+    hasher: Hasher,
+    sessions: Sessions,
+    limiter: RateLimiter,
+    scheduler: Scheduler,
+    metrics: Metrics,
+    max_requests: int,
+) -> None:
     lhost, lport = ws.local_address
-    logging.info(f"Connected to {lhost}:{lport}")
+    rhost, rport = ws.remote_address
+    context = {
+        "ws": ws,
+        "database": database,
+        "hasher": hasher,
+        "sessions": sessions,
+        "binding": sessions.binding(),
+        "rhost": rhost,
+        "rport": rport,
+    }
+    logger.info("Connected to %s:%s", lhost, lport)
+    limit = asyncio.Semaphore(max_requests)
+    tasks: Set[asyncio.Task[None]] = set()
     while True:
         try:
-            pickled_msg = cast(bytes, await ws.recv())
-            rhost, rport = ws.remote_address
-            msg = pickle.loads(pickled_msg)
-            logging.info(f"{rhost}:{rport} sent command {msg['command']}")
+            data = cast(bytes, await ws.recv())
+            msg = codec.decode(data)
+            logger.debug("%s:%s sent command %s", rhost, rport, msg["command"])
         except ConnectionClosedOK:
-            logging.info(f"{rhost}:{rport} disconnected")
+            logger.info("%s:%s disconnected", rhost, rport)
             break
         except Exception as e:
-            logging.error(f"{rhost}:{rport} error: {e}")
+            logger.error("%s:%s error: %s", rhost, rport, e)
             break
 
-        match msg["command"]:
-            case "register":
-                await handlers.register_user(ws, msg, database, rhost, rport)
-            case "auth":
-                await handlers.auth(ws, msg, database, rhost, rport)
-            case "get_vaults":
-                await handlers.get_vaults(ws, msg, database, rhost, rport)
-            case "get_vault":
-                await handlers.get_vault(ws, msg, database, rhost, rport)
-            case "save_vault":
-                await handlers.save_vault(ws, msg, database, rhost, rport)
-            case "create_vault":
-                await handlers.create_vault(ws, msg, database, rhost, rport)
-            case "delete_vault":
-                await handlers.delete_vault(ws, msg, database, rhost, rport)
-            case "change_email":
-                await handlers.change_email(ws, msg, database, rhost, rport)
-            case "change_auth_key":
-                await handlers.change_auth_key(ws, msg, database, rhost, rport)
-            case "delete_account":
-                await handlers.delete_account(ws, msg, database, rhost, rport)
-            case "update_vault_key":
-                await handlers.update_vault_key(ws, msg, database, rhost, rport)
-            case "update_vault_name":
-                await handlers.update_vault_name(ws, msg, database, rhost, rport)
-            case _:
-                await handlers.invalid_command(ws, msg, rhost, rport)
+        if not isinstance(msg.get("command"), str):
+            await handlers.invalid_request(
+                ws, msg, "Invalid field command", rhost, rport
+            )
+            continue
+        command = COMMANDS.get(msg["command"])
+        if command is not None and command.cost == HASH:
+            retry_after = limiter.acquire(rhost)
+            if retry_after > 0:
+                await handlers.throttled(ws, msg, retry_after, rhost, rport)
+                continue
+
+        await limit.acquire()
+        task = asyncio.create_task(
+            dispatch(command, {**context, "msg": msg}, scheduler, metrics, len(data))
+        )
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        task.add_done_callback(lambda _: limit.release())
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def dispatch(
+    command: Optional[Command],
+    context: Dict[str, Any],
+    scheduler: Scheduler,
+    metrics: Metrics,
+    request_bytes: int,
+) -> None:
+    ws, msg, rhost, rport = (
+        context["ws"],
+        context["msg"],
+        context["rhost"],
+        context["rport"],
+    )
+    if command is None:
+        await handlers.invalid_command(ws, msg, rhost, rport)
+        return
+    response: Dict[str, object] = {"status": None, "bytes": 0}
+    current_response.set(response)
+    start = time.perf_counter()
+    try:
+        error = command.validate(msg)
+        if error is not None:
+            await handlers.invalid_request(ws, msg, error, rhost, rport)
+            return
+        if not command.public:
+            try:
+                uid, expires = context["sessions"].check(
+                    msg.get("token"), context["binding"]
+                )
+            except InvalidSession as e:
+                await handlers.unauthorized(ws, msg, e, rhost, rport)
+                return
+            msg["uid"] = uid
+            token = context["sessions"].renew(uid, expires, context["binding"])
+            if token is not None:
+                msg["renewed_token"] = token
+        await scheduler.run(command.cost, functools.partial(command, context))
+    except SchedulerBusy as e:
+        logger.error("%s:%s %s", rhost, rport, e)
+        await handlers.throttled(ws, msg, 0, rhost, rport)
+    except ConnectionClosed as e:
+        logger.error("%s:%s error: %s", rhost, rport, e)
+    except Exception as e:
+        try:
+            await handlers.internal_error(ws, msg, e, rhost, rport)
+        except ConnectionClosed:
+            pass
+    finally:
+        duration = time.perf_counter() - start
+        response_bytes = int(str(response["bytes"]))
+        metrics.observe(
+            command.name,
+            duration,
+            response["status"] in ERROR_STATUSES,
+            request_bytes,
+            response_bytes,
+        )
+        access.info(
+            "%s:%s %s %s",
+            rhost,
+            rport,
+            command.name,
+            response["status"],
+            extra={
+                "command": command.name,
+                "uid": msg.get("uid"),
+                "status": response["status"],
+                "duration": round(duration, 6),
+                "request_bytes": request_bytes,
+                "response_bytes": response_bytes,
+            },
+        )
+
+
+async def report_usage(database: AsyncDatabase, usage_interval: int) -> None:
+    if int(usage_interval) == 0:
+        return
+    while True:
+        await asyncio.sleep(60 * int(usage_interval))
+        for uid, usage in database.top_usage():
+            logger.info(
+                "Usage user:%s requests:%s db_time:%.3fs bytes_written:%s",
+                uid,
+                int(usage["requests"]),
+                usage["db_time"],
+                int(usage["bytes_written"]),
+            )
+
+
+def prune_backups(backup_dir: pathlib.Path, max_backups: int) -> None:
+    backups = sorted(pathlib.Path(backup_dir).glob("backup_*.db"), key=path.getmtime)
+    if len(backups) > max_backups:
+        for backup in backups[:-max_backups]:
+            backup.unlink()
+    blob_dir = pathlib.Path(backup_dir) / "vault_blobs"
+    if blob_dir.exists():
+        referenced: Set[str] = set()
+        for backup in backups[-max_backups:]:
+            connection = sqlite3.connect(backup)
+            try:
+                referenced.update(
+                    blob
+                    for (blob,) in connection.execute(
+                        "SELECT blob FROM vaults WHERE blob IS NOT NULL"
+                    )
+                )
+            finally:
+                connection.close()
+        BlobStore(blob_dir).collect_garbage(referenced)
 
 
 async def db_backup(
-    database: db.Database,
+    database: AsyncDatabase,
     backup_dir: pathlib.Path,
     backup_interval: int,
     max_backups: int,
+    metrics: Optional[Metrics] = None,
+    store: Optional[BackupStore] = None,
 ) -> None:
     if int(backup_interval) == 0:
         return
     while True:
         await asyncio.sleep(3600 * int(backup_interval))
-        if int(max_backups) != 0:
-            try:
-                backups = sorted(pathlib.Path(backup_dir).iterdir(), key=path.getmtime)
-                if len(backups) > int(max_backups):
-                    for backup in backups[: -int(max_backups)]:
-                        backup.unlink()
-            except Exception as e:
-                logging.error(f"Backup cleanup error: {e}")
         try:
-            await database.backup(backup_dir)
+            if store is not None:
+                removed = await asyncio.to_thread(store.prune, int(max_backups))
+                logger.info("Removed %s unreferenced backup blobs", removed)
+            elif int(max_backups) != 0:
+                await asyncio.to_thread(prune_backups, backup_dir, int(max_backups))
+        except Exception as e:
+            logger.error("Backup cleanup error: %s", e)
+        try:
+            if store is not None:
+                backup = await database.snapshot(store)
+            else:
+                backup = await database.backup(backup_dir)
+            logger.info(
+                "Backup %s written, %s bytes in %.3fs",
+                backup["path"],
+                backup["size"],
+                backup["duration"],
+            )
         except Exception as e:
-            logging.error(f"Backup error: {e}")
+            logger.error("Backup error: %s", e)
+            continue
+        if metrics is not None:
+            metrics.set_gauge(
+                "ljk_backup_duration_seconds",
+                backup["duration"],
+                "Time the last backup took.",
+            )
+            metrics.set_gauge(
+                "ljk_backup_size_bytes", backup["size"], "Size of the last backup."
+            )
+            metrics.set_gauge(
+                "ljk_backup_timestamp_seconds",
+                time.time(),
+                "When the last backup finished.",
+            )
+
+
+async def serve_metrics(metrics: Metrics, host: str, port: int) -> None:
+    try:
+        await metrics.serve(host, port)
+    except OSError as e:
+        logger.error("Metrics endpoint on %s:%s disabled: %s", host, port, e)
 
 
 async def run_server(
-    host: str, port: int, ssl_context: Optional[ssl.SSLContext], database: db.Database
+    host: str,
+    port: int,
+    ssl_context: Optional[ssl.SSLContext],
+    database: AsyncDatabase,
+    hasher: Hasher,
+    max_requests: int = 16,
+    sessions: Optional[Sessions] = None,
+    limiter: Optional[RateLimiter] = None,
+    scheduler: Optional[Scheduler] = None,
+    metrics: Optional[Metrics] = None,
+    metrics_host: str = "127.0.0.1",
+    metrics_port: int = 0,
+    reuse_port: bool = False,
+    max_message_size: int = codec.MAX_MESSAGE_SIZE,
 ) -> None:
-    bound_handler = functools.partial(handler, database=database)
+    scheduler = scheduler or Scheduler(
+        hasher.workers, database.max_batch, database.reader_count * 4
+    )
+    metrics = metrics or Metrics()
+    metrics.add_collector(functools.partial(scheduler_collector, scheduler))
+    metrics.add_collector(functools.partial(usage_collector, database))
+    metrics.add_collector(functools.partial(cache_collector, database.cache))
+    bound_handler = functools.partial(
+        handler,
+        database=database,
+        hasher=hasher,
+        sessions=sessions or Sessions(),
+        limiter=limiter or RateLimiter(1, 5),
+        scheduler=scheduler,
+        metrics=metrics,
+        max_requests=max_requests,
+    )
     async with serve(
         bound_handler,
         host,
@@ -97,8 +311,16 @@ async def run_server(
         logger=logging.getLogger(),
         ssl=ssl_context,
         ping_interval=None,
+        reuse_port=reuse_port,
+        max_size=max_message_size,
     ):
-        await asyncio.Future()
+        if int(metrics_port) != 0:
+            await asyncio.gather(
+                asyncio.Future(),
+                serve_metrics(metrics, metrics_host, int(metrics_port)),
+            )
+        else:
+            await asyncio.Future()
 
 
 def create_config() -> None:
@@ -107,12 +329,43 @@ def create_config() -> None:
     config["server"] = {
         "host": "0.0.0.0",
         "port": "5039",
+        "max_requests": "16",
+        "max_message_size": str(codec.MAX_MESSAGE_SIZE),
         "ssl_path": "",
         "log_dir": f"{current_dir}/logs",
+        "log_level": "INFO",
+        "log_levels": "",
+        "log_max_bytes": "10485760",
+        "log_rotation": "24",
+        "log_backups": "14",
         "database": f"{current_dir}/users.db",
+        "db_readers": "0",
+        "commit_window": "2",
+        "max_batch": "64",
+        "blob_dir": "",
+        "blob_threshold": str(BLOB_THRESHOLD),
+        "cache_size": str(CACHE_SIZE),
+        "cache_ttl": str(int(CACHE_TTL)),
         "backup_dir": f"{current_dir}/backups",
         "backup_interval": "6",
         "max_backups": "10",
+        "backup_mode": "full",
+        "hash_workers": "0",
+        "hash_queue": "0",
+        "session_ttl": "3600",
+        "auth_rate": "1",
+        "auth_burst": "5",
+        "hash_slots": "0",
+        "write_slots": "0",
+        "read_slots": "0",
+        "max_queued": "256",
+        "queue_timeout": "5000",
+        "usage_interval": "60",
+        "metrics_host": "127.0.0.1",
+        "metrics_port": "5040",
+        "lag_interval": "100",
+        "stall_threshold": "500",
+        "workers": "1",
     }
     with open(f"{current_dir}/server.conf", "w") as configfile:
         config.write(configfile)
@@ -132,15 +385,87 @@ def arg_parser() -> argparse.Namespace:
     parser.add_argument(
         "-p", "--port", metavar="PORT", help="Set the port to listen on"
     )
+    parser.add_argument(
+        "-n",
+        "--max-requests",
+        metavar="NUM",
+        help="Set the maximum number of concurrent requests per connection",
+    )
+    parser.add_argument(
+        "--max-message-size",
+        metavar="BYTES",
+        help="Set the largest message a client may send",
+    )
     parser.add_argument(
         "-s", "--ssl-cert", metavar="PATH", help="Set the path to the SSL certificate"
     )
     parser.add_argument(
         "-d", "--database", metavar="PATH", help="Set the path to the database file"
     )
+    parser.add_argument(
+        "-r",
+        "--db-readers",
+        metavar="NUM",
+        help="Set the number of read-only database connections, if 0 one per core",
+    )
+    parser.add_argument(
+        "-c",
+        "--commit-window",
+        metavar="MS",
+        help="Set how long writes are collected before they are committed together",
+    )
+    parser.add_argument(
+        "-B",
+        "--max-batch",
+        metavar="NUM",
+        help="Set the maximum number of writes committed in one transaction",
+    )
+    parser.add_argument(
+        "--blob-dir",
+        metavar="PATH",
+        help="Set where large vaults are stored outside the database, if empty never",
+    )
+    parser.add_argument(
+        "--blob-threshold",
+        metavar="BYTES",
+        help="Set the size from which vault data is kept in the blob directory",
+    )
+    parser.add_argument(
+        "--cache-size",
+        metavar="NUM",
+        help="Set how many user and vault lookups are cached, if 0 none",
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        metavar="SECONDS",
+        help="Set how long a cached lookup is used before it is read again",
+    )
     parser.add_argument(
         "-l", "--log-dir", metavar="PATH", help="Set the path to the log directory"
     )
+    parser.add_argument(
+        "--log-level", metavar="LEVEL", help="Set the default log level"
+    )
+    parser.add_argument(
+        "--log-levels",
+        metavar="NAME=LEVEL,...",
+        help="Set log levels per subsystem, e.g. access=WARNING,handlers=ERROR",
+    )
+    parser.add_argument(
+        "--log-max-bytes",
+        metavar="BYTES",
+        help="Set the size at which the log is rotated, if 0 never by size",
+    )
+    parser.add_argument(
+        "--log-rotation",
+        metavar="HOURS",
+        help="Set how often the log is rotated, if 0 never by time",
+    )
+    parser.add_argument(
+        "--log-backups",
+        metavar="NUM",
+        help="Set how many compressed old logs to keep",
+    )
     parser.add_argument(
         "-b",
         "--backup-dir",
@@ -159,6 +484,102 @@ def arg_parser() -> argparse.Namespace:
         metavar="NUM",
         help="Set the maximum number of backups to keep, if 0 no limit",
     )
+    parser.add_argument(
+        "--backup-mode",
+        choices=["full", "dedup"],
+        help="Set whether backups copy the database or store changed vaults once",
+    )
+    parser.add_argument(
+        "--restore",
+        metavar="MANIFEST",
+        help="Rebuild the database file from a dedup backup manifest and exit",
+    )
+    parser.add_argument(
+        "-w",
+        "--hash-workers",
+        metavar="NUM",
+        help="Set the number of password hashing processes, if 0 one per core",
+    )
+    parser.add_argument(
+        "-q",
+        "--hash-queue",
+        metavar="NUM",
+        help="Set how many hashing requests may wait for a slot, if 0 four per worker",
+    )
+    parser.add_argument(
+        "-t",
+        "--session-ttl",
+        metavar="SECONDS",
+        help="Set how long a session token stays valid after login",
+    )
+    parser.add_argument(
+        "-a",
+        "--auth-rate",
+        metavar="NUM",
+        help="Set the login requests per second allowed per address, if 0 no limit",
+    )
+    parser.add_argument(
+        "-A",
+        "--auth-burst",
+        metavar="NUM",
+        help="Set how many login requests each address may send at once",
+    )
+    parser.add_argument(
+        "--hash-slots",
+        metavar="NUM",
+        help="Set how many hashing requests run at once, if 0 one per hash worker",
+    )
+    parser.add_argument(
+        "--write-slots",
+        metavar="NUM",
+        help="Set how many write requests run at once, if 0 the max batch size",
+    )
+    parser.add_argument(
+        "--read-slots",
+        metavar="NUM",
+        help="Set how many read requests run at once, if 0 four per db reader",
+    )
+    parser.add_argument(
+        "--max-queued",
+        metavar="NUM",
+        help="Set how many read and write requests may wait for a slot",
+    )
+    parser.add_argument(
+        "--queue-timeout",
+        metavar="MS",
+        help="Set how long a request may wait for a slot before it is rejected",
+    )
+    parser.add_argument(
+        "--usage-interval",
+        metavar="MINUTES",
+        help="Set how often the heaviest database users are logged, if 0 never",
+    )
+    parser.add_argument(
+        "--metrics-host",
+        metavar="HOST",
+        help="Set the host the metrics endpoint listens on",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        metavar="PORT",
+        help="Set the port the metrics endpoint listens on, if 0 it is disabled",
+    )
+    parser.add_argument(
+        "--lag-interval",
+        metavar="MS",
+        help="Set how often event loop lag is sampled, if 0 the monitor is disabled",
+    )
+    parser.add_argument(
+        "--stall-threshold",
+        metavar="MS",
+        help="Set how long the event loop may stall before its stack is logged",
+    )
+    parser.add_argument(
+        "--workers",
+        metavar="NUM",
+        help="Set how many server processes share the port and database, "
+        "the hash queue limit is split between them",
+    )
 
     args = parser.parse_args()
     return args
@@ -168,41 +589,234 @@ def load_args(config: configparser.ConfigParser) -> argparse.Namespace:
     args = arg_parser()
     if not args.database:
         args.database = config["server"]["database"]
+    if not args.db_readers:
+        args.db_readers = config["server"].get("db_readers", "0")
+    if not args.commit_window:
+        args.commit_window = config["server"].get("commit_window", "2")
+    if not args.max_batch:
+        args.max_batch = config["server"].get("max_batch", "64")
+    if args.blob_dir is None:
+        args.blob_dir = config["server"].get("blob_dir", "")
+    if not args.blob_threshold:
+        args.blob_threshold = config["server"].get(
+            "blob_threshold", str(BLOB_THRESHOLD)
+        )
+    if not args.cache_size:
+        args.cache_size = config["server"].get("cache_size", str(CACHE_SIZE))
+    if not args.cache_ttl:
+        args.cache_ttl = config["server"].get("cache_ttl", str(int(CACHE_TTL)))
     if not args.host:
         args.host = config["server"]["host"]
     if not args.port:
         args.port = config["server"]["port"]
+    if not args.max_requests:
+        args.max_requests = config["server"].get("max_requests", "16")
+    if not args.max_message_size:
+        args.max_message_size = config["server"].get(
+            "max_message_size", str(codec.MAX_MESSAGE_SIZE)
+        )
     if not args.ssl_cert:
         args.ssl_cert = config["server"]["ssl_path"]
     if not args.log_dir:
         args.log_dir = config["server"]["log_dir"]
+    if not args.log_level:
+        args.log_level = config["server"].get("log_level", "INFO")
+    if args.log_levels is None:
+        args.log_levels = config["server"].get("log_levels", "")
+    if not args.log_max_bytes:
+        args.log_max_bytes = config["server"].get("log_max_bytes", "10485760")
+    if not args.log_rotation:
+        args.log_rotation = config["server"].get("log_rotation", "24")
+    if not args.log_backups:
+        args.log_backups = config["server"].get("log_backups", "14")
     if not args.backup_dir:
         args.backup_dir = config["server"]["backup_dir"]
     if not args.backup_interval:
         args.backup_interval = config["server"]["backup_interval"]
     if not args.max_backups:
         args.max_backups = config["server"]["max_backups"]
+    if not args.backup_mode:
+        args.backup_mode = config["server"].get("backup_mode", "full")
+    if not args.hash_workers:
+        args.hash_workers = config["server"].get("hash_workers", "0")
+    if not args.hash_queue:
+        args.hash_queue = config["server"].get("hash_queue", "0")
+    if not args.session_ttl:
+        args.session_ttl = config["server"].get("session_ttl", "3600")
+    if not args.auth_rate:
+        args.auth_rate = config["server"].get("auth_rate", "1")
+    if not args.auth_burst:
+        args.auth_burst = config["server"].get("auth_burst", "5")
+    if not args.hash_slots:
+        args.hash_slots = config["server"].get("hash_slots", "0")
+    if not args.write_slots:
+        args.write_slots = config["server"].get("write_slots", "0")
+    if not args.read_slots:
+        args.read_slots = config["server"].get("read_slots", "0")
+    if not args.max_queued:
+        args.max_queued = config["server"].get("max_queued", "256")
+    if not args.queue_timeout:
+        args.queue_timeout = config["server"].get("queue_timeout", "5000")
+    if not args.usage_interval:
+        args.usage_interval = config["server"].get("usage_interval", "60")
+    if not args.metrics_host:
+        args.metrics_host = config["server"].get("metrics_host", "127.0.0.1")
+    if not args.metrics_port:
+        args.metrics_port = config["server"].get("metrics_port", "5040")
+    if not args.lag_interval:
+        args.lag_interval = config["server"].get("lag_interval", "100")
+    if not args.stall_threshold:
+        args.stall_threshold = config["server"].get("stall_threshold", "500")
+    if not args.workers:
+        args.workers = config["server"].get("workers", "1")
     return args
 
 
 def main(
     host: str,
     port: int,
+    max_requests: int,
+    max_message_size: int,
     db_path: pathlib.Path,
+    db_readers: int,
+    commit_window: int,
+    max_batch: int,
+    blob_dir: str,
+    blob_threshold: int,
+    cache_size: int,
+    cache_ttl: float,
     backup_dir: pathlib.Path,
     backup_interval: int,
     max_backups: int,
+    backup_mode: str,
+    hash_workers: int,
+    hash_queue: int,
+    session_ttl: int,
+    auth_rate: float,
+    auth_burst: int,
+    hash_slots: int,
+    write_slots: int,
+    read_slots: int,
+    max_queued: int,
+    queue_timeout: int,
+    usage_interval: int,
+    metrics_host: str,
+    metrics_port: int,
+    lag_interval: int,
+    stall_threshold: int,
     ssl_context: Optional[ssl.SSLContext],
+    worker: Optional[int] = None,
+    rate_buckets: Optional[Any] = None,
 ) -> None:
-    database = db.Database(db_path)
+    if worker is not None and int(metrics_port) != 0:
+        metrics_port = int(metrics_port) + worker
+    database = AsyncDatabase(
+        db_path,
+        int(db_readers),
+        int(commit_window) / 1000,
+        int(max_batch),
+        pathlib.Path(blob_dir) if blob_dir else None,
+        int(blob_threshold),
+        int(cache_size),
+        float(cache_ttl),
+        worker is not None,
+    )
+    hasher = Hasher(int(hash_workers))
+    sessions = Sessions(int(session_ttl))
+    limiter = (
+        SharedRateLimiter(float(auth_rate), int(auth_burst), rate_buckets)
+        if rate_buckets is not None
+        else RateLimiter(float(auth_rate), int(auth_burst))
+    )
+    scheduler = Scheduler(
+        int(hash_slots) or hasher.workers,
+        int(write_slots) or database.max_batch,
+        int(read_slots) or database.reader_count * 4,
+        int(max_queued),
+        int(queue_timeout) / 1000,
+        int(hash_queue) or hasher.workers * 4,
+    )
+    monitor = LoopMonitor(int(lag_interval) / 1000, int(stall_threshold) / 1000)
+    metrics = Metrics()
+    metrics.add_collector(monitor.collect)
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
+    server = loop.create_task(
+        run_server(
+            host,
+            port,
+            ssl_context,
+            database,
+            hasher,
+            int(max_requests),
+            sessions,
+            limiter,
+            scheduler,
+            metrics,
+            metrics_host,
+            int(metrics_port),
+            worker is not None,
+            int(max_message_size),
+        )
+    )
     tasks = [
-        loop.create_task(run_server(host, port, ssl_context, database)),
-        loop.create_task(db_backup(database, backup_dir, backup_interval, max_backups)),
+        loop.create_task(report_usage(database, usage_interval)),
+        loop.create_task(monitor.run()),
     ]
-    loop.run_until_complete(asyncio.wait(tasks))
-    loop.close()
+    if not worker:
+        tasks.append(
+            loop.create_task(
+                db_backup(
+                    database,
+                    backup_dir,
+                    backup_interval,
+                    max_backups,
+                    metrics,
+                    BackupStore(backup_dir) if backup_mode == "dedup" else None,
+                )
+            )
+        )
+    try:
+        loop.run_until_complete(server)
+    except Exception as e:
+        logger.critical("Server stopped: %s", e)
+        raise
+    finally:
+        hasher.close()
+        database.close()
+        loop.close()
+
+
+def create_ssl_context(ssl_cert: str) -> Optional[ssl.SSLContext]:
+    if ssl_cert == "":
+        return None
+    ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    ssl_context.load_cert_chain(ssl_cert, keyfile=pathlib.Path("./certs/server.key"))
+    return ssl_context
+
+
+def run_worker(
+    index: int,
+    log_queue: Any,
+    log_level: str,
+    log_levels: Dict[str, str],
+    ssl_cert: str,
+    settings: Tuple[Any, ...],
+    rate_buckets: Any,
+) -> None:
+    setup_worker_logging(log_queue, log_level, log_levels)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    worker_args: Tuple[Any, ...] = (
+        *settings,
+        create_ssl_context(ssl_cert),
+        index,
+        rate_buckets,
+    )
+    try:
+        main(*worker_args)
+    except KeyboardInterrupt:
+        pass
 
 
 if __name__ == "__main__":
@@ -216,39 +830,103 @@ if __name__ == "__main__":
         mkdir(args.log_dir)
     if not path.exists(args.backup_dir):
         mkdir(args.backup_dir)
-    ssl_context: Optional[ssl.SSLContext] = None
-    if args.ssl_cert != "":
-        ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
-        ssl_context.load_cert_chain(
-            args.ssl_cert, keyfile=pathlib.Path("./certs/server.key")
+    if args.restore:
+        BackupStore(args.backup_dir).restore(
+            pathlib.Path(args.restore), pathlib.Path(args.database)
         )
+        print(f"Restored {args.database} from {args.restore}")
+        sys.exit()
+    ssl_context = create_ssl_context(args.ssl_cert)
+    if ssl_context is not None:
         print("SSL enabled")
     else:
         print("SSL disabled")
-    timestamp = datetime.now().strftime("%Y-%m-%d")
-    logging.basicConfig(
-        filename=f"{args.log_dir}/{timestamp}.log",
-        level=logging.INFO,
-        format="%(asctime)s %(levelname)s %(message)s",
+    workers = int(args.workers)
+    log_queue: Optional[Any] = None
+    if workers > 1:
+        cpus = os.cpu_count() or 1
+        if int(args.hash_workers) == 0:
+            args.hash_workers = str(max(1, cpus // workers))
+        if int(args.db_readers) == 0:
+            args.db_readers = str(max(1, cpus // workers))
+        if int(args.hash_queue) != 0:
+            args.hash_queue = str(max(1, int(args.hash_queue) // workers))
+        Database(pathlib.Path(args.database)).close()
+        log_queue = multiprocessing.get_context("spawn").Queue()
+    log_file = pathlib.Path(args.log_dir) / "server.log"
+    listener = setup_logging(
+        log_file,
+        args.log_level,
+        parse_levels(args.log_levels),
+        int(args.log_max_bytes),
+        3600 * int(args.log_rotation),
+        int(args.log_backups),
+        log_queue,
+    )
+    settings = (
+        args.host,
+        args.port,
+        args.max_requests,
+        args.max_message_size,
+        pathlib.Path(args.database),
+        args.db_readers,
+        args.commit_window,
+        args.max_batch,
+        args.blob_dir,
+        args.blob_threshold,
+        args.cache_size,
+        args.cache_ttl,
+        args.backup_dir,
+        args.backup_interval,
+        args.max_backups,
+        args.backup_mode,
+        args.hash_workers,
+        args.hash_queue,
+        args.session_ttl,
+        args.auth_rate,
+        args.auth_burst,
+        args.hash_slots,
+        args.write_slots,
+        args.read_slots,
+        args.max_queued,
+        args.queue_timeout,
+        args.usage_interval,
+        args.metrics_host,
+        args.metrics_port,
+        args.lag_interval,
+        args.stall_threshold,
     )
 
     print(f"Listening on {args.host}:{args.port}")
     print(f"Database File: {args.database}")
-    print(f"Log File: {args.log_dir}/{timestamp}.log")
+    print(f"Log File: {log_file}")
+    if workers > 1:
+        print(f"Workers: {workers}")
     print("Press Ctrl+C to stop")
 
-    running = True
-    while running:
+    if workers > 1:
+        supervisor = Supervisor(
+            run_worker,
+            (
+                log_queue,
+                args.log_level,
+                parse_levels(args.log_levels),
+                args.ssl_cert,
+                settings,
+                shared_buckets(multiprocessing.get_context("spawn")),
+            ),
+            workers,
+        )
         try:
-            main(
-                args.host,
-                args.port,
-                pathlib.Path(args.database),
-                args.backup_dir,
-                args.backup_interval,
-                args.max_backups,
-                ssl_context,
-            )
+            supervisor.run()
         except KeyboardInterrupt:
             print("Stopping server")
-            running = False
+    else:
+        running = True
+        while running:
+            try:
+                main(*settings, ssl_context)
+            except KeyboardInterrupt:
+                print("Stopping server")
+                running = False
+    listener.stop()
@@ -0,0 +1,443 @@
+import asyncio
+import os
+import queue
+import sqlite3
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Hashable,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+from .backup_store import BackupStore
+from .blob_store import BLOB_THRESHOLD, BlobStore
+from .cache import CACHE_SIZE, CACHE_TTL, MISSING, Cache
+from .db import Database
+
+T = TypeVar("T")
+Job = Tuple[Callable[..., Any], Tuple[Any, ...]]
+Queued = Tuple[Job, "asyncio.Future[Any]", int, Tuple[Hashable, ...]]
+
+QUANTUM = 64 * 1024
+BATCH_BYTES = 1024 * 1024
+JOB_COST = 256
+
+
+def job_cost(value: Any) -> int:
+    if isinstance(value, (bytes, bytearray, memoryview, str)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(job_cost(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(job_cost(item) for item in value)
+    return 8
+
+
+def data_version(connection: sqlite3.Connection) -> int:
+    cursor = connection.execute("""PRAGMA data_version""")
+    version = int(cursor.fetchone()[0])
+    cursor.close()
+    return version
+
+
+class AsyncDatabase:
+    def __init__(
+        self,
+        database_path: Path,
+        readers: int = 0,
+        commit_window: float = 0.0,
+        max_batch: int = 64,
+        blob_dir: Optional[Path] = None,
+        blob_threshold: int = BLOB_THRESHOLD,
+        cache_size: int = CACHE_SIZE,
+        cache_ttl: float = CACHE_TTL,
+        shared: bool = False,
+    ) -> None:
+        self.database_name: Path = database_path
+        self.cache: Cache = Cache(cache_size, cache_ttl)
+        self.blobs: Optional[BlobStore] = BlobStore(blob_dir) if blob_dir else None
+        self.writer: Database = Database(
+            database_path, blobs=self.blobs, blob_threshold=blob_threshold
+        )
+        self.reader_count: int = readers or os.cpu_count() or 1
+        self.readers: queue.SimpleQueue[Database] = queue.SimpleQueue()
+        for _ in range(self.reader_count):
+            self.readers.put(Database(database_path, readonly=True, blobs=self.blobs))
+        self.write_executor = ThreadPoolExecutor(1, thread_name_prefix="db-writer")
+        self.read_executor = ThreadPoolExecutor(
+            self.reader_count, thread_name_prefix="db-reader"
+        )
+        self.commit_window: float = commit_window
+        self.max_batch: int = max_batch
+        self.pending: OrderedDict[int, Deque[Queued]] = OrderedDict()
+        self.deficits: Dict[int, int] = {}
+        self.batch_task: Optional[asyncio.Task[None]] = None
+        self.usage: Dict[int, Dict[str, float]] = {}
+        self.version_connection: Optional[sqlite3.Connection] = None
+        self.data_version: int = 0
+        if shared:
+            self.version_connection = sqlite3.connect(
+                f"file:{database_path}?mode=ro", uri=True
+            )
+            self.data_version = data_version(self.version_connection)
+
+    def close(self) -> None:
+        if self.version_connection is not None:
+            self.version_connection.close()
+        self.write_executor.shutdown()
+        self.read_executor.shutdown()
+        for _ in range(self.reader_count):
+            self.readers.get().close()
+        self.writer.close()
+
+    def account(self, uid: int, db_time: float, bytes_written: int = 0) -> None:
+        usage = self.usage.setdefault(
+            uid, {"requests": 0, "db_time": 0.0, "bytes_written": 0}
+        )
+        usage["requests"] += 1
+        usage["db_time"] += db_time
+        usage["bytes_written"] += bytes_written
+
+    def top_usage(self, limit: int = 10) -> List[Tuple[int, Dict[str, float]]]:
+        return sorted(
+            self.usage.items(), key=lambda item: item[1]["db_time"], reverse=True
+        )[:limit]
+
+    async def read(self, func: Callable[..., T], *args: Any, uid: int = 0) -> T:
+        def run() -> Tuple[T, float]:
+            reader = self.readers.get()
+            start = time.perf_counter()
+            try:
+                return func(reader, *args), time.perf_counter() - start
+            finally:
+                self.readers.put(reader)
+
+        loop = asyncio.get_running_loop()
+        result, elapsed = await loop.run_in_executor(self.read_executor, run)
+        self.account(uid, elapsed)
+        return result
+
+    def sync_cache(self) -> None:
+        if self.version_connection is None:
+            return
+        version = data_version(self.version_connection)
+        if version != self.data_version:
+            self.data_version = version
+            self.cache.clear()
+
+    async def cached(
+        self,
+        key: Hashable,
+        tags: Tuple[Hashable, ...],
+        func: Callable[..., T],
+        *args: Any,
+        uid: int = 0,
+    ) -> T:
+        self.sync_cache()
+        value = self.cache.get(key)
+        if value is not MISSING:
+            return value
+        generation = self.cache.generation
+        value = await self.read(func, *args, uid=uid)
+        if value is not None:
+            self.cache.put(key, value, tags, generation)
+        return value
+
+    async def write(
+        self,
+        func: Callable[..., T],
+        *args: Any,
+        uid: int = 0,
+        invalidates: Tuple[Hashable, ...] = (),
+    ) -> T:
+        loop = asyncio.get_running_loop()
+        future: asyncio.Future[T] = loop.create_future()
+        cost = JOB_COST + job_cost(args)
+        self.pending.setdefault(uid, deque()).append(
+            ((func, args), future, cost, invalidates)
+        )
+        if self.batch_task is None:
+            self.batch_task = loop.create_task(self._commit_pending())
+        return await future
+
+    def _next_batch(self) -> List[Tuple[int, Queued]]:
+        batch: List[Tuple[int, Queued]] = []
+        size = 0
+        while self.pending and len(batch) < self.max_batch and size < BATCH_BYTES:
+            uid, jobs = next(iter(self.pending.items()))
+            self.deficits[uid] = self.deficits.get(uid, 0) + QUANTUM
+            while (
+                jobs
+                and len(batch) < self.max_batch
+                and jobs[0][2] <= self.deficits[uid]
+            ):
+                queued = jobs.popleft()
+                self.deficits[uid] -= queued[2]
+                size += queued[2]
+                batch.append((uid, queued))
+            if jobs:
+                self.pending.move_to_end(uid)
+            else:
+                del self.pending[uid]
+                del self.deficits[uid]
+        return batch
+
+    async def _commit_pending(self) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            while self.pending:
+                if self.commit_window > 0:
+                    await asyncio.sleep(self.commit_window)
+                batch = self._next_batch()
+                try:
+                    results = await loop.run_in_executor(
+                        self.write_executor,
+                        self._commit_batch,
+                        [job for _, (job, _, _, _) in batch],
+                    )
+                except Exception as e:
+                    results = [(e, None, 0.0) for _ in batch]
+                for uid, (_, _, _, invalidates) in batch:
+                    self.cache.invalidate(*invalidates)
+                for (uid, (_, future, cost, _)), (error, result, elapsed) in zip(
+                    batch, results
+                ):
+                    self.account(uid, elapsed, cost - JOB_COST if error is None else 0)
+                    if future.done():
+                        continue
+                    if error is not None:
+                        future.set_exception(error)
+                    else:
+                        future.set_result(result)
+        finally:
+            self.batch_task = None
+
+    def _commit_batch(
+        self, jobs: List[Job]
+    ) -> List[Tuple[Optional[Exception], Any, float]]:
+        results: List[Tuple[Optional[Exception], Any, float]] = []
+        cursor = self.writer.cursor
+        cursor.execute("""BEGIN IMMEDIATE""")
+        for func, args in jobs:
+            start = time.perf_counter()
+            cursor.execute("""SAVEPOINT job""")
+            try:
+                result = func(self.writer, *args)
+                cursor.execute("""RELEASE job""")
+                results.append((None, result, time.perf_counter() - start))
+            except Exception as e:
+                cursor.execute("""ROLLBACK TO job""")
+                cursor.execute("""RELEASE job""")
+                results.append((e, None, time.perf_counter() - start))
+        try:
+            self.writer.commit()
+        except Exception as e:
+            self.writer.rollback()
+            return [(e, None, elapsed) for _, _, elapsed in results]
+        return results
+
+    async def add_user(self, email: str, auth_key: str) -> int:
+        return await self.write(Database.add_user, email, auth_key)
+
+    async def delete_user(self, uid: int) -> None:
+        await self.write(
+            Database.delete_user,
+            uid,
+            uid=uid,
+            invalidates=(("user", uid), ("vaults", uid)),
+        )
+
+    async def get_user(self, uid: int) -> Dict[str, Union[int, str, str]]:
+        return await self.cached(
+            ("user", uid), (("user", uid),), Database.get_user, uid, uid=uid
+        )
+
+    async def update_email(self, uid: int, new_email: str, new_auth_key: str) -> None:
+        await self.write(
+            Database.update_email,
+            uid,
+            new_email,
+            new_auth_key,
+            uid=uid,
+            invalidates=(("user", uid),),
+        )
+
+    async def update_auth_key(self, uid: int, auth_key: str) -> None:
+        await self.write(
+            Database.update_auth_key,
+            uid,
+            auth_key,
+            uid=uid,
+            invalidates=(("user", uid),),
+        )
+
+    async def get_id(self, email: str) -> int:
+        user = await self.get_login(email)
+        if user is None:
+            raise Exception(f"User with email: {email} not found")
+        return int(user["id"])
+
+    async def get_login(self, email: str) -> Optional[Dict[str, Union[int, str, str]]]:
+        self.sync_cache()
+        user = self.cache.get(("login", email))
+        if user is not MISSING:
+            return user
+        generation = self.cache.generation
+        user = await self.read(Database.get_login, email)
+        if user is not None:
+            self.cache.put(("login", email), user, (("user", user["id"]),), generation)
+        return user
+
+    async def get_auth_key(self, uid: int) -> str:
+        user = await self.get_user(uid)
+        return str(user["auth_key"])
+
+    async def add_vault(self, uid: int, name: str, key: str, data: str) -> int:
+        return await self.write(
+            Database.add_vault,
+            uid,
+            name,
+            key,
+            data,
+            uid=uid,
+            invalidates=(("vaults", uid),),
+        )
+
+    async def delete_vault(self, uid: int, name: str) -> None:
+        await self.write(
+            Database.delete_vault, uid, name, uid=uid, invalidates=(("vaults", uid),)
+        )
+
+    async def get_vaults(
+        self, uid: int
+    ) -> Optional[List[Dict[str, Union[int, int, str, str, str]]]]:
+        return await self.read(Database.get_vaults, uid, uid=uid)
+
+    async def list_vaults(
+        self, uid: int, limit: int, after: int = 0
+    ) -> Optional[List[Dict[str, Union[int, str, str, int, float, int]]]]:
+        return await self.cached(
+            ("vaults", uid, limit, after),
+            (("vaults", uid),),
+            Database.list_vaults,
+            uid,
+            limit,
+            after,
+            uid=uid,
+        )
+
+    async def get_vault(
+        self, uid: int, name: str
+    ) -> Dict[str, Union[int, int, str, str, str, int, float]]:
+        return await self.read(Database.get_vault, uid, name, uid=uid)
+
+    async def get_vault_info(
+        self, uid: int, name: str
+    ) -> Dict[str, Union[int, int, float]]:
+        return await self.cached(
+            ("vault_info", uid, name),
+            (("vaults", uid),),
+            Database.get_vault_info,
+            uid,
+            name,
+            uid=uid,
+        )
+
+    async def get_vault_with_records(self, uid: int, name: str) -> Dict[str, Any]:
+        return await self.read(Database.get_vault_with_records, uid, name, uid=uid)
+
+    async def get_vault_records(
+        self, vid: int
+    ) -> List[Dict[str, Union[int, bytes, None]]]:
+        return await self.read(Database.get_vault_records, vid)
+
+    async def sync_vault(
+        self, uid: int, name: str, version: int, records: List[Dict[str, Any]]
+    ) -> Dict[str, Union[int, int, float, int]]:
+        return await self.write(
+            Database.sync_vault,
+            uid,
+            name,
+            version,
+            records,
+            uid=uid,
+            invalidates=(("vaults", uid),),
+        )
+
+    async def get_vault_id(self, uid: int, name: str) -> int:
+        vault = await self.get_vault_info(uid, name)
+        return int(vault["id"])
+
+    async def update_vault_name(
+        self, uid: int, name: str, new_name: str
+    ) -> Optional[int]:
+        return await self.write(
+            Database.update_vault_name,
+            uid,
+            name,
+            new_name,
+            uid=uid,
+            invalidates=(("vaults", uid),),
+        )
+
+    async def update_vault_key(self, uid: int, name: str, key: str) -> Optional[int]:
+        return await self.write(
+            Database.update_vault_key,
+            uid,
+            name,
+            key,
+            uid=uid,
+            invalidates=(("vaults", uid),),
+        )
+
+    async def update_vault(
+        self, uid: int, name: str, data: str, version: Optional[int] = None
+    ) -> Dict[str, Union[int, int, float]]:
+        return await self.write(
+            Database.update_vault,
+            uid,
+            name,
+            data,
+            version,
+            uid=uid,
+            invalidates=(("vaults", uid),),
+        )
+
+    async def batch(self, uid: int, operations: List[Dict[str, Any]]) -> None:
+        await self.write(
+            Database.batch,
+            uid,
+            operations,
+            uid=uid,
+            invalidates=(("user", uid), ("vaults", uid)),
+        )
+
+    async def backup(self, backup_dir: Path) -> Dict[str, Any]:
+        def run() -> Dict[str, Any]:
+            database = Database(self.database_name, readonly=True, blobs=self.blobs)
+            try:
+                return database.backup(backup_dir)
+            finally:
+                database.close()
+
+        return await asyncio.to_thread(run)
+
+    async def snapshot(self, store: BackupStore) -> Dict[str, Any]:
+        def run() -> Dict[str, Any]:
+            database = Database(self.database_name, readonly=True, blobs=self.blobs)
+            try:
+                return store.snapshot(database.connection, self.blobs)
+            finally:
+                database.close()
+
+        return await asyncio.to_thread(run)
@@ -0,0 +1,240 @@
+import hashlib
+import os
+import sqlite3
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Union
+
+from . import codec
+from .blob_store import BlobStore
+from .migrations import schema_version
+
+Blob = Union[str, bytes, memoryview]
+
+
+class BackupStore:
+    def __init__(self, root: Path) -> None:
+        self.root: Path = Path(root)
+        self.blob_dir: Path = self.root / "blobs"
+        self.manifest_dir: Path = self.root / "manifests"
+        self.written: int = 0
+
+    def manifests(self) -> List[Path]:
+        if not self.manifest_dir.exists():
+            return []
+        return sorted(self.manifest_dir.glob("snapshot_*.manifest"))
+
+    def load(self, manifest: Path) -> Dict[str, Any]:
+        with open(manifest, "rb") as f:
+            return codec.decode(f.read())
+
+    def blob_path(self, digest: str) -> Path:
+        return self.blob_dir / digest[:2] / digest
+
+    def put_blob(self, data: Blob) -> List[Any]:
+        raw = data.encode() if isinstance(data, str) else data
+        digest = hashlib.sha256(raw).hexdigest()
+        path = self.blob_path(digest)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = path.with_suffix(".tmp")
+            with open(temp_path, "wb") as f:
+                f.write(raw)
+            os.replace(temp_path, path)
+            self.written += len(raw)
+        return [digest, isinstance(data, str)]
+
+    def get_blob(self, ref: Optional[List[Any]]) -> Optional[Union[str, bytes]]:
+        if ref is None:
+            return None
+        digest, text = ref
+        with open(self.blob_path(digest), "rb") as f:
+            raw = f.read()
+        if hashlib.sha256(raw).hexdigest() != digest:
+            raise Exception(f"Blob {digest} is corrupted")
+        return raw.decode() if text else raw
+
+    def snapshot(
+        self, connection: sqlite3.Connection, blobs: Optional[BlobStore] = None
+    ) -> Dict[str, Any]:
+        start = time.perf_counter()
+        self.written = 0
+        previous: Dict[str, Any] = {}
+        manifests = self.manifests()
+        if manifests:
+            previous = self.load(manifests[-1])["vaults"]
+        if connection.in_transaction:
+            raise Exception("Cannot snapshot database inside a transaction")
+        try:
+            connection.execute("BEGIN")
+            user_version = schema_version(connection)
+            schema = [
+                sql
+                for (sql,) in connection.execute(
+                    """SELECT sql FROM sqlite_master
+                    WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%'
+                    ORDER BY rowid"""
+                )
+            ]
+            tables = {}
+            for (name,) in connection.execute(
+                """SELECT name FROM sqlite_master
+                WHERE type = 'table' AND name NOT LIKE 'sqlite_%'
+                ORDER BY rowid"""
+            ).fetchall():
+                if name == "records":
+                    continue
+                columns = [
+                    column[1]
+                    for column in connection.execute(f"PRAGMA table_info({name})")
+                    if not (name == "vaults" and column[1] == "data")
+                ]
+                rows = connection.execute(
+                    f"SELECT {', '.join(columns)} FROM {name}"
+                ).fetchall()
+                tables[name] = {"columns": columns, "rows": [list(row) for row in rows]}
+            vaults = {}
+            for vid, version, modified in connection.execute(
+                "SELECT id, version, modified FROM vaults"
+            ).fetchall():
+                entry = previous.get(str(vid))
+                if (
+                    entry is None
+                    or entry["version"] != version
+                    or entry["modified"] != modified
+                ):
+                    entry = self.vault_entry(connection, blobs, vid, version, modified)
+                vaults[str(vid)] = entry
+        finally:
+            connection.rollback()
+        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S_%f")
+        manifest_path = self.manifest_dir / f"snapshot_{timestamp}.manifest"
+        manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        data = codec.dumps(
+            {
+                "created": time.time(),
+                "user_version": user_version,
+                "schema": schema,
+                "tables": tables,
+                "vaults": vaults,
+            }
+        )
+        temp_path = manifest_path.with_suffix(".tmp")
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, manifest_path)
+        return {
+            "path": manifest_path,
+            "size": self.written + len(data),
+            "duration": time.perf_counter() - start,
+        }
+
+    def vault_entry(
+        self,
+        connection: sqlite3.Connection,
+        blobs: Optional[BlobStore],
+        vid: int,
+        version: int,
+        modified: float,
+    ) -> Dict[str, Any]:
+        data, blob = connection.execute(
+            "SELECT data, blob FROM vaults WHERE id = ?", (vid,)
+        ).fetchone()
+        if blob is not None:
+            if blobs is None:
+                raise Exception("Vault data is in the blob store, but none is given")
+            data = blobs.read(blob)
+        records = connection.execute(
+            "SELECT rid, data FROM records WHERE vid = ? ORDER BY rid", (vid,)
+        ).fetchall()
+        return {
+            "version": version,
+            "modified": modified,
+            "data": self.put_blob(data) if data is not None else None,
+            "records": [
+                [rid, self.put_blob(record) if record is not None else None]
+                for rid, record in records
+            ],
+        }
+
+    def restore(self, manifest_path: Path, database_path: Path) -> None:
+        if database_path.exists():
+            raise Exception(f"Database {database_path} already exists")
+        manifest = self.load(manifest_path)
+        vaults = manifest["vaults"]
+        temp_path = database_path.with_suffix(".tmp")
+        temp_path.unlink(missing_ok=True)
+        connection = sqlite3.connect(temp_path)
+        try:
+            for sql in manifest["schema"]:
+                connection.execute(sql)
+            for name, table in manifest["tables"].items():
+                columns = list(table["columns"])
+                rows = table["rows"]
+                if name == "vaults":
+                    vid = columns.index("id")
+                    external = [
+                        index
+                        for index, column in enumerate(columns)
+                        if column in ("blob", "blob_size")
+                    ]
+                    columns.append("data")
+                    rows = [
+                        [
+                            None if index in external else value
+                            for index, value in enumerate(row)
+                        ]
+                        + [self.get_blob(vaults[str(row[vid])]["data"])]
+                        for row in rows
+                    ]
+                connection.executemany(
+                    f"""INSERT INTO {name}({', '.join(columns)})
+                    VALUES ({', '.join('?' * len(columns))})""",
+                    rows,
+                )
+            for vid, entry in vaults.items():
+                connection.executemany(
+                    "INSERT INTO records(vid, rid, data) VALUES (?, ?, ?)",
+                    [
+                        (int(vid), rid, self.get_blob(record))
+                        for rid, record in entry["records"]
+                    ],
+                )
+            connection.execute(
+                f"PRAGMA user_version = {manifest.get('user_version', 0)}"
+            )
+            connection.commit()
+            check = connection.execute("PRAGMA integrity_check").fetchone()[0]
+            if check != "ok":
+                raise Exception(f"Integrity check failed: {check}")
+        except Exception:
+            connection.close()
+            temp_path.unlink(missing_ok=True)
+            raise
+        connection.close()
+        os.replace(temp_path, database_path)
+
+    def prune(self, max_snapshots: int) -> int:
+        manifests = self.manifests()
+        if max_snapshots > 0 and len(manifests) > max_snapshots:
+            for manifest in manifests[:-max_snapshots]:
+                manifest.unlink()
+        return self.collect_garbage()
+
+    def collect_garbage(self) -> int:
+        referenced: Set[str] = set()
+        for manifest in self.manifests():
+            for entry in self.load(manifest)["vaults"].values():
+                if entry["data"] is not None:
+                    referenced.add(entry["data"][0])
+                for _, record in entry["records"]:
+                    if record is not None:
+                        referenced.add(record[0])
+        removed = 0
+        if self.blob_dir.exists():
+            for path in self.blob_dir.glob("*/*"):
+                if path.name not in referenced:
+                    path.unlink()
+                    removed += 1
+        return removed
@@ -0,0 +1,56 @@
+import hashlib
+import mmap
+import os
+import shutil
+from pathlib import Path
+from typing import Set, Union
+
+BLOB_THRESHOLD = 256 * 1024
+
+
+class BlobStore:
+    def __init__(self, root: Path) -> None:
+        self.root: Path = Path(root)
+
+    def path(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest
+
+    def put(self, data: Union[bytes, bytearray, memoryview]) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = path.with_suffix(".tmp")
+            with open(temp_path, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, path)
+        return digest
+
+    def read(self, digest: str) -> memoryview:
+        with open(self.path(digest), "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return memoryview(b"")
+            return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def delete(self, digest: str) -> None:
+        self.path(digest).unlink(missing_ok=True)
+
+    def export(self, digest: str, root: Path) -> None:
+        path = Path(root) / digest[:2] / digest
+        if path.exists():
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.link(self.path(digest), path)
+        except OSError:
+            shutil.copyfile(self.path(digest), path)
+
+    def collect_garbage(self, referenced: Set[str]) -> int:
+        removed = 0
+        for path in self.root.glob("*/*"):
+            if path.name not in referenced:
+                path.unlink()
+                removed += 1
+        return removed
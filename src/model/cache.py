@@ -0,0 +1,68 @@
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Set, Tuple
+
+MISSING = object()
+CACHE_SIZE = 10000
+CACHE_TTL = 60.0
+
+Entry = Tuple[float, Any, Tuple[Hashable, ...]]
+
+
+class Cache:
+    def __init__(self, max_size: int = CACHE_SIZE, ttl: float = CACHE_TTL) -> None:
+        self.max_size: int = max_size
+        self.ttl: float = ttl
+        self.entries: OrderedDict[Hashable, Entry] = OrderedDict()
+        self.tags: Dict[Hashable, Set[Hashable]] = {}
+        self.generation: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+
+    def get(self, key: Hashable) -> Any:
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] < time.monotonic():
+            self.discard(key)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return MISSING
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(
+        self, key: Hashable, value: Any, tags: Tuple[Hashable, ...], generation: int
+    ) -> None:
+        if self.max_size <= 0 or generation != self.generation:
+            return
+        self.discard(key)
+        self.entries[key] = (time.monotonic() + self.ttl, value, tags)
+        for tag in tags:
+            self.tags.setdefault(tag, set()).add(key)
+        while len(self.entries) > self.max_size:
+            self.discard(next(iter(self.entries)))
+            self.evictions += 1
+
+    def discard(self, key: Hashable) -> None:
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self.tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.tags[tag]
+
+    def invalidate(self, *tags: Hashable) -> None:
+        self.generation += 1
+        for tag in tags:
+            for key in list(self.tags.get(tag, ())):
+                self.discard(key)
+
+    def clear(self) -> None:
+        self.generation += 1
+        self.entries.clear()
+        self.tags.clear()
@@ -0,0 +1,212 @@
+import struct
+from typing import Any, Dict, List, Tuple, Union
+
+MAGIC = b"LJ"
+VERSION = 7
+BLOB_THRESHOLD = 16 * 1024
+MAX_MESSAGE_SIZE = 64 * 1024 * 1024
+
+HEADER = struct.Struct("!2sBBH")
+TAG = struct.Struct("!B")
+LENGTH = struct.Struct("!I")
+INT = struct.Struct("!q")
+FLOAT = struct.Struct("!d")
+
+NONE, FALSE, TRUE, INTEGER, REAL, STRING, BLOB, LIST, MAP = range(9)
+INLINE_KEY = 0xFF
+
+# Field names are sent as their index in this table. Append new names at the
+# end and bump VERSION, never reorder, so messages from older versions still
+# decode with the current table.
+FIELDS: Tuple[str, ...] = (
+    "command",
+    "id",
+    "status",
+    "error",
+    "uid",
+    "user",
+    "email",
+    "mkey",
+    "new_email",
+    "new_mkey",
+    "vault",
+    "vaults",
+    "vault_name",
+    "new_vault_name",
+    "vault_key",
+    "vault_data",
+    "data",
+    "name",
+    "key",
+    "auth_key",
+    "limit",
+    "after",
+    "next",
+    "size",
+    "modified",
+    "version",
+    "tag",
+    "if_none_match",
+    "records",
+    "compact",
+    "operations",
+    "token",
+    "retry_after",
+)
+FIELD_IDS: Dict[str, int] = {name: index for index, name in enumerate(FIELDS)}
+
+Frames = List[Union[bytes, memoryview]]
+
+
+class CodecError(Exception):
+    pass
+
+
+def encode(msg: Dict[str, Any]) -> Union[bytes, Frames]:
+    frames: Frames = []
+    buffer = bytearray(HEADER.pack(MAGIC, VERSION, 0, len(msg)))
+    try:
+        for key, value in msg.items():
+            _encode_key(buffer, key)
+            buffer = _encode_value(frames, buffer, value)
+    except struct.error as e:
+        raise CodecError(f"Cannot encode message: {e}")
+    if not frames:
+        return bytes(buffer)
+    if buffer:
+        frames.append(bytes(buffer))
+    return frames
+
+
+def dumps(msg: Dict[str, Any]) -> bytes:
+    message = encode(msg)
+    if isinstance(message, bytes):
+        return message
+    return b"".join(message)
+
+
+def decode(data: Union[bytes, bytearray, memoryview]) -> Dict[str, Any]:
+    view = memoryview(data)
+    try:
+        magic, version, _, count = HEADER.unpack_from(view, 0)
+    except struct.error:
+        raise CodecError("Message too short")
+    if magic != MAGIC:
+        raise CodecError("Invalid message header")
+    if not 1 <= version <= VERSION:
+        raise CodecError(f"Unsupported message version: {version}")
+    try:
+        msg, offset = _decode_map(view, HEADER.size, count)
+    except (struct.error, UnicodeDecodeError, RecursionError):
+        raise CodecError("Malformed message")
+    if offset != len(view):
+        raise CodecError("Trailing data after message")
+    return msg
+
+
+def _encode_key(buffer: bytearray, key: str) -> None:
+    field_id = FIELD_IDS.get(key)
+    if field_id is not None:
+        buffer += TAG.pack(field_id)
+        return
+    encoded = key.encode()
+    buffer += TAG.pack(INLINE_KEY) + LENGTH.pack(len(encoded)) + encoded
+
+
+def _encode_value(frames: Frames, buffer: bytearray, value: Any) -> bytearray:
+    if value is None:
+        buffer += TAG.pack(NONE)
+    elif value is False:
+        buffer += TAG.pack(FALSE)
+    elif value is True:
+        buffer += TAG.pack(TRUE)
+    elif isinstance(value, int):
+        buffer += TAG.pack(INTEGER) + INT.pack(value)
+    elif isinstance(value, float):
+        buffer += TAG.pack(REAL) + FLOAT.pack(value)
+    elif isinstance(value, str):
+        encoded = value.encode()
+        buffer += TAG.pack(STRING) + LENGTH.pack(len(encoded)) + encoded
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        view = memoryview(value).cast("B")
+        buffer += TAG.pack(BLOB) + LENGTH.pack(len(view))
+        if len(view) < BLOB_THRESHOLD:
+            buffer += view
+        else:
+            frames.append(bytes(buffer))
+            frames.append(view)
+            buffer = bytearray()
+    elif isinstance(value, (list, tuple)):
+        buffer += TAG.pack(LIST) + LENGTH.pack(len(value))
+        for item in value:
+            buffer = _encode_value(frames, buffer, item)
+    elif isinstance(value, dict):
+        buffer += TAG.pack(MAP) + LENGTH.pack(len(value))
+        for key, item in value.items():
+            _encode_key(buffer, key)
+            buffer = _encode_value(frames, buffer, item)
+    else:
+        raise CodecError(f"Cannot encode value of type {type(value).__name__}")
+    return buffer
+
+
+def _decode_map(view: memoryview, offset: int, count: int) -> Tuple[Dict, int]:
+    msg = {}
+    for _ in range(count):
+        key, offset = _decode_key(view, offset)
+        msg[key], offset = _decode_value(view, offset)
+    return msg, offset
+
+
+def _decode_key(view: memoryview, offset: int) -> Tuple[str, int]:
+    (field_id,) = TAG.unpack_from(view, offset)
+    offset += TAG.size
+    if field_id != INLINE_KEY:
+        if field_id >= len(FIELDS):
+            raise CodecError(f"Unknown field id: {field_id}")
+        return FIELDS[field_id], offset
+    return _decode_str(view, offset)
+
+
+def _decode_str(view: memoryview, offset: int) -> Tuple[str, int]:
+    data, offset = _decode_bytes(view, offset)
+    return data.decode(), offset
+
+
+def _decode_bytes(view: memoryview, offset: int) -> Tuple[bytes, int]:
+    (length,) = LENGTH.unpack_from(view, offset)
+    offset += LENGTH.size
+    if offset + length > len(view):
+        raise CodecError("Truncated message")
+    return bytes(view[offset : offset + length]), offset + length
+
+
+def _decode_value(view: memoryview, offset: int) -> Tuple[Any, int]:
+    (tag,) = TAG.unpack_from(view, offset)
+    offset += TAG.size
+    if tag == NONE:
+        return None, offset
+    if tag == FALSE:
+        return False, offset
+    if tag == TRUE:
+        return True, offset
+    if tag == INTEGER:
+        return INT.unpack_from(view, offset)[0], offset + INT.size
+    if tag == REAL:
+        return FLOAT.unpack_from(view, offset)[0], offset + FLOAT.size
+    if tag == STRING:
+        return _decode_str(view, offset)
+    if tag == BLOB:
+        return _decode_bytes(view, offset)
+    if tag == LIST:
+        (count,) = LENGTH.unpack_from(view, offset)
+        offset += LENGTH.size
+        items = []
+        for _ in range(count):
+            item, offset = _decode_value(view, offset)
+            items.append(item)
+        return items, offset
+    if tag == MAP:
+        (count,) = LENGTH.unpack_from(view, offset)
+        return _decode_map(view, offset + LENGTH.size, count)
+    raise CodecError(f"Unknown value tag: {tag}")
@@ -0,0 +1,41 @@
+import inspect
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, Type, Union
+
+Handler = Callable[..., Awaitable[None]]
+Schema = Dict[str, Union[Type, Tuple[Type, ...]]]
+
+
+class Command:
+    def __init__(
+        self, name: str, handler: Handler, cost: str, schema: Schema, public: bool
+    ) -> None:
+        self.name: str = name
+        self.handler: Handler = handler
+        self.cost: str = cost
+        self.schema: Schema = schema
+        self.public: bool = public
+        self.params = list(inspect.signature(handler).parameters)
+
+    def validate(self, msg: Dict) -> Optional[str]:
+        for field, kind in self.schema.items():
+            if field not in msg:
+                return f"Missing field {field}"
+            if not isinstance(msg[field], kind):
+                return f"Invalid field {field}"
+        return None
+
+    async def __call__(self, context: Dict[str, Any]) -> None:
+        await self.handler(*[context[param] for param in self.params])
+
+
+COMMANDS: Dict[str, Command] = {}
+
+
+def command(
+    name: str, cost: str, schema: Optional[Schema] = None, public: bool = False
+) -> Callable[[Handler], Handler]:
+    def register(handler: Handler) -> Handler:
+        COMMANDS[name] = Command(name, handler, cost, schema or {}, public)
+        return handler
+
+    return register
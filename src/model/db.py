@@ -1,55 +1,145 @@
+import os
 import sqlite3
+import time
 import traceback
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional, Union
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
+
+from .blob_store import BLOB_THRESHOLD, BlobStore
+from .migrations import migrate
+
+BACKUP_PAGES = 256
+STATEMENT_CACHE = 256
+BACKUP_PAUSE = 0.001
+
+
+class VersionConflict(Exception):
+    def __init__(self, version: int) -> None:
+        super().__init__(f"Vault has changed, current version: {version}")
+        self.version = version
 
 
 class Database:
-    def __init__(self, database_path: Path) -> None:
+    def __init__(
+        self,
+        database_path: Path,
+        readonly: bool = False,
+        blobs: Optional[BlobStore] = None,
+        blob_threshold: int = BLOB_THRESHOLD,
+    ) -> None:
         self.database_name: Path = database_path
-        self.connection: sqlite3.Connection = sqlite3.connect(self.database_name)
-        self.cursor: sqlite3.Cursor = self.connection.cursor()
-        self.cursor.execute(
-            """CREATE TABLE IF NOT EXISTS users(
-                id INTEGER PRIMARY KEY,
-                email TEXT NOT NULL UNIQUE,
-                auth_key BYTES NOT NULL
-            )"""
-        )
-
-        self.cursor.execute(
-            """CREATE TABLE IF NOT EXISTS vaults(
-                id INTEGER PRIMARY KEY,
-                uid INTEGER NOT NULL,
-                name TEXT NOT NULL,
-                key BYTES NOT NULL,
-                data BLOB,
-                FOREIGN KEY(uid) REFERENCES users(id)
-            )"""
+        self.blobs: Optional[BlobStore] = blobs
+        self.blob_threshold: int = blob_threshold
+        self.orphans: Set[str] = set()
+        if readonly:
+            self.connection: sqlite3.Connection = sqlite3.connect(
+                f"file:{self.database_name}?mode=ro",
+                uri=True,
+                check_same_thread=False,
+                cached_statements=STATEMENT_CACHE,
+            )
+            self.cursor: sqlite3.Cursor = self.connection.cursor()
+            return
+        self.connection = sqlite3.connect(
+            self.database_name,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE,
         )
+        self.cursor = self.connection.cursor()
+        self.cursor.execute("""PRAGMA journal_mode=WAL""")
+        migrate(self.cursor)
+        self.cursor.execute("""PRAGMA foreign_keys = ON""")
 
     def commit(self) -> None:
         self.connection.commit()
+        self.release_blobs()
 
     def rollback(self) -> None:
         self.connection.rollback()
+        self.orphans.clear()
+
+    def store_data(self, data: Any) -> Tuple[Any, Optional[str], Optional[int]]:
+        if (
+            self.blobs is None
+            or not isinstance(data, (bytes, bytearray, memoryview))
+            or len(data) < self.blob_threshold
+        ):
+            return data, None, None
+        return None, self.blobs.put(data), len(data)
+
+    def load_data(self, data: Any, blob: Optional[str]) -> Any:
+        if blob is None:
+            return data
+        if self.blobs is None:
+            raise Exception("Vault data is in the blob store, but none is configured")
+        return self.blobs.read(blob)
+
+    def orphan_blob(self, condition: str, params: Tuple[Any, ...]) -> None:
+        self.cursor.execute(
+            f"""SELECT blob FROM vaults WHERE blob IS NOT NULL AND {condition}""",
+            params,
+        )
+        self.orphans.update(blob for (blob,) in self.cursor.fetchall())
+
+    def release_blobs(self) -> None:
+        orphans, self.orphans = self.orphans, set()
+        if self.blobs is None:
+            return
+        for blob in orphans:
+            self.cursor.execute(
+                """SELECT 1 FROM vaults WHERE blob = ? LIMIT 1""", (blob,)
+            )
+            if self.cursor.fetchone() is None:
+                self.blobs.delete(blob)
+
+    def move_blobs(self, batch: int = 64) -> int:
+        if self.blobs is None:
+            raise Exception("No blob store configured")
+        moved = 0
+        while True:
+            self.cursor.execute(
+                """SELECT id, data FROM vaults
+                WHERE typeof(data) = 'blob' AND length(data) >= ? LIMIT ?""",
+                (self.blob_threshold, batch),
+            )
+            vaults = self.cursor.fetchall()
+            if not vaults:
+                return moved
+            for vid, data in vaults:
+                self.cursor.execute(
+                    """UPDATE vaults SET data = NULL, blob = ?, blob_size = ?
+                    WHERE id = ?""",
+                    (self.blobs.put(data), len(data), vid),
+                )
+            self.commit()
+            moved += len(vaults)
+
+    def collect_blobs(self) -> int:
+        if self.blobs is None:
+            raise Exception("No blob store configured")
+        self.cursor.execute("""SELECT blob FROM vaults WHERE blob IS NOT NULL""")
+        return self.blobs.collect_garbage({blob for (blob,) in self.cursor})
 
     def close(self) -> None:
+        self.cursor.close()
         self.connection.close()
 
-    def add_user(self, email: str, auth_key: str) -> None:
+    def add_user(self, email: str, auth_key: str) -> int:
         try:
             self.cursor.execute(
                 """INSERT INTO users(
                     email, auth_key
-                ) VALUES (?, ?)""",
+                ) VALUES (?, ?) RETURNING id""",
                 (email, auth_key),
             )
+            return self.cursor.fetchone()[0]
         except sqlite3.IntegrityError:
             raise Exception(f"User with email: {email} already exists")
 
     def delete_user(self, uid: int) -> None:
+        if self.blobs is not None:
+            self.orphan_blob("uid = ?", (uid,))
         try:
             self.cursor.execute("""DELETE FROM users WHERE id = ?""", (uid,))
         except sqlite3.IntegrityError:
@@ -88,6 +178,15 @@ class Database:
             raise Exception(f"User with email: {email} not found")
         return id[0]
 
+    def get_login(self, email: str) -> Optional[Dict[str, Union[int, str, str]]]:
+        self.cursor.execute(
+            """SELECT id, email, auth_key FROM users WHERE email = ?""", (email,)
+        )
+        user = self.cursor.fetchone()
+        if user is None:
+            return None
+        return {"id": user[0], "email": user[1], "auth_key": user[2]}
+
     def get_auth_key(self, uid: int) -> str:
         self.cursor.execute("""SELECT auth_key FROM users WHERE id = ?""", (uid,))
         auth_key = self.cursor.fetchone()
@@ -95,20 +194,26 @@ class Database:
             raise Exception(f"User with id: {uid} not found")
         return auth_key[0]
 
-    def add_vault(self, uid: int, name: str, key: str, data: str) -> None:
+    def add_vault(self, uid: int, name: str, key: str, data: Union[str, bytes]) -> int:
         if name.strip() == "":
             raise Exception("Vault name cannot be empty")
+        data, blob, blob_size = self.store_data(data)
         try:
             self.cursor.execute(
                 """INSERT INTO vaults(
-                    uid, name, key, data
-                ) VALUES (?, ?, ?, ?)""",
-                (uid, name, key, data),
+                    uid, name, key, data, blob, blob_size, modified
+                ) VALUES (?, ?, ?, ?, ?, ?, ?) RETURNING id""",
+                (uid, name, key, data, blob, blob_size, time.time()),
             )
-        except sqlite3.IntegrityError:
+            return self.cursor.fetchone()[0]
+        except sqlite3.IntegrityError as e:
+            if "FOREIGN KEY" in str(e):
+                raise Exception(f"User with id: {uid} does not exist")
             raise Exception(f"Vault with name: {name} already exists")
 
     def delete_vault(self, uid: int, name: str) -> None:
+        if self.blobs is not None:
+            self.orphan_blob("uid = ? AND name = ?", (uid, name))
         try:
             self.cursor.execute(
                 """DELETE FROM vaults WHERE uid = ? AND name = ?""", (uid, name)
@@ -119,7 +224,10 @@ class Database:
     def get_vaults(
         self, uid: int
     ) -> Optional[List[Dict[str, Union[int, int, str, str, str]]]]:
-        self.cursor.execute("""SELECT * FROM vaults WHERE uid = ?""", (uid,))
+        self.cursor.execute(
+            """SELECT id, uid, name, key, data, blob FROM vaults WHERE uid = ?""",
+            (uid,),
+        )
         vaults = self.cursor.fetchall()
         if len(vaults) <= 0:
             return None
@@ -129,16 +237,42 @@ class Database:
                 "uid": vault[1],
                 "name": vault[2],
                 "key": vault[3],
-                "data": vault[4],
+                "data": self.load_data(vault[4], vault[5]),
+            }
+            for vault in vaults
+        ]
+
+    def list_vaults(
+        self, uid: int, limit: int, after: int = 0
+    ) -> Optional[List[Dict[str, Union[int, str, str, int, float, int]]]]:
+        self.cursor.execute(
+            """SELECT id, name, key, COALESCE(length(data), blob_size), modified,
+            version FROM vaults
+            WHERE uid = ? AND id > ? ORDER BY id LIMIT ?""",
+            (uid, after, limit),
+        )
+        vaults = self.cursor.fetchall()
+        if len(vaults) <= 0:
+            return None
+        return [
+            {
+                "id": vault[0],
+                "name": vault[1],
+                "key": vault[2],
+                "size": vault[3],
+                "modified": vault[4],
+                "version": vault[5],
             }
             for vault in vaults
         ]
 
     def get_vault(
         self, uid: int, name: str
-    ) -> Dict[str, Union[int, int, str, str, str]]:
+    ) -> Dict[str, Union[int, int, str, str, str, int, float]]:
         self.cursor.execute(
-            """SELECT * FROM vaults WHERE uid = ? AND name = ?""", (uid, name)
+            """SELECT id, uid, name, key, data, version, modified, blob FROM vaults
+            WHERE uid = ? AND name = ?""",
+            (uid, name),
         )
         vault = self.cursor.fetchone()
         if vault is None:
@@ -148,9 +282,78 @@ class Database:
             "uid": vault[1],
             "name": vault[2],
             "key": vault[3],
-            "data": vault[4],
+            "data": self.load_data(vault[4], vault[7]),
+            "version": vault[5],
+            "modified": vault[6],
         }
 
+    def get_vault_with_records(self, uid: int, name: str) -> Dict[str, Any]:
+        snapshot = not self.connection.in_transaction
+        if snapshot:
+            self.cursor.execute("""BEGIN""")
+        try:
+            vault: Dict[str, Any] = self.get_vault(uid, name)
+            vault["records"] = self.get_vault_records(int(vault["id"]))
+        finally:
+            if snapshot:
+                self.commit()
+        return vault
+
+    def get_vault_records(self, vid: int) -> List[Dict[str, Union[int, bytes, None]]]:
+        self.cursor.execute(
+            """SELECT rid, data FROM records WHERE vid = ? ORDER BY rid""", (vid,)
+        )
+        return [{"id": record[0], "data": record[1]} for record in self.cursor]
+
+    def conflict(self, uid: int, name: str) -> Exception:
+        self.cursor.execute(
+            """SELECT version FROM vaults WHERE uid = ? AND name = ?""", (uid, name)
+        )
+        vault = self.cursor.fetchone()
+        if vault is None:
+            return Exception(f"Vault with name: {name} not found")
+        return VersionConflict(vault[0])
+
+    def bump_version(
+        self, uid: int, name: str, version: Optional[int] = None
+    ) -> Dict[str, Union[int, int, float]]:
+        self.cursor.execute(
+            """UPDATE vaults SET version = version + 1, modified = ?1
+            WHERE uid = ?2 AND name = ?3 AND (?4 IS NULL OR version = ?4)
+            RETURNING id, version, modified""",
+            (time.time(), uid, name, version),
+        )
+        vault = self.cursor.fetchone()
+        if vault is None:
+            raise self.conflict(uid, name)
+        return {"id": vault[0], "version": vault[1], "modified": vault[2]}
+
+    def sync_vault(
+        self, uid: int, name: str, version: int, records: List[Dict[str, Any]]
+    ) -> Dict[str, Union[int, int, float, int]]:
+        vault: Dict[str, Union[int, int, float, int]] = dict(
+            self.bump_version(uid, name, version)
+        )
+        self.cursor.executemany(
+            """INSERT OR REPLACE INTO records(vid, rid, data) VALUES (?, ?, ?)""",
+            [(vault["id"], record["id"], record["data"]) for record in records],
+        )
+        self.cursor.execute(
+            """SELECT COUNT(*) FROM records WHERE vid = ?""", (vault["id"],)
+        )
+        vault["records"] = self.cursor.fetchone()[0]
+        return vault
+
+    def get_vault_info(self, uid: int, name: str) -> Dict[str, Union[int, int, float]]:
+        self.cursor.execute(
+            """SELECT id, version, modified FROM vaults WHERE uid = ? AND name = ?""",
+            (uid, name),
+        )
+        vault = self.cursor.fetchone()
+        if vault is None:
+            raise Exception(f"Vault with name: {name} not found")
+        return {"id": vault[0], "version": vault[1], "modified": vault[2]}
+
     def get_vault_key(self, uid: int, name: str) -> str:
         vault = self.get_vault(uid, name)
         return str(vault["key"])
@@ -160,55 +363,139 @@ class Database:
         return str(vault["data"])
 
     def get_vault_id(self, uid: int, name: str) -> int:
-        vault = self.get_vault(uid, name)
+        vault = self.get_vault_info(uid, name)
         return int(vault["id"])
 
-    def update_vault_name(self, uid: int, name: str, new_name: str) -> None:
+    def update_vault_name(self, uid: int, name: str, new_name: str) -> Optional[int]:
         if new_name.strip() == "":
             raise Exception("Vault name cannot be empty")
-        if name == new_name:
-            return
-        self.get_vault(uid, name)
         try:
-            self.get_vault(uid, new_name)
+            self.cursor.execute(
+                """UPDATE vaults SET name = ? WHERE uid = ? AND name = ? RETURNING id""",
+                (new_name, uid, name),
+            )
+        except sqlite3.IntegrityError:
             raise Exception(f"Vault with name: {new_name} already exists")
-        except Exception:
-            pass
-        self.cursor.execute(
-            """UPDATE vaults SET name = ? WHERE uid = ? AND name = ?""",
-            (new_name, uid, name),
-        )
+        vault = self.cursor.fetchone()
+        return None if vault is None else vault[0]
 
-    def update_vault_key(self, uid: int, name: str, key: str) -> None:
+    def update_vault_key(self, uid: int, name: str, key: str) -> Optional[int]:
         if key.strip() == "":
             raise Exception("Vault key cannot be empty")
-        if self.get_vault_key(uid, name) == key:
-            return
-        self.get_vault(uid, name)
         self.cursor.execute(
-            """UPDATE vaults SET key = ? WHERE uid = ? AND name = ?""", (key, uid, name)
+            """UPDATE vaults SET key = ?1, version = version + 1, modified = ?2
+            WHERE uid = ?3 AND name = ?4 AND key IS NOT ?1 RETURNING id""",
+            (key, time.time(), uid, name),
+        )
+        vault = self.cursor.fetchone()
+        if vault is not None:
+            return vault[0]
+        self.cursor.execute(
+            """SELECT id FROM vaults WHERE uid = ? AND name = ?""", (uid, name)
         )
+        vault = self.cursor.fetchone()
+        return None if vault is None else vault[0]
 
-    def update_vault(self, uid: int, name: str, data: str) -> None:
+    def update_vault(
+        self,
+        uid: int,
+        name: str,
+        data: Union[str, bytes],
+        version: Optional[int] = None,
+    ) -> Dict[str, Union[int, int, float]]:
         if data.strip() == "":
             raise Exception("Vault data cannot be empty")
-        if self.get_vault_data(uid, name) == data:
-            return
-        self.get_vault(uid, name)
+        if self.blobs is not None:
+            self.orphan_blob("uid = ? AND name = ?", (uid, name))
+        data, blob, blob_size = self.store_data(data)
         self.cursor.execute(
-            """UPDATE vaults SET data = ? WHERE uid = ? AND name = ?""",
-            (data, uid, name),
+            """UPDATE vaults SET data = ?1, blob = ?2, blob_size = ?3,
+            version = version + 1, modified = ?4
+            WHERE uid = ?5 AND name = ?6 AND (?7 IS NULL OR version = ?7)
+            RETURNING id, version, modified""",
+            (data, blob, blob_size, time.time(), uid, name, version),
         )
+        vault = self.cursor.fetchone()
+        if vault is None:
+            if blob is not None:
+                self.orphans.add(blob)
+            raise self.conflict(uid, name)
+        self.cursor.execute("""DELETE FROM records WHERE vid = ?""", (vault[0],))
+        return {"id": vault[0], "version": vault[1], "modified": vault[2]}
 
-    async def backup(self, backup_dir: Path) -> Path:
+    def batch(self, uid: int, operations: List[Dict[str, Any]]) -> None:
+        for operation in operations:
+            match operation["command"]:
+                case "update_vault_key":
+                    if (
+                        self.update_vault_key(
+                            uid, operation["vault_name"], operation["vault_key"]
+                        )
+                        is None
+                    ):
+                        raise Exception(
+                            f"Vault with name: {operation['vault_name']} not found"
+                        )
+                case "update_vault_name":
+                    if (
+                        self.update_vault_name(
+                            uid, operation["vault_name"], operation["new_vault_name"]
+                        )
+                        is None
+                    ):
+                        raise Exception(
+                            f"Vault with name: {operation['vault_name']} not found"
+                        )
+                case "delete_vault":
+                    self.delete_vault(uid, operation["vault_name"])
+                case "change_email":
+                    self.update_email(
+                        uid, operation["new_email"], operation["auth_key"]
+                    )
+                case "change_auth_key":
+                    self.update_auth_key(uid, operation["auth_key"])
+                case command:
+                    raise Exception(f"Invalid batch command: {command}")
+
+    def backup(
+        self, backup_dir: Path, pages: int = BACKUP_PAGES, pause: float = BACKUP_PAUSE
+    ) -> Dict[str, Any]:
+        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        backup_name = Path(f"{backup_dir}/backup_{timestamp}.db")
+        temp_name = backup_name.with_suffix(".tmp")
+        start = time.perf_counter()
+        if self.connection.in_transaction:
+            raise Exception("Cannot backup database inside a transaction")
         try:
-            timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-            backup_name = Path(f"{backup_dir}/backup_{timestamp}.db")
-            backup_conn = sqlite3.connect(backup_name)
-            self.connection.backup(backup_conn)
-            backup_conn.commit()
-            backup_conn.close()
-            return backup_name
+            self.connection.execute("BEGIN")
+            self.connection.execute("SELECT 1 FROM sqlite_master LIMIT 1")
+            if self.blobs is not None:
+                self.cursor.execute(
+                    """SELECT blob FROM vaults WHERE blob IS NOT NULL"""
+                )
+                for (blob,) in self.cursor.fetchall():
+                    self.blobs.export(blob, Path(backup_dir) / "vault_blobs")
+            backup_conn = sqlite3.connect(temp_name)
+            try:
+                self.connection.backup(
+                    backup_conn,
+                    pages=pages,
+                    progress=lambda status, remaining, total: time.sleep(pause),
+                )
+                check = backup_conn.execute("PRAGMA integrity_check").fetchone()[0]
+            finally:
+                backup_conn.close()
+            if check != "ok":
+                raise Exception(f"Integrity check failed: {check}")
+            os.replace(temp_name, backup_name)
+            return {
+                "path": backup_name,
+                "size": backup_name.stat().st_size,
+                "duration": time.perf_counter() - start,
+            }
         except Exception as e:
+            temp_name.unlink(missing_ok=True)
             traceback.print_exc()
             raise Exception(f"Failed to backup database: {e}")
+        finally:
+            self.connection.rollback()
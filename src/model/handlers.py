@@ -1,235 +1,445 @@
 import logging
-import pickle
-from typing import Dict
+from typing import Any, Dict
 
-from argon2 import PasswordHasher
 from argon2.exceptions import VerifyMismatchError
 from websockets import ServerConnection
 
-from .db import Database
+from . import codec, metrics
+from .async_db import AsyncDatabase
+from .commands import command
+from .db import VersionConflict
+from .hasher import Hasher
+from .scheduler import HASH, READ, WRITE
+from .session import InvalidSession, Sessions
 
+logger = logging.getLogger("ljk.handlers")
+PAGE_SIZE = 100
+COMPACT_RECORDS = 256
+BATCH_COMMANDS = {
+    "update_vault_key",
+    "update_vault_name",
+    "delete_vault",
+    "change_email",
+    "change_auth_key",
+}
+HASHED_COMMANDS = {"change_email", "change_auth_key"}
 
+
+def vault_tag(vault: Dict) -> str:
+    return f"{vault['id']}-{vault['version']}-{vault['modified']!r}"
+
+
+def check_operation(operation: Any) -> None:
+    if not isinstance(operation, dict):
+        raise Exception("Batch operations must be objects")
+    if operation.get("command") not in BATCH_COMMANDS:
+        raise Exception(f"Invalid batch command: {operation.get('command')}")
+    if "auth_key" in operation:
+        raise Exception("Batch operations may not set auth_key")
+    if operation["command"] in HASHED_COMMANDS:
+        if not isinstance(operation.get("new_mkey"), (str, bytes)):
+            raise Exception(f"{operation['command']} requires new_mkey")
+    elif "new_mkey" in operation:
+        raise Exception(f"{operation['command']} does not take new_mkey")
+
+
+async def respond(ws: ServerConnection, msg: Dict, response: Dict[str, Any]) -> None:
+    response["id"] = msg.get("id")
+    if "renewed_token" in msg:
+        response["token"] = msg["renewed_token"]
+    data = codec.encode(response)
+    size = len(data) if isinstance(data, bytes) else sum(map(len, data))
+    metrics.record_response(response["status"], size)
+    await ws.send(data)
+
+
+@command("register", HASH, {"user": dict}, public=True)
 async def register_user(
-    ws: ServerConnection, msg: Dict, database: Database, rhost: str, rport: int
+    ws: ServerConnection,
+    msg: Dict,
+    database: AsyncDatabase,
+    hasher: Hasher,
+    rhost: str,
+    rport: int,
 ) -> None:
     user = msg["user"]
     try:
-        auth_key = PasswordHasher().hash(user["mkey"])
-        database.add_user(user["email"], auth_key)
-        uid = database.get_id(user["email"])
-        logging.info(f"{rhost}:{rport} registered user:{uid}")
-        database.commit()
-        response = pickle.dumps({"status": "success"})
+        auth_key = await hasher.hash(user["mkey"])
+        uid = await database.add_user(user["email"], auth_key)
+        logger.info("%s:%s registered user:%s", rhost, rport, uid)
+        response = {"status": "success"}
     except Exception as e:
-        logging.error(f"Error: {e}\nRolling back users database")
-        database.rollback()
-        response = pickle.dumps({"status": "failed", "error": str(e)})
-    await ws.send(response)
+        logger.error("Error: %s\nRolling back users database", e)
+        response = {"status": "failed", "error": str(e)}
+    await respond(ws, msg, response)
 
 
+@command("auth", HASH, {"email": str, "mkey": (str, bytes)}, public=True)
 async def auth(
-    ws: ServerConnection, msg: Dict, database: Database, rhost: str, rport: int
+    ws: ServerConnection,
+    msg: Dict,
+    database: AsyncDatabase,
+    hasher: Hasher,
+    sessions: Sessions,
+    binding: str,
+    rhost: str,
+    rport: int,
 ) -> None:
+    response: Dict[str, Any]
     try:
-        uid = database.get_id(msg["email"])
-        auth_key = database.get_auth_key(uid)
-        if PasswordHasher().verify(auth_key, msg["mkey"]):
-            user = database.get_user(uid)
-            logging.info(f"{rhost}:{rport} authenticated user:{uid}")
-            response = pickle.dumps({"status": "success", "user": user})
+        user = await database.get_login(msg["email"])
+        if user is None:
+            logger.error("%s:%s unknown email", rhost, rport)
+            response = {
+                "status": "failed",
+                "error": f"User with email: {msg['email']} not found",
+            }
+        elif await hasher.verify(str(user["auth_key"]), msg["mkey"]):
+            logger.info("%s:%s authenticated user:%s", rhost, rport, user["id"])
+            token = sessions.issue(int(user["id"]), binding)
+            response = {"status": "success", "user": user, "token": token}
         else:
-            raise VerifyMismatchError
-    except VerifyMismatchError:
-        logging.error(f"{rhost}:{rport} invalid password for user:{uid}")
-        response = pickle.dumps({"status": "failed", "error": "Invalid password"})
+            logger.error("%s:%s invalid password for user:%s", rhost, rport, user["id"])
+            response = {"status": "failed", "error": "Invalid password"}
     except Exception as e:
-        logging.error(f"Error: {e}")
-        response = pickle.dumps({"status": "failed", "error": str(e)})
-    await ws.send(response)
+        logger.error("Error: %s", e)
+        response = {"status": "failed", "error": str(e)}
+    await respond(ws, msg, response)
 
 
+@command("change_email", HASH, {"new_email": str, "new_mkey": (str, bytes)})
 async def change_email(
-    ws: ServerConnection, msg: Dict, database: Database, rhost: str, rport: int
+    ws: ServerConnection,
+    msg: Dict,
+    database: AsyncDatabase,
+    hasher: Hasher,
+    rhost: str,
+    rport: int,
 ) -> None:
     try:
-        new_auth_key = PasswordHasher().hash(msg["new_mkey"])
-        database.update_email(msg["uid"], msg["new_email"], new_auth_key)
-        database.commit()
-        logging.info(f"{rhost}:{rport} changed email for user:{msg['uid']}")
-        response = pickle.dumps({"status": "success"})
-        await ws.send(response)
+        new_auth_key = await hasher.hash(msg["new_mkey"])
+        await database.update_email(msg["uid"], msg["new_email"], new_auth_key)
+        logger.info("%s:%s changed email for user:%s", rhost, rport, msg["uid"])
+        response = {"status": "success"}
+        await respond(ws, msg, response)
     except Exception as e:
-        logging.error(f"Error: {e}\nRolling back database")
-        database.rollback()
-        response = pickle.dumps({"status": "failed", "error": str(e)})
-        await ws.send(response)
+        logger.error("Error: %s\nRolling back database", e)
+        response = {"status": "failed", "error": str(e)}
+        await respond(ws, msg, response)
 
 
+@command("change_auth_key", HASH, {"new_mkey": (str, bytes)})
 async def change_auth_key(
-    ws: ServerConnection, msg: Dict, database: Database, rhost: str, rport: int
+    ws: ServerConnection,
+    msg: Dict,
+    database: AsyncDatabase,
+    hasher: Hasher,
+    rhost: str,
+    rport: int,
 ) -> None:
     try:
-        new_auth_key = PasswordHasher().hash(msg["new_mkey"])
-        database.update_auth_key(msg["uid"], new_auth_key)
-        database.commit()
-        logging.info(f"{rhost}:{rport} changed auth key for user:{msg['uid']}")
-        response = pickle.dumps({"status": "success"})
-        await ws.send(response)
+        new_auth_key = await hasher.hash(msg["new_mkey"])
+        await database.update_auth_key(msg["uid"], new_auth_key)
+        logger.info("%s:%s changed auth key for user:%s", rhost, rport, msg["uid"])
+        response = {"status": "success"}
+        await respond(ws, msg, response)
     except Exception as e:
-        logging.error(f"Error: {e}\nRolling back database")
-        database.rollback()
-        response = pickle.dumps({"status": "failed", "error": str(e)})
-        await ws.send(response)
+        logger.error("Error: %s\nRolling back database", e)
+        response = {"status": "failed", "error": str(e)}
+        await respond(ws, msg, response)
 
 
+@command("batch", HASH, {"operations": list})
+async def batch(
+    ws: ServerConnection,
+    msg: Dict,
+    database: AsyncDatabase,
+    hasher: Hasher,
+    rhost: str,
+    rport: int,
+) -> None:
+    try:
+        for operation in msg["operations"]:
+            check_operation(operation)
+        operations = []
+        for operation in msg["operations"]:
+            if operation["command"] in HASHED_COMMANDS:
+                auth_key = await hasher.hash(operation["new_mkey"])
+                operation = {**operation, "auth_key": auth_key}
+            operations.append(operation)
+        await database.batch(msg["uid"], operations)
+        logger.info(
+            "%s:%s applied %s operations for user:%s",
+            rhost,
+            rport,
+            len(operations),
+            msg["uid"],
+        )
+        response = {"status": "success"}
+    except Exception as e:
+        logger.error("Error: %s\nRolling back database", e)
+        response = {"status": "failed", "error": str(e)}
+    await respond(ws, msg, response)
+
+
+@command("get_vaults", READ)
 async def get_vaults(
-    ws: ServerConnection, msg: Dict, database: Database, rhost: str, rport: int
+    ws: ServerConnection, msg: Dict, database: AsyncDatabase, rhost: str, rport: int
 ) -> None:
     try:
-        vaults = database.get_vaults(msg["uid"])
-        response = pickle.dumps({"status": "success", "vaults": vaults})
-        logging.info(f"{rhost}:{rport} received vaults for user:{msg['uid']}")
+        limit = max(1, min(int(msg.get("limit", PAGE_SIZE)), PAGE_SIZE))
+        vaults = await database.list_vaults(msg["uid"], limit, msg.get("after", 0))
+        next_page = None
+        if vaults is not None and len(vaults) == limit:
+            next_page = vaults[-1]["id"]
+        response = {"status": "success", "vaults": vaults, "next": next_page}
+        logger.info("%s:%s received vaults for user:%s", rhost, rport, msg["uid"])
     except Exception as e:
-        logging.error(f"Error: {e}")
-        response = pickle.dumps({"status": "failed", "error": str(e)})
-    await ws.send(response)
+        logger.error("Error: %s", e)
+        response = {"status": "failed", "error": str(e)}
+    await respond(ws, msg, response)
 
 
+@command("get_vault", READ, {"vault_name": str})
 async def get_vault(
-    ws: ServerConnection, msg: Dict, database: Database, rhost: str, rport: int
+    ws: ServerConnection, msg: Dict, database: AsyncDatabase, rhost: str, rport: int
 ) -> None:
     try:
-        vault = database.get_vault(msg["uid"], msg["vault_name"])
-        response = pickle.dumps({"status": "success", "vault": vault})
-        await ws.send(response)
-        logging.info(f"{rhost}:{rport} received vault:{vault['id']}")
+        if msg.get("if_none_match") is not None:
+            info = await database.get_vault_info(msg["uid"], msg["vault_name"])
+            tag = vault_tag(info)
+            if tag == msg["if_none_match"]:
+                response: Dict[str, Any] = {"status": "not_modified", "tag": tag}
+                await respond(ws, msg, response)
+                logger.info("%s:%s vault:%s not modified", rhost, rport, info["id"])
+                return
+        vault = await database.get_vault_with_records(msg["uid"], msg["vault_name"])
+        vault["tag"] = vault_tag(vault)
+        response = {"status": "success", "vault": vault}
+        await respond(ws, msg, response)
+        logger.info("%s:%s received vault:%s", rhost, rport, vault["id"])
     except Exception as e:
-        logging.error(f"Error: {e}")
-        response = pickle.dumps({"status": "failed", "error": str(e)})
-        await ws.send(response)
-        await ws.close()
+        logger.error("Error: %s", e)
+        response = {"status": "failed", "error": str(e)}
+        await respond(ws, msg, response)
 
 
+@command(
+    "create_vault",
+    WRITE,
+    {"vault_name": str, "vault_key": (str, bytes), "vault_data": (str, bytes)},
+)
 async def create_vault(
-    ws: ServerConnection, msg: Dict, database: Database, rhost: str, rport: int
+    ws: ServerConnection, msg: Dict, database: AsyncDatabase, rhost: str, rport: int
 ) -> None:
     try:
-        database.add_vault(
+        vault_id = await database.add_vault(
             msg["uid"], msg["vault_name"], msg["vault_key"], msg["vault_data"]
         )
-        vault_id = database.get_vault_id(msg["uid"], msg["vault_name"])
-        logging.info(f"{rhost}:{rport} created vault:{vault_id}")
-        database.commit()
-        response = pickle.dumps({"status": "success"})
-        await ws.send(response)
+        logger.info("%s:%s created vault:%s", rhost, rport, vault_id)
+        response = {"status": "success"}
+        await respond(ws, msg, response)
     except Exception as e:
-        logging.error(f"Error: {e}\nRolling back database")
-        database.rollback()
-        response = pickle.dumps({"status": "failed", "error": str(e)})
-        await ws.send(response)
+        logger.error("Error: %s\nRolling back database", e)
+        response = {"status": "failed", "error": str(e)}
+        await respond(ws, msg, response)
 
 
+@command("update_vault_key", WRITE, {"vault_name": str, "vault_key": (str, bytes)})
 async def update_vault_key(
-    ws: ServerConnection, msg: Dict, database: Database, rhost: str, rport: int
+    ws: ServerConnection, msg: Dict, database: AsyncDatabase, rhost: str, rport: int
 ) -> None:
     try:
-        database.update_vault_key(msg["uid"], msg["vault_name"], msg["vault_key"])
-        database.commit()
-        vault_id = database.get_vault_id(msg["uid"], msg["vault_name"])
-        logging.info(f"{rhost}:{rport} updated vault key for vault:{vault_id}")
-        response = pickle.dumps({"status": "success"})
-        await ws.send(response)
+        vault_id = await database.update_vault_key(
+            msg["uid"], msg["vault_name"], msg["vault_key"]
+        )
+        if vault_id is None:
+            logger.error("%s:%s vault not found", rhost, rport)
+            response = {
+                "status": "failed",
+                "error": f"Vault with name: {msg['vault_name']} not found",
+            }
+        else:
+            logger.info("%s:%s updated vault key for vault:%s", rhost, rport, vault_id)
+            response = {"status": "success"}
+        await respond(ws, msg, response)
     except Exception as e:
-        logging.error(f"Error: {e}\nRolling back database")
-        database.rollback()
-        response = pickle.dumps({"status": "failed", "error": str(e)})
-        await ws.send(response)
+        logger.error("Error: %s\nRolling back database", e)
+        response = {"status": "failed", "error": str(e)}
+        await respond(ws, msg, response)
 
 
+@command("delete_vault", WRITE, {"vault_name": str})
 async def delete_vault(
-    ws: ServerConnection, msg: Dict, database: Database, rhost: str, rport: int
+    ws: ServerConnection, msg: Dict, database: AsyncDatabase, rhost: str, rport: int
 ) -> None:
     try:
-        database.delete_vault(msg["uid"], msg["vault_name"])
-        database.commit()
-        logging.info(f"{rhost}:{rport} deleted vault:{msg['vault_name']}")
-        response = pickle.dumps({"status": "success"})
-        await ws.send(response)
+        await database.delete_vault(msg["uid"], msg["vault_name"])
+        logger.info("%s:%s deleted vault:%s", rhost, rport, msg["vault_name"])
+        response = {"status": "success"}
+        await respond(ws, msg, response)
     except Exception as e:
-        logging.error(f"Error: {e}\nRolling back database")
-        database.rollback()
-        response = pickle.dumps({"status": "failed", "error": str(e)})
-        await ws.send(response)
+        logger.error("Error: %s\nRolling back database", e)
+        response = {"status": "failed", "error": str(e)}
+        await respond(ws, msg, response)
 
 
 async def invalid_command(
     ws: ServerConnection, msg: Dict, rhost: str, rport: int
 ) -> None:
-    logging.error(f"{rhost}:{rport} sent invalid command {msg['command']}")
-    response = pickle.dumps(
-        {
-            "status": "failed",
-            "error": f"{rhost}:{rport} sent invalid command {msg['command']}",
-        }
-    )
-    await ws.send(response)
+    logger.error("%s:%s sent invalid command %s", rhost, rport, msg["command"])
+    response = {
+        "status": "failed",
+        "error": f"{rhost}:{rport} sent invalid command {msg['command']}",
+    }
+    await respond(ws, msg, response)
     await ws.close()
 
 
+async def invalid_request(
+    ws: ServerConnection, msg: Dict, error: str, rhost: str, rport: int
+) -> None:
+    logger.error("%s:%s sent invalid %s: %s", rhost, rport, msg["command"], error)
+    response = {"status": "failed", "error": error}
+    await respond(ws, msg, response)
+
+
+async def throttled(
+    ws: ServerConnection, msg: Dict, retry_after: float, rhost: str, rport: int
+) -> None:
+    logger.error("%s:%s throttled %s", rhost, rport, msg["command"])
+    response = {
+        "status": "retry",
+        "error": "Too many requests, try again later",
+        "retry_after": retry_after,
+    }
+    await respond(ws, msg, response)
+
+
+async def internal_error(
+    ws: ServerConnection, msg: Dict, error: Exception, rhost: str, rport: int
+) -> None:
+    logger.error("%s:%s %s failed: %s", rhost, rport, msg["command"], error)
+    response = {"status": "failed", "error": str(error)}
+    await respond(ws, msg, response)
+
+
+async def unauthorized(
+    ws: ServerConnection, msg: Dict, error: InvalidSession, rhost: str, rport: int
+) -> None:
+    logger.error("%s:%s unauthorized %s: %s", rhost, rport, msg["command"], error)
+    response = {"status": "unauthorized", "error": str(error)}
+    await respond(ws, msg, response)
+
+
+@command("save_vault", WRITE, {"vault_name": str, "data": (str, bytes)})
 async def save_vault(
-    ws: ServerConnection, msg: Dict, database: Database, rhost: str, rport: int
+    ws: ServerConnection, msg: Dict, database: AsyncDatabase, rhost: str, rport: int
 ) -> None:
     try:
-        database.update_vault(
+        vault = await database.update_vault(
             msg["uid"],
             msg["vault_name"],
             msg["data"],
+            msg.get("version"),
         )
-        database.commit()
-        vault_id = database.get_vault_id(msg["uid"], msg["vault_name"])
-        logging.info(f"{rhost}:{rport} saved vault:{vault_id}")
-        response = pickle.dumps({"status": "success"})
-        await ws.send(response)
+        logger.info("%s:%s saved vault:%s", rhost, rport, vault["id"])
+        response = {
+            "status": "success",
+            "version": vault["version"],
+            "tag": vault_tag(vault),
+        }
+        await respond(ws, msg, response)
+    except VersionConflict as e:
+        logger.error("%s:%s save conflict: %s", rhost, rport, e)
+        response = {"status": "conflict", "error": str(e), "version": e.version}
+        await respond(ws, msg, response)
     except Exception as e:
-        logging.error(f"Error: {e}\nRolling back database")
-        database.rollback()
-        response = pickle.dumps({"status": "failed", "error": str(e)})
-        await ws.send(response)
+        logger.error("Error: %s\nRolling back database", e)
+        response = {"status": "failed", "error": str(e)}
+        await respond(ws, msg, response)
 
 
+@command("sync_vault", WRITE, {"vault_name": str, "version": int, "records": list})
+async def sync_vault(
+    ws: ServerConnection, msg: Dict, database: AsyncDatabase, rhost: str, rport: int
+) -> None:
+    try:
+        vault = await database.sync_vault(
+            msg["uid"], msg["vault_name"], msg["version"], msg["records"]
+        )
+        logger.info(
+            "%s:%s synced %s records to vault:%s",
+            rhost,
+            rport,
+            len(msg["records"]),
+            vault["id"],
+        )
+        response = {
+            "status": "success",
+            "version": vault["version"],
+            "tag": vault_tag(vault),
+            "compact": vault["records"] >= COMPACT_RECORDS,
+        }
+        await respond(ws, msg, response)
+    except VersionConflict as e:
+        logger.error("%s:%s sync conflict: %s", rhost, rport, e)
+        response = {"status": "conflict", "error": str(e), "version": e.version}
+        await respond(ws, msg, response)
+    except Exception as e:
+        logger.error("Error: %s", e)
+        response = {"status": "failed", "error": str(e)}
+        await respond(ws, msg, response)
+
+
+@command("delete_account", HASH, {"mkey": (str, bytes)})
 async def delete_account(
-    ws: ServerConnection, msg: Dict, database: Database, rhost: str, rport: int
+    ws: ServerConnection,
+    msg: Dict,
+    database: AsyncDatabase,
+    hasher: Hasher,
+    sessions: Sessions,
+    rhost: str,
+    rport: int,
 ) -> None:
     try:
-        if not PasswordHasher().verify(database.get_auth_key(msg["uid"]), msg["mkey"]):
+        auth_key = await database.get_auth_key(msg["uid"])
+        if not await hasher.verify(auth_key, msg["mkey"]):
             raise VerifyMismatchError
-        database.delete_user(msg["uid"])
-        database.commit()
-        logging.info(f"{rhost}:{rport} deleted user:{msg['uid']}")
-        response = pickle.dumps({"status": "success"})
-        await ws.send(response)
+        await database.delete_user(msg["uid"])
+        sessions.revoke(msg["uid"])
+        logger.info("%s:%s deleted user:%s", rhost, rport, msg["uid"])
+        response = {"status": "success"}
+        await respond(ws, msg, response)
     except VerifyMismatchError:
-        logging.error(f"{rhost}:{rport} invalid password for user:{msg['uid']}")
-        response = pickle.dumps({"status": "failed", "error": "Invalid password"})
-        await ws.send(response)
+        logger.error("%s:%s invalid password for user:%s", rhost, rport, msg["uid"])
+        response = {"status": "failed", "error": "Invalid password"}
+        await respond(ws, msg, response)
     except Exception as e:
-        logging.error(f"Error: {e}\nRolling back database")
-        database.rollback()
-        response = pickle.dumps({"status": "failed", "error": str(e)})
-        await ws.send(response)
+        logger.error("Error: %s\nRolling back database", e)
+        response = {"status": "failed", "error": str(e)}
+        await respond(ws, msg, response)
 
 
+@command("update_vault_name", WRITE, {"vault_name": str, "new_vault_name": str})
 async def update_vault_name(
-    ws: ServerConnection, msg: Dict, database: Database, rhost: str, rport: int
+    ws: ServerConnection, msg: Dict, database: AsyncDatabase, rhost: str, rport: int
 ) -> None:
     try:
-        database.update_vault_name(msg["uid"], msg["vault_name"], msg["new_vault_name"])
-        database.commit()
-        logging.info(f"{rhost}:{rport} changed vault name for user:{msg['uid']}")
-        response = pickle.dumps({"status": "success"})
-        await ws.send(response)
+        vault_id = await database.update_vault_name(
+            msg["uid"], msg["vault_name"], msg["new_vault_name"]
+        )
+        if vault_id is None:
+            logger.error("%s:%s vault not found", rhost, rport)
+            response = {
+                "status": "failed",
+                "error": f"Vault with name: {msg['vault_name']} not found",
+            }
+        else:
+            logger.info("%s:%s changed vault name for vault:%s", rhost, rport, vault_id)
+            response = {"status": "success"}
+        await respond(ws, msg, response)
     except Exception as e:
-        logging.error(f"Error: {e}\nRolling back database")
-        database.rollback()
-        response = pickle.dumps({"status": "failed", "error": str(e)})
-        await ws.send(response)
+        logger.error("Error: %s\nRolling back database", e)
+        response = {"status": "failed", "error": str(e)}
+        await respond(ws, msg, response)
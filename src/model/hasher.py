@@ -0,0 +1,42 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, TypeVar, Union
+
+from argon2 import PasswordHasher
+from argon2.exceptions import VerifyMismatchError
+
+T = TypeVar("T")
+
+
+def _hash(password: Union[str, bytes]) -> str:
+    return PasswordHasher().hash(password)
+
+
+def _verify(hash: str, password: Union[str, bytes]) -> bool:
+    try:
+        return PasswordHasher().verify(hash, password)
+    except VerifyMismatchError:
+        return False
+
+
+class Hasher:
+    def __init__(self, workers: int = 0) -> None:
+        self.workers: int = workers or os.cpu_count() or 1
+        self.executor: ProcessPoolExecutor = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+        )
+
+    def close(self) -> None:
+        self.executor.shutdown(cancel_futures=True)
+
+    async def hash(self, password: Union[str, bytes]) -> str:
+        return await self._submit(_hash, password)
+
+    async def verify(self, hash: str, password: Union[str, bytes]) -> bool:
+        return await self._submit(_verify, hash, password)
+
+    async def _submit(self, func: Callable[..., T], *args: Any) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
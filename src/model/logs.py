@@ -0,0 +1,109 @@
+import gzip
+import json
+import logging
+import os
+import queue
+import shutil
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+FIELDS = ("command", "uid", "status", "duration", "request_bytes", "response_bytes")
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, object] = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in FIELDS:
+            if hasattr(record, field):
+                entry[field] = getattr(record, field)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class LazyQueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class RotatingLogHandler(RotatingFileHandler):
+    def __init__(
+        self, filename: Path, max_bytes: int, interval: float, backup_count: int
+    ) -> None:
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count)
+        self.interval: float = interval
+        self.rollover_at: float = time.time() + interval
+        self.namer = lambda name: f"{name}.gz"
+        self.rotator = compress
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if self.interval > 0 and time.time() >= self.rollover_at:
+            return True
+        return bool(super().shouldRollover(record))
+
+    def doRollover(self) -> None:
+        super().doRollover()
+        self.rollover_at = time.time() + self.interval
+
+
+def compress(source: str, dest: str) -> None:
+    with open(source, "rb") as f, gzip.open(dest, "wb") as gz:
+        shutil.copyfileobj(f, gz)
+    os.remove(source)
+
+
+def parse_levels(levels: str) -> Dict[str, str]:
+    parsed = {}
+    for item in levels.split(","):
+        if item.strip():
+            name, level = item.split("=")
+            parsed[name.strip()] = level.strip().upper()
+    return parsed
+
+
+def configure_root(
+    handler: logging.Handler, level: str, levels: Optional[Dict[str, str]]
+) -> None:
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(level.upper())
+    for name, subsystem_level in (levels or {}).items():
+        logging.getLogger(f"ljk.{name}").setLevel(subsystem_level)
+
+
+def setup_logging(
+    log_file: Path,
+    level: str = "INFO",
+    levels: Optional[Dict[str, str]] = None,
+    max_bytes: int = 0,
+    interval: float = 0,
+    backup_count: int = 0,
+    log_queue: Optional[Any] = None,
+) -> QueueListener:
+    handler = RotatingLogHandler(log_file, max_bytes, interval, backup_count)
+    handler.setFormatter(JsonFormatter())
+    if log_queue is None:
+        log_queue = queue.Queue()
+        configure_root(LazyQueueHandler(log_queue), level, levels)
+    else:
+        configure_root(QueueHandler(log_queue), level, levels)
+    listener = QueueListener(log_queue, handler, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+def setup_worker_logging(
+    log_queue: Any, level: str = "INFO", levels: Optional[Dict[str, str]] = None
+) -> None:
+    configure_root(QueueHandler(log_queue), level, levels)
@@ -0,0 +1,186 @@
+import asyncio
+import bisect
+import logging
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from .async_db import AsyncDatabase
+from .cache import Cache
+from .scheduler import Scheduler
+
+logger = logging.getLogger("ljk.metrics")
+BUCKETS: Tuple[float, ...] = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+Collector = Callable[[], Iterable[str]]
+
+current_response: ContextVar[Optional[Dict[str, object]]] = ContextVar(
+    "current_response", default=None
+)
+
+
+def record_response(status: object, size: int) -> None:
+    response = current_response.get()
+    if response is not None:
+        response["status"] = status
+        response["bytes"] = int(str(response.get("bytes", 0))) + size
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS) -> None:
+        self.buckets: Tuple[float, ...] = buckets
+        self.counts: List[int] = [0] * (len(buckets) + 1)
+        self.sum: float = 0.0
+        self.count: int = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str, labels: str) -> Iterable[str]:
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {total}'
+        yield f'{name}_bucket{{{labels},le="+Inf"}} {self.count}'
+        yield f"{name}_sum{{{labels}}} {self.sum}"
+        yield f"{name}_count{{{labels}}} {self.count}"
+
+
+class Metrics:
+    def __init__(self) -> None:
+        self.latency: Dict[str, Histogram] = {}
+        self.errors: Dict[str, int] = {}
+        self.request_bytes: Dict[str, int] = {}
+        self.response_bytes: Dict[str, int] = {}
+        self.gauges: Dict[str, Tuple[str, float]] = {}
+        self.collectors: List[Collector] = []
+
+    def observe(
+        self,
+        command: str,
+        seconds: float,
+        error: bool,
+        request_bytes: int,
+        response_bytes: int,
+    ) -> None:
+        self.latency.setdefault(command, Histogram()).observe(seconds)
+        self.errors[command] = self.errors.get(command, 0) + int(error)
+        self.request_bytes[command] = self.request_bytes.get(command, 0) + request_bytes
+        self.response_bytes[command] = (
+            self.response_bytes.get(command, 0) + response_bytes
+        )
+
+    def set_gauge(self, name: str, value: float, help: str) -> None:
+        self.gauges[name] = (help, value)
+
+    def add_collector(self, collector: Collector) -> None:
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        lines = [
+            "# HELP ljk_command_seconds Time spent handling a command.",
+            "# TYPE ljk_command_seconds histogram",
+        ]
+        for command, histogram in sorted(self.latency.items()):
+            lines.extend(
+                histogram.render("ljk_command_seconds", f'command="{command}"')
+            )
+        for name, values, help in [
+            ("ljk_command_errors_total", self.errors, "Commands that failed."),
+            ("ljk_request_bytes_total", self.request_bytes, "Bytes received."),
+            ("ljk_response_bytes_total", self.response_bytes, "Bytes sent."),
+        ]:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} counter")
+            for command, value in sorted(values.items()):
+                lines.append(f'{name}{{command="{command}"}} {value}')
+        for gauge, (description, reading) in sorted(self.gauges.items()):
+            lines.append(f"# HELP {gauge} {description}")
+            lines.append(f"# TYPE {gauge} gauge")
+            lines.append(f"{gauge} {reading}")
+        for collector in self.collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+    async def serve(self, host: str, port: int) -> None:
+        server = await asyncio.start_server(self.handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+    async def handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            request = await reader.readline()
+            while (await reader.readline()).strip():
+                pass
+            if request.split(b" ")[1:2] == [b"/metrics"]:
+                body = self.render().encode()
+                status = "200 OK"
+            else:
+                body = b"Not found\n"
+                status = "404 Not Found"
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                "Content-Type: text/plain; version=0.0.4\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except Exception as e:
+            logger.error("Metrics error: %s", e)
+        finally:
+            writer.close()
+
+
+def scheduler_collector(scheduler: Scheduler) -> Iterable[str]:
+    yield "# HELP ljk_scheduler_queued Requests waiting for a slot."
+    yield "# TYPE ljk_scheduler_queued gauge"
+    for cost, budget in scheduler.budgets.items():
+        yield f'ljk_scheduler_queued{{cost="{cost}"}} {budget.queued}'
+    yield "# HELP ljk_scheduler_running Requests holding a slot."
+    yield "# TYPE ljk_scheduler_running gauge"
+    for cost, budget in scheduler.budgets.items():
+        yield f'ljk_scheduler_running{{cost="{cost}"}} {budget.running}'
+
+
+def usage_collector(database: AsyncDatabase) -> Iterable[str]:
+    top = database.top_usage()
+    for name, key, help in [
+        ("ljk_user_requests_total", "requests", "Database jobs run for a user."),
+        ("ljk_user_db_seconds_total", "db_time", "Database time used by a user."),
+        ("ljk_user_written_bytes_total", "bytes_written", "Bytes written by a user."),
+    ]:
+        yield f"# HELP {name} {help}"
+        yield f"# TYPE {name} counter"
+        for uid, usage in top:
+            yield f'{name}{{uid="{uid}"}} {usage[key]}'
+
+
+def cache_collector(cache: Cache) -> Iterable[str]:
+    for name, value, help in [
+        ("ljk_cache_hits_total", cache.hits, "Lookups answered from the cache."),
+        ("ljk_cache_misses_total", cache.misses, "Lookups that went to the database."),
+        ("ljk_cache_evictions_total", cache.evictions, "Entries evicted by size."),
+    ]:
+        yield f"# HELP {name} {help}"
+        yield f"# TYPE {name} counter"
+        yield f"{name} {value}"
+    yield "# HELP ljk_cache_entries Entries held in the cache."
+    yield "# TYPE ljk_cache_entries gauge"
+    yield f"ljk_cache_entries {len(cache.entries)}"
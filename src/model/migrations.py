@@ -0,0 +1,170 @@
+import sqlite3
+from typing import Callable, List
+
+
+def add_column(
+    cursor: sqlite3.Cursor, table: str, column: str, definition: str
+) -> None:
+    cursor.execute(f"""PRAGMA table_info({table})""")
+    if column not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute(f"""ALTER TABLE {table} ADD COLUMN {column} {definition}""")
+
+
+def create_tables(cursor: sqlite3.Cursor) -> None:
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS users(
+            id INTEGER PRIMARY KEY,
+            email TEXT NOT NULL UNIQUE,
+            auth_key BYTES NOT NULL
+        )"""
+    )
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS vaults(
+            id INTEGER PRIMARY KEY,
+            uid INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            key BYTES NOT NULL,
+            data BLOB,
+            FOREIGN KEY(uid) REFERENCES users(id)
+        )"""
+    )
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS records(
+            vid INTEGER NOT NULL,
+            rid INTEGER NOT NULL,
+            data BLOB,
+            PRIMARY KEY(vid, rid),
+            FOREIGN KEY(vid) REFERENCES vaults(id)
+        )"""
+    )
+    add_column(cursor, "vaults", "version", "INTEGER NOT NULL DEFAULT 1")
+    add_column(cursor, "vaults", "modified", "REAL NOT NULL DEFAULT 0")
+    add_column(cursor, "vaults", "blob", "TEXT")
+    add_column(cursor, "vaults", "blob_size", "INTEGER")
+
+
+def rebuild_tables(cursor: sqlite3.Cursor) -> None:
+    cursor.execute(
+        """CREATE TABLE users_new(
+            id INTEGER PRIMARY KEY,
+            email TEXT NOT NULL UNIQUE,
+            auth_key TEXT NOT NULL
+        )"""
+    )
+    cursor.execute(
+        """CREATE TABLE vaults_new(
+            id INTEGER PRIMARY KEY,
+            uid INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            name TEXT NOT NULL,
+            key BLOB NOT NULL,
+            data BLOB,
+            blob TEXT,
+            blob_size INTEGER,
+            version INTEGER NOT NULL DEFAULT 1,
+            modified REAL NOT NULL DEFAULT 0
+        )"""
+    )
+    cursor.execute(
+        """CREATE TABLE records_new(
+            vid INTEGER NOT NULL REFERENCES vaults(id) ON DELETE CASCADE,
+            rid INTEGER NOT NULL,
+            data BLOB,
+            PRIMARY KEY(vid, rid)
+        )"""
+    )
+    cursor.execute(
+        """INSERT INTO users_new(id, email, auth_key)
+        SELECT id, email, auth_key FROM users"""
+    )
+    # Vaults of deleted users were never removed; drop them so a reused user id
+    # cannot inherit them. Duplicate names keep the oldest vault's name.
+    cursor.execute(
+        """INSERT INTO vaults_new(
+            id, uid, name, key, data, blob, blob_size, version, modified
+        )
+        SELECT id, uid,
+            CASE WHEN id = (
+                SELECT MIN(id) FROM vaults AS first
+                WHERE first.uid = vaults.uid AND first.name = vaults.name
+            ) THEN name ELSE name || ' (' || id || ')' END,
+            key, data, blob, blob_size, version, modified
+        FROM vaults WHERE uid IN (SELECT id FROM users_new)"""
+    )
+    cursor.execute(
+        """INSERT INTO records_new(vid, rid, data)
+        SELECT vid, rid, data FROM records WHERE vid IN (SELECT id FROM vaults_new)"""
+    )
+    for table in ("records", "vaults", "users"):
+        cursor.execute(f"""DROP TABLE {table}""")
+    for table in ("users", "vaults", "records"):
+        cursor.execute(f"""ALTER TABLE {table}_new RENAME TO {table}""")
+    cursor.execute("""CREATE UNIQUE INDEX vaults_uid_name ON vaults(uid, name)""")
+    cursor.execute(
+        """CREATE INDEX vaults_blob ON vaults(blob) WHERE blob IS NOT NULL"""
+    )
+    cursor.execute("""PRAGMA foreign_key_check""")
+    violation = cursor.fetchone()
+    if violation is not None:
+        raise Exception(f"Foreign key violation in table {violation[0]}")
+
+
+def index_vault_owner(cursor: sqlite3.Cursor) -> None:
+    cursor.execute("""CREATE INDEX vaults_uid ON vaults(uid)""")
+
+
+def autoincrement_users(cursor: sqlite3.Cursor) -> None:
+    cursor.execute(
+        """CREATE TABLE users_new(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            email TEXT NOT NULL UNIQUE,
+            auth_key TEXT NOT NULL
+        )"""
+    )
+    cursor.execute(
+        """INSERT INTO users_new(id, email, auth_key)
+        SELECT id, email, auth_key FROM users"""
+    )
+    cursor.execute("""DROP TABLE users""")
+    cursor.execute("""ALTER TABLE users_new RENAME TO users""")
+    cursor.execute("""PRAGMA foreign_key_check""")
+    violation = cursor.fetchone()
+    if violation is not None:
+        raise Exception(f"Foreign key violation in table {violation[0]}")
+
+
+MIGRATIONS: List[Callable[[sqlite3.Cursor], None]] = [
+    create_tables,
+    rebuild_tables,
+    index_vault_owner,
+    autoincrement_users,
+]
+
+
+def schema_version(connection: sqlite3.Connection) -> int:
+    cursor = connection.execute("""PRAGMA user_version""")
+    version = int(cursor.fetchone()[0])
+    cursor.close()
+    return version
+
+
+def migrate(cursor: sqlite3.Cursor) -> int:
+    connection = cursor.connection
+    cursor.execute("""PRAGMA foreign_keys = OFF""")
+    while True:
+        cursor.execute("""BEGIN IMMEDIATE""")
+        try:
+            version = schema_version(connection)
+            if version > len(MIGRATIONS):
+                raise Exception(
+                    f"Database schema version {version} is newer than "
+                    f"supported version {len(MIGRATIONS)}"
+                )
+            if version == len(MIGRATIONS):
+                connection.rollback()
+                return version
+            MIGRATIONS[version](cursor)
+            cursor.execute(f"""PRAGMA user_version = {version + 1}""")
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
@@ -0,0 +1,85 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Deque, Iterable, List, Optional
+
+logger = logging.getLogger("ljk.monitor")
+QUANTILES = (0.5, 0.9, 0.99, 1.0)
+
+
+class LoopMonitor:
+    def __init__(
+        self, interval: float = 0.1, threshold: float = 0.5, samples: int = 1024
+    ) -> None:
+        self.interval: float = interval
+        self.threshold: float = threshold
+        self.lags: Deque[float] = deque(maxlen=samples)
+        self.count: int = 0
+        self.sum: float = 0.0
+        self.stalls: int = 0
+        self.beat: float = time.monotonic()
+        self.stopped: threading.Event = threading.Event()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.thread_id: Optional[int] = None
+
+    async def run(self) -> None:
+        if self.interval <= 0:
+            return
+        self.loop = asyncio.get_running_loop()
+        self.thread_id = threading.get_ident()
+        self.stopped.clear()
+        watchdog = threading.Thread(target=self.watch, name="watchdog", daemon=True)
+        watchdog.start()
+        try:
+            while True:
+                start = time.monotonic()
+                self.beat = start + self.interval
+                await asyncio.sleep(self.interval)
+                self.observe(max(0.0, time.monotonic() - self.beat))
+        finally:
+            self.stopped.set()
+
+    def observe(self, lag: float) -> None:
+        self.lags.append(lag)
+        self.count += 1
+        self.sum += lag
+
+    def watch(self) -> None:
+        reported = None
+        while not self.stopped.wait(min(self.interval, self.threshold / 4)):
+            beat = self.beat
+            stalled = time.monotonic() - beat
+            if stalled > self.threshold and reported != beat:
+                reported = beat
+                self.stalls += 1
+                self.report(stalled)
+
+    def report(self, stalled: float) -> None:
+        task = None
+        if self.loop is not None:
+            task = asyncio.current_task(self.loop)
+        name = task.get_name() if task is not None else "callback"
+        frame = sys._current_frames().get(self.thread_id or 0)
+        stack = "".join(traceback.format_stack(frame)) if frame is not None else ""
+        logger.error("Event loop stalled for %.3fs in %s\n%s", stalled, name, stack)
+
+    def quantiles(self) -> List[float]:
+        lags = sorted(self.lags)
+        if not lags:
+            return [0.0 for _ in QUANTILES]
+        return [lags[round(q * (len(lags) - 1))] for q in QUANTILES]
+
+    def collect(self) -> Iterable[str]:
+        yield "# HELP ljk_loop_lag_seconds Event loop scheduling delay."
+        yield "# TYPE ljk_loop_lag_seconds summary"
+        for q, lag in zip(QUANTILES, self.quantiles()):
+            yield f'ljk_loop_lag_seconds{{quantile="{q}"}} {lag}'
+        yield f"ljk_loop_lag_seconds_sum {self.sum}"
+        yield f"ljk_loop_lag_seconds_count {self.count}"
+        yield "# HELP ljk_loop_stalls_total Event loop stalls over the threshold."
+        yield "# TYPE ljk_loop_stalls_total counter"
+        yield f"ljk_loop_stalls_total {self.stalls}"
@@ -0,0 +1,62 @@
+import time
+import zlib
+from typing import Any, Dict, Tuple
+
+MAX_BUCKETS = 10000
+SHARED_BUCKETS = 65536
+
+
+class RateLimiter:
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate: float = rate
+        self.burst: float = max(1, burst)
+        self.buckets: Dict[str, Tuple[float, float]] = {}
+
+    def take(self, tokens: float, last: float, now: float) -> Tuple[float, float]:
+        tokens = min(self.burst, tokens + (now - last) * self.rate)
+        if tokens >= 1:
+            return tokens - 1, 0.0
+        return tokens, (1 - tokens) / self.rate
+
+    def acquire(self, key: str) -> float:
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        tokens, last = self.buckets.get(key, (self.burst, now))
+        tokens, wait = self.take(tokens, last, now)
+        self.buckets[key] = (tokens, now)
+        if len(self.buckets) > MAX_BUCKETS:
+            self.prune(now)
+        return wait
+
+    def prune(self, now: float) -> None:
+        full = self.burst / self.rate
+        self.buckets = {
+            key: (tokens, last)
+            for key, (tokens, last) in self.buckets.items()
+            if now - last < full
+        }
+
+
+class SharedRateLimiter(RateLimiter):
+    def __init__(self, rate: float, burst: int, shared: Any) -> None:
+        super().__init__(rate, burst)
+        self.shared: Any = shared
+        self.size: int = len(shared) // 2
+
+    def acquire(self, key: str) -> float:
+        if self.rate <= 0:
+            return 0.0
+        index = 2 * (zlib.crc32(key.encode()) % self.size)
+        with self.shared.get_lock():
+            now = time.monotonic()
+            tokens, last = self.shared[index], self.shared[index + 1]
+            if last == 0:
+                tokens, last = self.burst, now
+            tokens, wait = self.take(tokens, last, now)
+            self.shared[index], self.shared[index + 1] = tokens, now
+        return wait
+
+
+def shared_buckets(context: Any, size: int = SHARED_BUCKETS) -> Any:
+    return context.Array("d", 2 * size)
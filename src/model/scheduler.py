@@ -0,0 +1,60 @@
+import asyncio
+from typing import Awaitable, Callable, Dict
+
+HASH = "hash"
+WRITE = "write"
+READ = "read"
+
+
+class SchedulerBusy(Exception):
+    pass
+
+
+class Budget:
+    def __init__(self, slots: int, max_queued: int, timeout: float) -> None:
+        self.slots: asyncio.Semaphore = asyncio.Semaphore(slots)
+        self.max_queued: int = max_queued
+        self.timeout: float = timeout
+        self.queued: int = 0
+        self.running: int = 0
+
+
+class Scheduler:
+    def __init__(
+        self,
+        hash_slots: int,
+        write_slots: int,
+        read_slots: int,
+        max_queued: int = 256,
+        timeout: float = 5.0,
+        hash_queue: int = 0,
+    ) -> None:
+        self.budgets: Dict[str, Budget] = {
+            HASH: Budget(hash_slots, hash_queue or max_queued, timeout),
+            WRITE: Budget(write_slots, max_queued, timeout),
+            READ: Budget(read_slots, max_queued, timeout),
+        }
+
+    async def run(self, cost: str, job: Callable[[], Awaitable[None]]) -> None:
+        budget = self.budgets[cost]
+        if not budget.slots.locked():
+            await budget.slots.acquire()
+        else:
+            await self.wait(budget, cost)
+        budget.running += 1
+        try:
+            await job()
+        finally:
+            budget.running -= 1
+            budget.slots.release()
+
+    async def wait(self, budget: Budget, name: str) -> None:
+        if budget.queued >= budget.max_queued:
+            raise SchedulerBusy(f"Too many queued {name} requests")
+        budget.queued += 1
+        try:
+            await asyncio.wait_for(budget.slots.acquire(), budget.timeout)
+        except asyncio.TimeoutError:
+            raise SchedulerBusy(f"Timed out waiting for a {name} slot")
+        finally:
+            budget.queued -= 1
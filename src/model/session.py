@@ -0,0 +1,68 @@
+import base64
+import hashlib
+import hmac
+import secrets
+import time
+from typing import Dict, Optional, Tuple
+
+
+class InvalidSession(Exception):
+    pass
+
+
+class Sessions:
+    def __init__(self, ttl: float = 3600, secret: Optional[bytes] = None) -> None:
+        self.ttl: float = ttl
+        self.secret: bytes = secret or secrets.token_bytes(32)
+        self.generations: Dict[int, int] = {}
+
+    def binding(self) -> str:
+        return secrets.token_hex(16)
+
+    def issue(self, uid: int, binding: str) -> str:
+        expires = int(time.time() + self.ttl)
+        generation = self.generations.get(uid, 0)
+        payload = f"{uid}:{generation}:{expires}".encode()
+        return f"{self._encode(payload)}.{self._encode(self._sign(payload, binding))}"
+
+    def verify(self, token: Optional[str], binding: str) -> int:
+        return self.check(token, binding)[0]
+
+    def check(self, token: Optional[str], binding: str) -> Tuple[int, int]:
+        if not token:
+            raise InvalidSession("Not authenticated")
+        if not isinstance(token, str):
+            raise InvalidSession("Malformed session token")
+        try:
+            payload_part, signature_part = token.split(".")
+            payload = self._decode(payload_part)
+            signature = self._decode(signature_part)
+            uid, generation, expires = payload.decode().split(":")
+        except ValueError:
+            raise InvalidSession("Malformed session token")
+        if not hmac.compare_digest(signature, self._sign(payload, binding)):
+            raise InvalidSession("Invalid session token")
+        if int(generation) != self.generations.get(int(uid), 0):
+            raise InvalidSession("Session revoked")
+        if int(expires) < time.time():
+            raise InvalidSession("Session expired")
+        return int(uid), int(expires)
+
+    def revoke(self, uid: int) -> None:
+        self.generations[uid] = self.generations.get(uid, 0) + 1
+
+    def renew(self, uid: int, expires: int, binding: str) -> Optional[str]:
+        if expires - time.time() < self.ttl / 2:
+            return self.issue(uid, binding)
+        return None
+
+    def _sign(self, payload: bytes, binding: str) -> bytes:
+        return hmac.new(
+            self.secret, binding.encode() + b":" + payload, hashlib.sha256
+        ).digest()
+
+    def _encode(self, data: bytes) -> str:
+        return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+    def _decode(self, data: str) -> bytes:
+        return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
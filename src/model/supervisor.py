@@ -0,0 +1,75 @@
+import logging
+import multiprocessing
+import time
+from multiprocessing.connection import wait
+from multiprocessing.process import BaseProcess
+from typing import Any, Callable, Dict, Tuple
+
+logger = logging.getLogger("ljk.supervisor")
+RESTART_DELAY = 1.0
+STOP_TIMEOUT = 10.0
+
+
+class Supervisor:
+    def __init__(
+        self,
+        target: Callable[..., None],
+        args: Tuple[Any, ...],
+        workers: int,
+        restart_delay: float = RESTART_DELAY,
+    ) -> None:
+        self.target: Callable[..., None] = target
+        self.args: Tuple[Any, ...] = args
+        self.workers: int = workers
+        self.restart_delay: float = restart_delay
+        self.context = multiprocessing.get_context("spawn")
+        self.processes: Dict[int, BaseProcess] = {}
+        self.restarts: int = 0
+        self.running: bool = False
+
+    def spawn(self, index: int) -> None:
+        process = self.context.Process(
+            target=self.target,
+            args=(index, *self.args),
+            name=f"ljk-worker-{index}",
+        )
+        process.start()
+        self.processes[index] = process
+        logger.info("Started worker %s as pid %s", index, process.pid)
+
+    def start(self) -> None:
+        self.running = True
+        for index in range(self.workers):
+            self.spawn(index)
+
+    def check(self, timeout: float) -> None:
+        wait([process.sentinel for process in self.processes.values()], timeout)
+        for index, process in list(self.processes.items()):
+            if process.is_alive() or not self.running:
+                continue
+            logger.error("Worker %s exited with code %s", index, process.exitcode)
+            process.close()
+            time.sleep(self.restart_delay)
+            self.restarts += 1
+            self.spawn(index)
+
+    def run(self) -> None:
+        self.start()
+        try:
+            while self.running:
+                self.check(1.0)
+        finally:
+            self.stop()
+
+    def stop(self, timeout: float = STOP_TIMEOUT) -> None:
+        self.running = False
+        for process in self.processes.values():
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + timeout
+        for index, process in self.processes.items():
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.error("Worker %s did not stop, killing it", index)
+                process.kill()
+                process.join()
@@ -1,11 +1,15 @@
+import json
 import sqlite3
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Set
 
 
 class Vault:
     def __init__(self, name: str, key: bytes) -> None:
         self.name: str = name
         self.key: bytes = key
+        self.version: int = 0
+        self.changes: Set[int] = set()
+        self.added: Set[int] = set()
         self.connection: sqlite3.Connection = sqlite3.connect(":memory:")
         self.cursor: sqlite3.Cursor = self.connection.cursor()
         self.cursor.execute(
@@ -35,6 +39,31 @@ class Vault:
     def load(self, data: bytes) -> None:
         self.connection.deserialize(data)
 
+    def record(self, id: int) -> Optional[bytes]:
+        service = self.service(id)
+        if service is None:
+            return None
+        del service["id"]
+        return json.dumps(service).encode()
+
+    def apply(self, id: int, record: Optional[bytes]) -> None:
+        if record is None:
+            self.cursor.execute("""DELETE FROM vault WHERE id = ?""", (id,))
+            return
+        service = json.loads(record)
+        self.cursor.execute(
+            """INSERT OR REPLACE INTO vault(
+                id, service, user, password, notes
+            ) VALUES(?, ?, ?, ?, ?)""",
+            (
+                id,
+                service["service"],
+                service["user"],
+                service["password"],
+                service["notes"],
+            ),
+        )
+
     def add(
         self, service: str = "", user: str = "", password: str = "", notes: str = ""
     ) -> None:
@@ -44,6 +73,23 @@ class Vault:
             ) VALUES(?, ?, ?, ?)""",
             (service, user, password, notes),
         )
+        if self.cursor.lastrowid is not None:
+            self.changes.add(self.cursor.lastrowid)
+            self.added.add(self.cursor.lastrowid)
+
+    def merge(self, other: "Vault") -> None:
+        for id in sorted(other.changes):
+            service = other.service(id)
+            if id not in other.added:
+                self.apply(id, other.record(id))
+                self.changes.add(id)
+            elif service is not None:
+                self.add(
+                    service["service"],
+                    service["user"],
+                    service["password"],
+                    service["notes"],
+                )
 
     def service(self, id: int) -> Optional[Dict[str, Any]]:
         self.cursor.execute("""SELECT * FROM vault WHERE id = ?""", (id,))
@@ -60,6 +106,7 @@ class Vault:
 
     def delete(self, id: int) -> None:
         self.cursor.execute("""DELETE FROM vault WHERE id = ?""", (id,))
+        self.changes.add(id)
 
     def update(
         self, id: int, service: str, user: str, password: str, notes: str = ""
@@ -73,6 +120,7 @@ class Vault:
             WHERE id = ?""",
             (service, user, password, notes, id),
         )
+        self.changes.add(id)
 
     def services(self) -> Optional[List[Dict[str, Any]]]:
         self.cursor.execute("""SELECT * FROM vault""")
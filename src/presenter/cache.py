@@ -0,0 +1,44 @@
+import hashlib
+import os
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from src.model import codec
+
+
+class VaultCache:
+    def __init__(self, cache_dir: Path) -> None:
+        self.cache_dir = cache_dir
+
+    def path(self, uid: int, vault_name: str) -> Path:
+        name = hashlib.sha256(vault_name.encode()).hexdigest()
+        return self.cache_dir / str(uid) / name
+
+    def get(self, uid: int, vault_name: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.path(uid, vault_name), "rb") as f:
+                vault = codec.decode(f.read())
+        except (OSError, codec.CodecError):
+            return None
+        if not {"tag", "key", "data", "version"} <= vault.keys():
+            return None
+        vault.setdefault("records", [])
+        return vault
+
+    def put(self, uid: int, vault_name: str, vault: Dict[str, Any]) -> None:
+        path = self.path(uid, vault_name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        entry = {
+            "tag": vault["tag"],
+            "key": vault["key"],
+            "data": vault["data"],
+            "version": vault["version"],
+            "records": vault.get("records", []),
+        }
+        temp_path = path.with_suffix(".tmp")
+        with open(temp_path, "wb") as f:
+            f.write(codec.dumps(entry))
+        os.replace(temp_path, path)
+
+    def delete(self, uid: int, vault_name: str) -> None:
+        self.path(uid, vault_name).unlink(missing_ok=True)
@@ -1,20 +1,20 @@
-import pickle
-from typing import Any, Dict, List, Optional, cast
-
-from websockets import ClientConnection
+from typing import Any, Dict, List, Optional
 
 from src.model import encryption
 from src.model.vault import Vault
 
+from .cache import VaultCache
+from .connection import Connection
+
+MERGE_ATTEMPTS = 3
+
 
-async def register(websocket: ClientConnection, email: str, mpass: str) -> bool:
+async def register(websocket: Connection, email: str, mpass: str) -> bool:
     command = "register"
     dkey = encryption.create_dkey(mpass, email)
     mkey = encryption.create_mkey(mpass, dkey)
     user = {"email": email, "mkey": mkey}
-    msg = pickle.dumps({"command": command, "user": user})
-    await websocket.send(msg)
-    response = pickle.loads(cast(bytes, await websocket.recv()))
+    response = await websocket.request({"command": command, "user": user})
     if response["status"] == "success":
         return True
     else:
@@ -22,14 +22,15 @@ async def register(websocket: ClientConnection, email: str, mpass: str) -> bool:
 
 
 async def auth(
-    websocket: ClientConnection, email: str, mpass: str
+    websocket: Connection, email: str, mpass: str
 ) -> Optional[Dict[str, Any]]:
     dkey = encryption.create_dkey(mpass, email)
     mkey = encryption.create_mkey(mpass, dkey)
-    msg = pickle.dumps({"command": "auth", "email": email, "mkey": mkey})
-    await websocket.send(msg)
-    response = pickle.loads(cast(bytes, await websocket.recv()))
+    response = await websocket.request(
+        {"command": "auth", "email": email, "mkey": mkey}
+    )
     if response["status"] == "success":
+        websocket.token = response["token"]
         user = response["user"]
         user["dkey"] = dkey
         return user
@@ -38,135 +39,252 @@ async def auth(
 
 
 async def delete_account(
-    websocket: ClientConnection, user: Dict[str, Any], mpass: str
+    websocket: Connection, user: Dict[str, Any], mpass: str
 ) -> bool:
     command = "delete_account"
     uid = user["id"]
     mkey = encryption.create_mkey(mpass, user["dkey"])
-    msg = pickle.dumps({"command": command, "uid": uid, "mkey": mkey})
-    await websocket.send(msg)
-    response = pickle.loads(cast(bytes, await websocket.recv()))
+    response = await websocket.request({"command": command, "uid": uid, "mkey": mkey})
     if response["status"] == "success":
         return True
     else:
         return False
 
 
+def rekey_operations(
+    user: Dict[str, Any], vaults: Optional[List[Dict[str, Any]]], new_dkey: bytes
+) -> List[Dict[str, Any]]:
+    operations = []
+    for vault in vaults or []:
+        vkey = encryption.decrypt(vault["key"], user["dkey"])
+        operations.append(
+            {
+                "command": "update_vault_key",
+                "vault_name": vault["name"],
+                "vault_key": encryption.encrypt(vkey, new_dkey),
+            }
+        )
+    return operations
+
+
 async def change_mkey(
-    websocket: ClientConnection, user: Dict[str, Any], mpass: str, new_mpass: str
+    websocket: Connection, user: Dict[str, Any], mpass: str, new_mpass: str
 ) -> bool:
-    if await auth(websocket, user["email"], mpass) is None:
+    if encryption.create_dkey(mpass, user["email"]) != user["dkey"]:
         return False
     vaults = await get_vaults(websocket, user)
     new_dkey = encryption.create_dkey(new_mpass, user["email"])
     new_mkey = encryption.create_mkey(new_mpass, new_dkey)
-    if vaults is not None:
-        for vault in vaults:
-            vault_name = vault["name"]
-            e_vkey = vault["key"]
-            vkey = encryption.decrypt(e_vkey, user["dkey"])
-            new_e_vkey = encryption.encrypt(vkey, new_dkey)
-            if not await update_vault_key(websocket, user, vault_name, new_e_vkey):
-                return False
-    msg = pickle.dumps(
-        {"command": "change_auth_key", "uid": user["id"], "new_mkey": new_mkey}
+    operations = rekey_operations(user, vaults, new_dkey)
+    operations.append({"command": "change_auth_key", "new_mkey": new_mkey})
+    response = await websocket.request(
+        {"command": "batch", "uid": user["id"], "operations": operations}
     )
-    await websocket.send(msg)
-    response = pickle.loads(cast(bytes, await websocket.recv()))
     if response["status"] == "success":
+        user["dkey"] = new_dkey
         return True
     else:
         return False
 
 
 async def change_email(
-    websocket: ClientConnection, user: Dict[str, Any], new_email: str, mpass: str
+    websocket: Connection, user: Dict[str, Any], new_email: str, mpass: str
 ) -> bool:
-    if await auth(websocket, user["email"], mpass) is None:
+    if encryption.create_dkey(mpass, user["email"]) != user["dkey"]:
         return False
     new_dkey = encryption.create_dkey(mpass, new_email)
     new_mkey = encryption.create_mkey(mpass, new_dkey)
     vaults = await get_vaults(websocket, user)
-    if vaults is not None:
-        for vault in vaults:
-            vault_name = vault["name"]
-            e_vkey = vault["key"]
-            vkey = encryption.decrypt(e_vkey, user["dkey"])
-            e_vkey = encryption.encrypt(vkey, new_dkey)
-            if not await update_vault_key(websocket, user, vault_name, e_vkey):
-                return False
-    msg = pickle.dumps(
-        {
-            "command": "change_email",
-            "uid": user["id"],
-            "new_email": new_email,
-            "new_mkey": new_mkey,
-        }
+    operations = rekey_operations(user, vaults, new_dkey)
+    operations.append(
+        {"command": "change_email", "new_email": new_email, "new_mkey": new_mkey}
+    )
+    response = await websocket.request(
+        {"command": "batch", "uid": user["id"], "operations": operations}
     )
-    await websocket.send(msg)
-    response = pickle.loads(cast(bytes, await websocket.recv()))
     if response["status"] == "success":
+        user["email"] = new_email
+        user["dkey"] = new_dkey
         return True
     else:
         return False
 
 
 async def get_vaults(
-    websocket: ClientConnection, user: Dict[str, Any]
+    websocket: Connection, user: Dict[str, Any]
 ) -> Optional[List[Dict[str, Any]]]:
-    msg = pickle.dumps({"command": "get_vaults", "uid": user["id"]})
-    await websocket.send(msg)
-    response = pickle.loads(cast(bytes, await websocket.recv()))
-    if response["status"] == "failed" or response["vaults"] is None:
+    vaults: List[Dict[str, Any]] = []
+    after = 0
+    while True:
+        response = await websocket.request(
+            {"command": "get_vaults", "uid": user["id"], "after": after}
+        )
+        if response["status"] != "success":
+            return None
+        if response["vaults"] is not None:
+            vaults.extend(response["vaults"])
+        if response["next"] is None:
+            break
+        after = response["next"]
+    if len(vaults) <= 0:
         return None
-    vaults = response["vaults"]
     return vaults
 
 
 async def get_vault(
-    websocket: ClientConnection, user: Dict[str, Any], vault_name: str
+    websocket: Connection,
+    user: Dict[str, Any],
+    vault_name: str,
+    cache: Optional[VaultCache] = None,
 ) -> Optional[Vault]:
-    msg = pickle.dumps(
-        {"command": "get_vault", "uid": user["id"], "vault_name": vault_name}
-    )
-    await websocket.send(msg)
-    response = pickle.loads(cast(bytes, await websocket.recv()))
-    if response["status"] == "failed":
+    cached = cache.get(user["id"], vault_name) if cache is not None else None
+    msg = {"command": "get_vault", "uid": user["id"], "vault_name": vault_name}
+    if cached is not None:
+        msg["if_none_match"] = cached["tag"]
+    response = await websocket.request(msg)
+    if response["status"] == "not_modified" and cached is not None:
+        e_vault = cached
+    elif response["status"] == "success":
+        e_vault = response["vault"]
+        if cache is not None:
+            cache.put(user["id"], vault_name, e_vault)
+    else:
         return None
-    vault = response["vault"]
-    vkey = encryption.decrypt(vault["key"], user["dkey"])
-    data = encryption.decrypt(vault["data"], vkey)
+    vkey = encryption.decrypt(e_vault["key"], user["dkey"])
+    data = encryption.decrypt(e_vault["data"], vkey)
     vault = Vault(vault_name, vkey)
     vault.load(data)
+    for record in e_vault.get("records", []):
+        vault.apply(record["id"], decrypt_record(record, vkey))
+    vault.version = e_vault["version"]
     return vault
 
 
+def encrypt_record(vault: Vault, id: int) -> Dict[str, Any]:
+    record = vault.record(id)
+    if record is None:
+        return {"id": id, "data": None}
+    return {"id": id, "data": encryption.encrypt(record, vault.key, str(id).encode())}
+
+
+def decrypt_record(record: Dict[str, Any], vkey: bytes) -> Optional[bytes]:
+    if record["data"] is None:
+        return None
+    return encryption.decrypt(record["data"], vkey, str(record["id"]).encode())
+
+
+async def merge_vault(
+    websocket: Connection,
+    user: Dict[str, Any],
+    vault: Vault,
+    cache: Optional[VaultCache] = None,
+) -> bool:
+    current = await get_vault(websocket, user, vault.name, cache)
+    if current is None:
+        return False
+    current.merge(vault)
+    vault.load(current.dump())
+    vault.version = current.version
+    vault.changes = current.changes
+    vault.added = current.added
+    current.rm()
+    return True
+
+
+async def sync_vault(
+    websocket: Connection,
+    user: Dict[str, Any],
+    vault: Vault,
+    cache: Optional[VaultCache] = None,
+) -> bool:
+    for _ in range(MERGE_ATTEMPTS):
+        if not vault.changes:
+            return True
+        ids = sorted(vault.changes)
+        records = [encrypt_record(vault, id) for id in ids]
+        response = await websocket.request(
+            {
+                "command": "sync_vault",
+                "uid": user["id"],
+                "vault_name": vault.name,
+                "version": vault.version,
+                "records": records,
+            }
+        )
+        if response["status"] == "conflict":
+            if not await merge_vault(websocket, user, vault, cache):
+                return False
+            continue
+        if response["status"] != "success":
+            return False
+        vault.changes.difference_update(ids)
+        vault.added.difference_update(ids)
+        if cache is not None:
+            cached = cache.get(user["id"], vault.name)
+            if cached is not None and cached["version"] == vault.version:
+                merged = {record["id"]: record for record in cached["records"]}
+                merged.update({record["id"]: record for record in records})
+                cached.update(
+                    tag=response["tag"],
+                    version=response["version"],
+                    records=[merged[id] for id in sorted(merged)],
+                )
+                cache.put(user["id"], vault.name, cached)
+            else:
+                cache.delete(user["id"], vault.name)
+        vault.version = response["version"]
+        if response["compact"]:
+            return await save_vault(websocket, user, vault, cache)
+        return True
+    return False
+
+
 async def save_vault(
-    websocket: ClientConnection, user: Dict[str, Any], vault: Vault
+    websocket: Connection,
+    user: Dict[str, Any],
+    vault: Vault,
+    cache: Optional[VaultCache] = None,
 ) -> bool:
-    vault_data = vault.dump()
-    e_vault = encryption.encrypt(vault_data, vault.key)
-    msg = pickle.dumps(
-        {
-            "command": "save_vault",
-            "uid": user["id"],
-            "vault_name": vault.name,
-            "data": e_vault,
-        }
-    )
-    vault.load(vault_data)
-    await websocket.send(msg)
-    response = pickle.loads(cast(bytes, await websocket.recv()))
-    if response["status"] == "success":
+    for _ in range(MERGE_ATTEMPTS):
+        vault_data = vault.dump()
+        e_vault = encryption.encrypt(vault_data, vault.key)
+        vault.load(vault_data)
+        response = await websocket.request(
+            {
+                "command": "save_vault",
+                "uid": user["id"],
+                "vault_name": vault.name,
+                "version": vault.version,
+                "data": e_vault,
+            }
+        )
+        if response["status"] == "conflict":
+            if not await merge_vault(websocket, user, vault, cache):
+                return False
+            continue
+        if response["status"] != "success":
+            return False
+        vault.changes.clear()
+        vault.added.clear()
+        vault.version = response["version"]
+        if cache is not None:
+            cached = cache.get(user["id"], vault.name)
+            if cached is not None:
+                cached.update(
+                    tag=response["tag"],
+                    data=e_vault,
+                    version=response["version"],
+                    records=[],
+                )
+                cache.put(user["id"], vault.name, cached)
         return True
-    else:
-        return False
+    return False
 
 
 async def update_vault_key(
-    websocket: ClientConnection, user: Dict[str, Any], vault_name: str, e_vkey: bytes
+    websocket: Connection, user: Dict[str, Any], vault_name: str, e_vkey: bytes
 ) -> bool:
-    msg = pickle.dumps(
+    response = await websocket.request(
         {
             "command": "update_vault_key",
             "uid": user["id"],
@@ -174,8 +292,6 @@ async def update_vault_key(
             "vault_key": e_vkey,
         }
     )
-    await websocket.send(msg)
-    response = pickle.loads(cast(bytes, await websocket.recv()))
     if response["status"] == "success":
         return True
     else:
@@ -183,12 +299,12 @@ async def update_vault_key(
 
 
 async def update_vault_name(
-    websocket: ClientConnection,
+    websocket: Connection,
     user: Dict[str, Any],
     vault_name: str,
     new_vault_name: str,
 ) -> bool:
-    msg = pickle.dumps(
+    response = await websocket.request(
         {
             "command": "update_vault_name",
             "uid": user["id"],
@@ -196,8 +312,6 @@ async def update_vault_name(
             "new_vault_name": new_vault_name,
         }
     )
-    await websocket.send(msg)
-    response = pickle.loads(cast(bytes, await websocket.recv()))
     if response["status"] == "success":
         return True
     else:
@@ -205,13 +319,16 @@ async def update_vault_name(
 
 
 async def delete_vault(
-    websocket: ClientConnection, user: Dict[str, Any], vault_name: str
+    websocket: Connection,
+    user: Dict[str, Any],
+    vault_name: str,
+    cache: Optional[VaultCache] = None,
 ) -> bool:
-    msg = pickle.dumps(
+    response = await websocket.request(
         {"command": "delete_vault", "uid": user["id"], "vault_name": vault_name}
     )
-    await websocket.send(msg)
-    response = pickle.loads(cast(bytes, await websocket.recv()))
+    if cache is not None:
+        cache.delete(user["id"], vault_name)
     if response["status"] == "success":
         return True
     else:
@@ -219,13 +336,13 @@ async def delete_vault(
 
 
 async def create_vault(
-    websocket: ClientConnection, user: Dict[str, Any], vault_name: str
+    websocket: Connection, user: Dict[str, Any], vault_name: str
 ) -> bool:
     vkey = encryption.generate_vault_key()
     vault = Vault(vault_name, vkey)
     e_vkey = encryption.encrypt(vkey, user["dkey"])
     e_vault = encryption.encrypt(vault.dump(), vkey)
-    msg = pickle.dumps(
+    response = await websocket.request(
         {
             "command": "create_vault",
             "uid": user["id"],
@@ -234,8 +351,6 @@ async def create_vault(
             "vault_data": e_vault,
         }
     )
-    await websocket.send(msg)
-    response = pickle.loads(cast(bytes, await websocket.recv()))
     if response["status"] == "success":
         return True
     else:
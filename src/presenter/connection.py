@@ -0,0 +1,67 @@
+import asyncio
+from typing import Any, Dict, Optional, cast
+
+from websockets import ClientConnection
+
+from src.model import codec
+
+RETRY_ATTEMPTS = 3
+RETRY_DELAY = 0.5
+MAX_RETRY_DELAY = 5.0
+
+
+class Connection:
+    def __init__(self, websocket: ClientConnection) -> None:
+        self.websocket: ClientConnection = websocket
+        self.next_id: int = 0
+        self.waiting: Dict[int, asyncio.Future[Dict[str, Any]]] = {}
+        self.reader: Optional[asyncio.Task[None]] = None
+        self.token: Optional[str] = None
+
+    async def close(self) -> None:
+        await self.websocket.close()
+        if self.reader is not None:
+            await self.reader
+
+    async def request(self, msg: Dict[str, Any]) -> Dict[str, Any]:
+        for attempt in range(RETRY_ATTEMPTS):
+            response = await self._request(msg)
+            if response.get("status") != "retry":
+                break
+            delay = response.get("retry_after") or RETRY_DELAY * 2**attempt
+            await asyncio.sleep(min(delay, MAX_RETRY_DELAY))
+        return response
+
+    async def _request(self, msg: Dict[str, Any]) -> Dict[str, Any]:
+        if self.reader is None or self.reader.done():
+            self.reader = asyncio.create_task(self._read())
+        self.next_id += 1
+        request_id = self.next_id
+        future: asyncio.Future[Dict[str, Any]] = (
+            asyncio.get_running_loop().create_future()
+        )
+        self.waiting[request_id] = future
+        msg = {**msg, "id": request_id}
+        if self.token is not None:
+            msg["token"] = self.token
+        try:
+            await self.websocket.send(codec.encode(msg))
+            return await future
+        finally:
+            del self.waiting[request_id]
+
+    async def _read(self) -> None:
+        error: Exception = ConnectionError("Connection closed")
+        try:
+            async for message in self.websocket:
+                response = codec.decode(cast(bytes, message))
+                if "token" in response:
+                    self.token = response["token"]
+                future = self.waiting.get(response.get("id", 0))
+                if future is not None and not future.done():
+                    future.set_result(response)
+        except Exception as e:
+            error = e
+        for future in self.waiting.values():
+            if not future.done():
+                future.set_exception(error)
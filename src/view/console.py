@@ -3,16 +3,20 @@ import re
 from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import pyperclip
-from websockets import ClientConnection
 
 from src.model.encryption import generate_password
 from src.model.vault import Vault
 from src.presenter import client
+from src.presenter.cache import VaultCache
+from src.presenter.connection import Connection
 
 
 class Console:
-    def __init__(self, ws: ClientConnection, screen: curses.window) -> None:
+    def __init__(
+        self, ws: Connection, screen: curses.window, cache: Optional[VaultCache] = None
+    ) -> None:
         self.ws = ws
+        self.cache = cache
         self.screen = screen
         self.screen_size = screen.getmaxyx()
         if self.screen_size[0] < 24 or self.screen_size[1] < 80:
@@ -59,8 +63,18 @@ class Console:
             else:
                 self.start_menu.menu.erase()
                 await self.main_menu.run()
-        if self.vault is not None and self.user is not None:
-            await client.save_vault(self.ws, self.user, self.vault)
+            if not self.running and not await self.sync():
+                self.running = not self.msgbox.confirm(
+                    "Vault changes were not saved, quit anyway?"
+                )
+
+    async def sync(self) -> bool:
+        if self.vault is None or self.user is None:
+            return True
+        if await client.sync_vault(self.ws, self.user, self.vault, self.cache):
+            return True
+        self.msgbox.error("Failed to save vault, changes are kept until next save")
+        return False
 
     def escape(self, key: str) -> bool:
         try:
@@ -465,10 +479,10 @@ class MainMenu(Menu):
         if self.pos[0] == 2:
             await self.console.settings_window.run()
         if self.pos[0] == 3:
-            if self.console.vault is not None and self.console.user is not None:
-                await client.save_vault(
-                    self.console.ws, self.console.user, self.console.vault
-                )
+            if not await self.console.sync() and not self.console.msgbox.confirm(
+                "Vault changes were not saved, log out anyway?"
+            ):
+                return
             self.console.user = {}
             self.console.vault = None
             self.pos = (0, 0)
@@ -651,9 +665,7 @@ class ServiceWindow(Window):
         if key.lower() == "a":
             self.console.add_service.run()
             self.update_service_list()
-            await client.save_vault(
-                self.console.ws, self.console.user, self.console.vault
-            )
+            await self.console.sync()
         if key == "/":
             self.console.msgbox.search()
         if self.options is not None:
@@ -666,15 +678,11 @@ class ServiceWindow(Window):
             if key.lower() == "d":
                 self.delete_service()
                 self.update_service_list()
-                await client.save_vault(
-                    self.console.ws, self.console.user, self.console.vault
-                )
+                await self.console.sync()
             if key.lower() == "e" and self.service_list is not None:
                 self.console.edit_service.run(self.service_list[self.pos[0]])
                 self.update_service_list()
-                await client.save_vault(
-                    self.console.ws, self.console.user, self.console.vault
-                )
+                await self.console.sync()
             if key.lower() == "y":
                 self.copy_password()
         self.draw()
@@ -782,9 +790,11 @@ class VaultWindow(Window):
     async def select(self) -> None:
         if self.options is None or self.vault_list is None or self.console.user is None:
             return
+        if not await self.console.sync():
+            return
         vault = self.vault_list[self.pos[0]]
         self.console.vault = await client.get_vault(
-            self.console.ws, self.console.user, vault["name"]
+            self.console.ws, self.console.user, vault["name"], self.console.cache
         )
         if self.console.vault is not None:
             self.console.msgbox.info(f"Selected vault: {self.console.vault.name}")
@@ -803,7 +813,7 @@ class VaultWindow(Window):
         vault_name = self.options[self.pos[0]]
         if type(vault_name) is str:
             if not await client.delete_vault(
-                self.console.ws, self.console.user, vault_name
+                self.console.ws, self.console.user, vault_name, self.console.cache
             ):
                 self.console.msgbox.error("Failed to delete vault")
             await self.update_vault_list()
@@ -995,7 +1005,6 @@ class ChangeEmailWidget(Widget):
             self.console.msgbox.error("Failed to change email")
             self.clear()
             return
-        self.console.user = await client.auth(self.console.ws, new_email, mpass)
         self.console.msgbox.info("Email changed")
         self.clear()
 
@@ -1052,9 +1061,6 @@ class ChangeMpassWidget(Widget):
             self.console.msgbox.error("Failed to change master password")
             self.clear()
             return
-        self.console.user = await client.auth(
-            self.console.ws, self.console.user["email"], new_mpass
-        )
         self.console.msgbox.info("Master password changed")
         self.clear()
 
@@ -1231,6 +1237,8 @@ class ShowServiceWidget(Widget):
         self.clear()
 
 
-async def run(screen: curses.window, ws: ClientConnection) -> None:
-    app = Console(ws, screen)
+async def run(
+    screen: curses.window, ws: Connection, cache: Optional[VaultCache] = None
+) -> None:
+    app = Console(ws, screen, cache)
     await app.run()
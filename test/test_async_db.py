@@ -0,0 +1,187 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import Mock
+
+from src.model.async_db import AsyncDatabase
+from src.model.backup_store import BackupStore
+from src.model.db import Database
+
+
+class TestAsyncDatabase(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.db_file = Path("test.db")
+        self.db = AsyncDatabase(self.db_file, readers=2)
+        self.user_email = "test_user"
+        self.user_auth_key = "test_auth_key"
+
+    async def asyncTearDown(self) -> None:
+        self.db.close()
+        os.remove(self.db_file)
+
+    async def test_wal_mode(self) -> None:
+        mode = self.db.writer.cursor.execute("PRAGMA journal_mode").fetchone()
+        self.assertEqual(mode[0], "wal")
+
+    async def test_add_user(self) -> None:
+        await self.db.add_user(self.user_email, self.user_auth_key)
+        uid = await self.db.get_id(self.user_email)
+        user = await self.db.get_user(uid)
+        self.assertEqual(user["email"], self.user_email)
+        self.assertEqual(await self.db.get_auth_key(uid), self.user_auth_key)
+        with self.assertRaises(Exception):
+            await self.db.add_user(self.user_email, self.user_auth_key)
+
+    async def test_write_rollback(self) -> None:
+        def add_and_fail(database: Database) -> None:
+            database.add_user(self.user_email, self.user_auth_key)
+            raise Exception("test failure")
+
+        with self.assertRaises(Exception):
+            await self.db.write(add_and_fail)
+        with self.assertRaises(Exception):
+            await self.db.get_id(self.user_email)
+
+    async def test_readers_are_readonly(self) -> None:
+        with self.assertRaises(Exception):
+            await self.db.read(Database.add_user, self.user_email, "key")
+
+    async def test_vaults(self) -> None:
+        await self.db.add_user(self.user_email, self.user_auth_key)
+        uid = await self.db.get_id(self.user_email)
+        await self.db.add_vault(uid, "test_vault", "test_key", "test_data")
+        await self.db.update_vault(uid, "test_vault", "new_data")
+        await self.db.update_vault_key(uid, "test_vault", "new_key")
+        await self.db.update_vault_name(uid, "test_vault", "new_vault")
+        vault = await self.db.get_vault(uid, "new_vault")
+        self.assertEqual(vault["data"], "new_data")
+        self.assertEqual(vault["key"], "new_key")
+        vaults = await self.db.get_vaults(uid)
+        self.assertIsNotNone(vaults)
+        await self.db.delete_vault(uid, "new_vault")
+        self.assertIsNone(await self.db.get_vaults(uid))
+
+    async def test_backup(self) -> None:
+        await self.db.add_user(self.user_email, self.user_auth_key)
+        with tempfile.TemporaryDirectory() as backup_dir:
+            backup, _ = await asyncio.gather(
+                self.db.backup(Path(backup_dir)),
+                self.db.add_user("other_user", self.user_auth_key),
+            )
+            self.assertTrue(backup["path"].exists())
+            self.assertFalse(list(Path(backup_dir).glob("*.tmp")))
+        self.assertEqual(self.db.readers.qsize(), self.db.reader_count)
+
+    async def test_snapshot(self) -> None:
+        await self.db.add_user(self.user_email, self.user_auth_key)
+        uid = await self.db.get_id(self.user_email)
+        await self.db.add_vault(uid, "test_vault", "test_key", "test_data")
+        with tempfile.TemporaryDirectory() as backup_dir:
+            store = BackupStore(Path(backup_dir))
+            snapshot = await self.db.snapshot(store)
+            self.assertEqual(store.manifests(), [snapshot["path"]])
+            self.assertEqual(len(list(store.blob_dir.glob("*/*"))), 1)
+
+    async def test_concurrent_reads(self) -> None:
+        await self.db.add_user(self.user_email, self.user_auth_key)
+        uid = await self.db.get_id(self.user_email)
+        users = await asyncio.gather(*[self.db.get_user(uid) for _ in range(20)])
+        self.assertTrue(all(user["id"] == uid for user in users))
+        self.assertEqual(self.db.readers.qsize(), self.db.reader_count)
+
+    async def test_group_commit(self) -> None:
+        self.db.commit_window = 0.01
+        commit = Mock(wraps=self.db.writer.commit)
+        self.db.writer.commit = commit  # type: ignore[method-assign]
+        emails = [f"user_{i}" for i in range(10)]
+        await asyncio.gather(*[self.db.add_user(email, "key") for email in emails])
+        self.assertEqual(commit.call_count, 1)
+        for email in emails:
+            self.assertIsNotNone(await self.db.get_id(email))
+
+    async def test_group_commit_isolation(self) -> None:
+        await self.db.add_user(self.user_email, self.user_auth_key)
+        self.db.commit_window = 0.01
+        results = await asyncio.gather(
+            self.db.add_user("user_1", "key"),
+            self.db.add_user(self.user_email, "key"),
+            self.db.add_user("user_2", "key"),
+            return_exceptions=True,
+        )
+        self.assertIsInstance(results[1], Exception)
+        self.assertEqual(results[0], await self.db.get_id("user_1"))
+        self.assertEqual(results[2], await self.db.get_id("user_2"))
+        self.assertEqual(await self.db.get_auth_key(1), self.user_auth_key)
+
+    async def test_max_batch(self) -> None:
+        self.db.max_batch = 3
+        commit = Mock(wraps=self.db.writer.commit)
+        self.db.writer.commit = commit  # type: ignore[method-assign]
+        await asyncio.gather(*[self.db.add_user(f"u_{i}", "key") for i in range(7)])
+        self.assertEqual(commit.call_count, 3)
+
+    async def test_fair_share(self) -> None:
+        order = []
+
+        def write(database: Database, uid: int, data: bytes) -> None:
+            order.append(uid)
+
+        self.db.commit_window = 0.01
+        commit = Mock(wraps=self.db.writer.commit)
+        self.db.writer.commit = commit  # type: ignore[method-assign]
+        heavy = [self.db.write(write, 1, bytes(512 * 1024), uid=1) for _ in range(4)]
+        light = [self.db.write(write, 2, b"data", uid=2) for _ in range(4)]
+        await asyncio.gather(*heavy, *light)
+        self.assertEqual(order, [2, 2, 2, 2, 1, 1, 1, 1])
+        self.assertEqual(commit.call_count, 2)
+
+    async def test_usage(self) -> None:
+        await self.db.add_user(self.user_email, self.user_auth_key)
+        uid = await self.db.get_id(self.user_email)
+        await self.db.add_vault(uid, "test_vault", "test_key", "x" * 1000)
+        await self.db.get_vault(uid, "test_vault")
+        usage = self.db.usage[uid]
+        self.assertEqual(usage["requests"], 2)
+        self.assertGreater(usage["db_time"], 0)
+        self.assertGreaterEqual(usage["bytes_written"], 1000)
+        self.assertIn(uid, dict(self.db.top_usage()))
+
+    async def test_cache(self) -> None:
+        uid = await self.db.add_user(self.user_email, self.user_auth_key)
+        await self.db.add_vault(uid, "test_vault", "test_key", "test_data")
+        self.assertEqual(await self.db.get_id(self.user_email), uid)
+        info = await self.db.get_vault_info(uid, "test_vault")
+        reads = self.db.usage[uid]["requests"]
+        self.assertEqual(await self.db.get_id(self.user_email), uid)
+        self.assertEqual(await self.db.get_auth_key(uid), self.user_auth_key)
+        self.assertEqual(await self.db.get_auth_key(uid), self.user_auth_key)
+        self.assertEqual(await self.db.get_vault_info(uid, "test_vault"), info)
+        self.assertEqual(self.db.usage[uid]["requests"], reads + 1)
+        self.assertGreaterEqual(self.db.cache.hits, 3)
+        await self.db.update_vault(uid, "test_vault", "new_data")
+        info = await self.db.get_vault_info(uid, "test_vault")
+        self.assertEqual(info["version"], 2)
+        await self.db.update_email(uid, "new_email", "new_auth_key")
+        self.assertIsNone(await self.db.get_login(self.user_email))
+        self.assertEqual(await self.db.get_auth_key(uid), "new_auth_key")
+        await self.db.delete_user(uid)
+        self.assertIsNone(await self.db.get_login("new_email"))
+        with self.assertRaises(Exception):
+            await self.db.get_vault_info(uid, "test_vault")
+
+    async def test_shared_cache(self) -> None:
+        uid = await self.db.add_user(self.user_email, self.user_auth_key)
+        first = AsyncDatabase(self.db_file, readers=1, shared=True)
+        second = AsyncDatabase(self.db_file, readers=1, shared=True)
+        try:
+            self.assertEqual(await first.get_auth_key(uid), self.user_auth_key)
+            await second.update_email(uid, self.user_email, "new_auth_key")
+            self.assertEqual(await first.get_auth_key(uid), "new_auth_key")
+            await self.db.update_email(uid, self.user_email, "other_auth_key")
+            self.assertEqual(await first.get_auth_key(uid), "other_auth_key")
+            self.assertEqual(await self.db.get_auth_key(uid), "other_auth_key")
+        finally:
+            first.close()
+            second.close()
@@ -0,0 +1,109 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+
+from src.model.backup_store import BackupStore
+from src.model.blob_store import BlobStore
+from src.model.db import Database
+
+
+class TestBackupStore(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root = Path(self.temp_dir.name)
+        self.db = Database(self.root / "users.db")
+        self.store = BackupStore(self.root / "backups")
+        self.db.add_user("test_user", "test_auth_key")
+        self.uid = self.db.get_id("test_user")
+        self.db.add_vault(self.uid, "vault_1", "key_1", "data_1" * 100)
+        self.db.add_vault(self.uid, "vault_2", "key_2", "data_2" * 100)
+        self.db.sync_vault(
+            self.uid,
+            "vault_2",
+            1,
+            [{"id": 1, "data": b"record_1"}, {"id": 2, "data": b"record_2"}],
+        )
+        self.db.commit()
+
+    def tearDown(self) -> None:
+        self.db.close()
+        self.temp_dir.cleanup()
+
+    def blobs(self) -> int:
+        return len(list(self.store.blob_dir.glob("*/*")))
+
+    def dump(self, path: Path) -> list:
+        connection = sqlite3.connect(path)
+        rows = [
+            connection.execute(f"SELECT * FROM {table} ORDER BY 1, 2").fetchall()
+            for table in ["users", "vaults", "records"]
+        ]
+        connection.close()
+        return rows
+
+    def test_snapshot_dedup(self) -> None:
+        first = self.store.snapshot(self.db.connection)
+        self.assertEqual(self.blobs(), 4)
+        second = self.store.snapshot(self.db.connection)
+        self.assertEqual(self.blobs(), 4)
+        self.assertLess(second["size"], first["size"])
+        self.db.update_vault(self.uid, "vault_1", "new_data")
+        self.db.add_vault(self.uid, "vault_3", "key_3", "data_1" * 100)
+        self.db.commit()
+        self.store.snapshot(self.db.connection)
+        self.assertEqual(self.blobs(), 5)
+        self.assertEqual(len(self.store.manifests()), 3)
+
+    def test_restore(self) -> None:
+        manifest = self.store.snapshot(self.db.connection)["path"]
+        self.db.delete_vault(self.uid, "vault_2")
+        self.db.commit()
+        restored = self.root / "restored.db"
+        self.store.restore(manifest, restored)
+        self.db.close()
+        self.db = Database(self.root / "users.db")
+        self.db.add_vault(self.uid, "vault_2", "key_2", "data_2" * 100)
+        self.db.sync_vault(
+            self.uid,
+            "vault_2",
+            1,
+            [{"id": 1, "data": b"record_1"}, {"id": 2, "data": b"record_2"}],
+        )
+        self.db.commit()
+        expected = self.dump(self.root / "users.db")
+        actual = self.dump(restored)
+        self.assertEqual(actual[0], expected[0])
+        self.assertEqual(len(actual[1]), 2)
+        self.assertEqual(actual[2], expected[2])
+        with self.assertRaises(Exception):
+            self.store.restore(manifest, restored)
+
+    def test_prune(self) -> None:
+        self.store.snapshot(self.db.connection)
+        self.db.update_vault(self.uid, "vault_1", "new_data")
+        self.db.commit()
+        latest = self.store.snapshot(self.db.connection)["path"]
+        self.assertEqual(self.store.prune(1), 1)
+        self.assertEqual(self.store.manifests(), [latest])
+        self.assertEqual(self.blobs(), 4)
+        restored = self.root / "restored.db"
+        self.store.restore(latest, restored)
+        self.assertTrue(os.path.exists(restored))
+
+    def test_external_blobs(self) -> None:
+        blobs = BlobStore(self.root / "data")
+        self.db.blobs = blobs
+        self.db.blob_threshold = 64
+        self.db.add_vault(self.uid, "vault_3", "key_3", b"external" * 100)
+        self.db.commit()
+        manifest = self.store.snapshot(self.db.connection, blobs)["path"]
+        restored = self.root / "restored.db"
+        self.store.restore(manifest, restored)
+        connection = sqlite3.connect(restored)
+        row = connection.execute(
+            "SELECT data, blob, blob_size FROM vaults WHERE name = 'vault_3'"
+        ).fetchone()
+        connection.close()
+        self.assertEqual(row, (b"external" * 100, None, None))
@@ -0,0 +1,34 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from src.model.blob_store import BlobStore
+
+
+class TestBlobStore(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root = Path(self.temp_dir.name)
+        self.store = BlobStore(self.root / "blobs")
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def test_put_read(self) -> None:
+        digest = self.store.put(b"vault_data" * 1000)
+        self.assertEqual(self.store.put(b"vault_data" * 1000), digest)
+        data = self.store.read(digest)
+        self.assertIsInstance(data, memoryview)
+        self.assertEqual(bytes(data), b"vault_data" * 1000)
+        self.assertEqual(bytes(self.store.read(self.store.put(b""))), b"")
+        self.store.delete(digest)
+        self.assertRaises(FileNotFoundError, self.store.read, digest)
+
+    def test_export_and_collect(self) -> None:
+        kept = self.store.put(b"kept")
+        removed = self.store.put(b"removed")
+        self.store.export(kept, self.root / "backup")
+        self.assertEqual(BlobStore(self.root / "backup").read(kept), b"kept")
+        self.assertEqual(self.store.collect_garbage({kept}), 1)
+        self.assertFalse(self.store.path(removed).exists())
+        self.assertTrue(self.store.path(kept).exists())
@@ -0,0 +1,68 @@
+import unittest
+from unittest.mock import patch
+
+from src.model.cache import MISSING, Cache
+from src.model.metrics import cache_collector
+
+
+class TestCache(unittest.TestCase):
+    def test_get_put(self) -> None:
+        cache = Cache(10, 60)
+        self.assertIs(cache.get("a"), MISSING)
+        cache.put("a", 1, (), cache.generation)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_lru(self) -> None:
+        cache = Cache(2, 60)
+        cache.put("a", 1, ("tag",), cache.generation)
+        cache.put("b", 2, ("tag",), cache.generation)
+        cache.get("a")
+        cache.put("c", 3, (), cache.generation)
+        self.assertIs(cache.get("b"), MISSING)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.evictions, 1)
+        self.assertEqual(cache.tags, {"tag": {"a"}})
+
+    def test_ttl(self) -> None:
+        cache = Cache(10, 5)
+        with patch("time.monotonic", return_value=100.0):
+            cache.put("a", 1, ("tag",), cache.generation)
+        with patch("time.monotonic", return_value=104.0):
+            self.assertEqual(cache.get("a"), 1)
+        with patch("time.monotonic", return_value=106.0):
+            self.assertIs(cache.get("a"), MISSING)
+        self.assertEqual(cache.tags, {})
+
+    def test_invalidate(self) -> None:
+        cache = Cache(10, 60)
+        cache.put("a", 1, ("user", "vaults"), cache.generation)
+        cache.put("b", 2, ("vaults",), cache.generation)
+        cache.put("c", 3, ("other",), cache.generation)
+        cache.invalidate("vaults")
+        self.assertIs(cache.get("a"), MISSING)
+        self.assertIs(cache.get("b"), MISSING)
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual(cache.tags, {"other": {"c"}})
+
+    def test_stale_put(self) -> None:
+        cache = Cache(10, 60)
+        generation = cache.generation
+        cache.invalidate("user")
+        cache.put("a", 1, ("user",), generation)
+        self.assertIs(cache.get("a"), MISSING)
+
+    def test_disabled(self) -> None:
+        cache = Cache(0, 60)
+        cache.put("a", 1, (), cache.generation)
+        self.assertIs(cache.get("a"), MISSING)
+
+    def test_collector(self) -> None:
+        cache = Cache(10, 60)
+        cache.put("a", 1, (), cache.generation)
+        cache.get("a")
+        cache.get("b")
+        text = "\n".join(cache_collector(cache))
+        self.assertIn("ljk_cache_hits_total 1", text)
+        self.assertIn("ljk_cache_misses_total 1", text)
+        self.assertIn("ljk_cache_entries 1", text)
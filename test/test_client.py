@@ -1,15 +1,23 @@
 import asyncio
 import logging
 import os
+import tempfile
 import unittest
+from pathlib import Path
 from typing import Optional
+from unittest.mock import patch
 
 import websockets
 
 import server
-from src.model import db, encryption
+from src.model import codec, encryption, handlers
+from src.model.async_db import AsyncDatabase
+from src.model.hasher import Hasher
+from src.model.metrics import Metrics
 from src.model.vault import Vault
 from src.presenter import client
+from src.presenter.cache import VaultCache
+from src.presenter.connection import Connection
 
 
 class TestClient(unittest.IsolatedAsyncioTestCase):
@@ -17,18 +25,31 @@ class TestClient(unittest.IsolatedAsyncioTestCase):
         self.db_path = "test.db"
         if os.path.exists(self.db_path):
             os.remove(self.db_path)
-        self.db = db.Database(self.db_path)
+        self.db = AsyncDatabase(Path(self.db_path))
+        self.hasher = Hasher(1)
         logging.basicConfig(
             filename="test.log",
             level=logging.DEBUG,
             format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
         )
+        self.metrics = Metrics()
         self.server = asyncio.create_task(
-            server.run_server("0.0.0.0", 8765, None, self.db)
-        )
-        self.ws = await websockets.connect(
-            "ws://localhost:8765", ssl=None, ping_interval=None
+            server.run_server(
+                "0.0.0.0", 8765, None, self.db, self.hasher, metrics=self.metrics
+            )
         )
+        for _ in range(50):
+            try:
+                websocket = await websockets.connect(
+                    "ws://localhost:8765",
+                    ssl=None,
+                    ping_interval=None,
+                    max_size=codec.MAX_MESSAGE_SIZE,
+                )
+                break
+            except ConnectionRefusedError:
+                await asyncio.sleep(0.1)
+        self.ws = Connection(websocket)
         self.email = "test_email"
         self.mpass = "master_pass"
         self.vault_name = "vault_name"
@@ -86,6 +107,166 @@ class TestClient(unittest.IsolatedAsyncioTestCase):
         save = await client.save_vault(self.ws, user, self.vault)
         self.assertTrue(save)
 
+    async def test_large_vault(self) -> None:
+        await client.register(self.ws, self.email, self.mpass)
+        user = await client.auth(self.ws, self.email, self.mpass)
+        if user is None:
+            self.fail("user is none")
+        await client.create_vault(self.ws, user, self.vault_name)
+        vault = await client.get_vault(self.ws, user, self.vault_name)
+        if vault is None:
+            self.fail("vault is none")
+        self.vault = vault
+        notes = os.urandom(1024 * 1024).hex()
+        self.vault.add(self.service, self.user, self.password, notes)
+        self.assertTrue(await client.save_vault(self.ws, user, self.vault))
+        fetched = await client.get_vault(self.ws, user, self.vault_name)
+        if fetched is None:
+            self.fail("vault is none")
+        services = fetched.services()
+        fetched.rm()
+        if services is None:
+            self.fail("services is none")
+        self.assertEqual(services[0]["notes"], notes)
+
+    async def test_vault_cache(self) -> None:
+        await client.register(self.ws, self.email, self.mpass)
+        user = await client.auth(self.ws, self.email, self.mpass)
+        if user is None:
+            self.fail("user is none")
+        await client.create_vault(self.ws, user, self.vault_name)
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = VaultCache(Path(cache_dir))
+            vault = await client.get_vault(self.ws, user, self.vault_name, cache)
+            if vault is None:
+                self.fail("vault is none")
+            self.vault = vault
+            cached = cache.get(user["id"], self.vault_name)
+            if cached is None:
+                self.fail("vault not cached")
+            self.vault.add(self.service, self.user, self.password, self.notes)
+            self.assertTrue(await client.save_vault(self.ws, user, self.vault, cache))
+            updated = cache.get(user["id"], self.vault_name)
+            if updated is None:
+                self.fail("vault not cached")
+            self.assertNotEqual(updated["tag"], cached["tag"])
+            self.vault.rm()
+            vault = await client.get_vault(self.ws, user, self.vault_name, cache)
+            if vault is None:
+                self.fail("vault is none")
+            self.vault = vault
+            self.assertIsNotNone(self.vault.search(self.service))
+            await client.delete_vault(self.ws, user, self.vault_name, cache)
+            self.assertIsNone(cache.get(user["id"], self.vault_name))
+
+    async def test_sync_vault(self) -> None:
+        await client.register(self.ws, self.email, self.mpass)
+        user = await client.auth(self.ws, self.email, self.mpass)
+        if user is None:
+            self.fail("user is none")
+        await client.create_vault(self.ws, user, self.vault_name)
+        vault = await client.get_vault(self.ws, user, self.vault_name)
+        if vault is None:
+            self.fail("vault is none")
+        self.vault = vault
+        self.vault.add(self.service, self.user, self.password, self.notes)
+        self.vault.add("other_service", self.user, self.password, self.notes)
+        self.assertTrue(await client.sync_vault(self.ws, user, self.vault))
+        self.assertEqual(self.vault.changes, set())
+        services = self.vault.search("other_service")
+        if services is None:
+            self.fail("services is none")
+        self.vault.delete(services[0]["id"])
+        with patch.object(handlers, "COMPACT_RECORDS", 2):
+            self.assertTrue(await client.sync_vault(self.ws, user, self.vault))
+        self.vault.add("new_service", self.user, self.password, self.notes)
+        self.assertTrue(await client.sync_vault(self.ws, user, self.vault))
+        synced = await client.get_vault(self.ws, user, self.vault_name)
+        if synced is None:
+            self.fail("vault is none")
+        self.assertEqual(synced.services(), self.vault.services())
+        self.assertEqual(synced.version, self.vault.version)
+        synced.rm()
+
+    async def test_save_vault_conflict(self) -> None:
+        await client.register(self.ws, self.email, self.mpass)
+        user = await client.auth(self.ws, self.email, self.mpass)
+        if user is None:
+            self.fail("user is none")
+        await client.create_vault(self.ws, user, self.vault_name)
+        vault = await client.get_vault(self.ws, user, self.vault_name)
+        other = await client.get_vault(self.ws, user, self.vault_name)
+        if vault is None or other is None:
+            self.fail("vault is none")
+        self.vault = vault
+        self.vault.add(self.service, self.user, self.password, self.notes)
+        other.add("other_service", self.user, self.password, self.notes)
+        self.assertTrue(await client.sync_vault(self.ws, user, self.vault))
+        self.assertTrue(await client.sync_vault(self.ws, user, other))
+        self.vault.add("third_service", self.user, self.password, self.notes)
+        self.assertTrue(await client.save_vault(self.ws, user, self.vault))
+        synced = await client.get_vault(self.ws, user, self.vault_name)
+        if synced is None:
+            self.fail("vault is none")
+        services = synced.services()
+        if services is None:
+            self.fail("services is none")
+        self.assertEqual(
+            sorted(service["service"] for service in services),
+            sorted([self.service, "other_service", "third_service"]),
+        )
+        other.rm()
+        synced.rm()
+
+    async def test_command_metrics(self) -> None:
+        await client.register(self.ws, self.email, self.mpass)
+        response = await self.ws.request({"command": "get_vaults"})
+        self.assertEqual(response["status"], "unauthorized")
+        user = await client.auth(self.ws, self.email, self.mpass)
+        if user is None:
+            self.fail("user is none")
+        response = await self.ws.request({"command": "get_vault"})
+        self.assertEqual(response["status"], "failed")
+        self.assertEqual(response["error"], "Missing field vault_name")
+        await client.get_vaults(self.ws, user)
+        self.assertEqual(self.metrics.latency["auth"].count, 1)
+        self.assertEqual(self.metrics.latency["get_vaults"].count, 2)
+        self.assertEqual(self.metrics.errors["get_vaults"], 1)
+        self.assertEqual(self.metrics.errors["get_vault"], 1)
+        self.assertGreater(self.metrics.request_bytes["auth"], 0)
+        self.assertGreater(self.metrics.response_bytes["auth"], 0)
+        self.assertIn('ljk_scheduler_running{cost="hash"} 0', self.metrics.render())
+
+    async def test_session_required(self) -> None:
+        await client.register(self.ws, self.email, self.mpass)
+        response = await self.ws.request({"command": "get_vaults", "uid": 1})
+        self.assertEqual(response["status"], "unauthorized")
+        other_email = "other_email"
+        await client.register(self.ws, other_email, self.mpass)
+        user = await client.auth(self.ws, other_email, self.mpass)
+        if user is None:
+            self.fail("user is none")
+        await client.create_vault(self.ws, {**user, "id": 1}, self.vault_name)
+        vaults = await client.get_vaults(self.ws, {**user, "id": 1})
+        if vaults is None:
+            self.fail("vaults is none")
+        self.assertEqual(len(vaults), 1)
+        self.ws.token = None
+        self.assertIsNone(await client.get_vaults(self.ws, user))
+        first_user = await client.auth(self.ws, self.email, self.mpass)
+        if first_user is None:
+            self.fail("user is none")
+        self.assertIsNone(await client.get_vaults(self.ws, first_user))
+
+    async def test_auth_throttled(self) -> None:
+        msg = {"command": "auth", "email": self.email, "mkey": b"mkey"}
+        responses = await asyncio.gather(*[self.ws._request(msg) for _ in range(8)])
+        throttled = [r for r in responses if r["status"] == "retry"]
+        self.assertGreaterEqual(len(throttled), 3)
+        self.assertGreater(throttled[0]["retry_after"], 0)
+        response = await self.ws.request({"command": "get_vaults"})
+        self.assertEqual(response["status"], "unauthorized")
+
     async def test_create_vault(self) -> None:
         await client.register(self.ws, self.email, self.mpass)
         user = await client.auth(self.ws, self.email, self.mpass)
@@ -161,6 +342,33 @@ class TestClient(unittest.IsolatedAsyncioTestCase):
         user = await client.auth(self.ws, self.email, self.mpass)
         self.assertIsNone(user)
 
+    async def test_deleted_account_token(self) -> None:
+        await client.register(self.ws, self.email, self.mpass)
+        user = await client.auth(self.ws, self.email, self.mpass)
+        if user is None:
+            self.fail("user is none")
+        token = self.ws.token
+        self.assertTrue(await client.delete_account(self.ws, user, self.mpass))
+        await client.register(self.ws, "other_email", self.mpass)
+        self.assertNotEqual(await self.db.get_id("other_email"), user["id"])
+        self.ws.token = token
+        for message in [
+            {"command": "get_vaults", "uid": user["id"], "after": 0},
+            {
+                "command": "batch",
+                "uid": user["id"],
+                "operations": [{"command": "change_auth_key", "new_mkey": "key"}],
+            },
+        ]:
+            response = await self.ws.request(message)
+            self.assertEqual(response["status"], "unauthorized", response)
+
+    async def test_invalid_command_type(self) -> None:
+        for command in [["get_vaults"], {"name": "get_vaults"}, 1]:
+            response = await self.ws.request({"command": command})
+            self.assertEqual(response["status"], "failed", response)
+        self.assertTrue(await client.register(self.ws, self.email, self.mpass))
+
     async def test_update_vault_key(self) -> None:
         await client.register(self.ws, self.email, self.mpass)
         user = await client.auth(self.ws, self.email, self.mpass)
@@ -171,8 +379,30 @@ class TestClient(unittest.IsolatedAsyncioTestCase):
         status = await client.update_vault_key(self.ws, user, self.vault_name, new_vkey)
         self.assertTrue(status)
 
+    async def test_concurrent_requests(self) -> None:
+        await client.register(self.ws, self.email, self.mpass)
+        user = await client.auth(self.ws, self.email, self.mpass)
+        if user is None:
+            self.fail("user is none")
+        vault_names = [f"vault_{i}" for i in range(5)]
+        created = await asyncio.gather(
+            *[client.create_vault(self.ws, user, name) for name in vault_names]
+        )
+        self.assertTrue(all(created))
+        vaults = await asyncio.gather(
+            *[client.get_vault(self.ws, user, name) for name in vault_names]
+        )
+        for name, vault in zip(vault_names, vaults):
+            if vault is None:
+                self.fail("vault is none")
+            self.assertEqual(vault.name, name)
+            vault.rm()
+
     async def asyncTearDown(self) -> None:
         self.server.cancel()
+        await asyncio.gather(self.server, return_exceptions=True)
+        self.hasher.close()
+        self.db.close()
         if os.path.exists(self.db_path):
             os.remove(self.db_path)
         await self.ws.close()
@@ -0,0 +1,63 @@
+import os
+import pickle
+import unittest
+
+from src.model import codec
+
+
+class TestCodec(unittest.TestCase):
+    def test_round_trip(self) -> None:
+        msg = {
+            "command": "save_vault",
+            "id": 42,
+            "uid": -1,
+            "vault_name": "vault æøå",
+            "data": b"\x00\x01\x02",
+            "vaults": [{"id": 1, "name": "a", "key": b"k"}, {"id": 2, "name": "b"}],
+            "custom_field": None,
+            "flag": True,
+            "other_flag": False,
+            "ratio": 0.5,
+        }
+        self.assertEqual(codec.decode(codec.dumps(msg)), msg)
+
+    def test_tuples_decode_as_lists(self) -> None:
+        msg = {"vaults": (1, 2)}
+        self.assertEqual(codec.decode(codec.dumps(msg)), {"vaults": [1, 2]})
+
+    def test_small_message_is_one_buffer(self) -> None:
+        msg = {"command": "get_vault", "uid": 1, "vault_name": "test"}
+        encoded = codec.encode(msg)
+        self.assertIsInstance(encoded, bytes)
+        self.assertLess(len(encoded), len(pickle.dumps(msg)))
+
+    def test_large_blob_is_not_copied(self) -> None:
+        blob = os.urandom(codec.BLOB_THRESHOLD * 4)
+        msg = {"command": "save_vault", "data": blob, "vault_name": "test"}
+        frames = codec.encode(msg)
+        if not isinstance(frames, list):
+            self.fail("frames is not a list")
+        blob_frames = [f for f in frames if isinstance(f, memoryview)]
+        self.assertEqual(len(blob_frames), 1)
+        self.assertIs(blob_frames[0].obj, blob)
+        self.assertEqual(codec.decode(b"".join(frames)), msg)
+
+    def test_invalid_messages(self) -> None:
+        valid = codec.dumps({"command": "auth", "email": "test_email"})
+        self.assertRaises(codec.CodecError, codec.decode, b"")
+        self.assertRaises(codec.CodecError, codec.decode, b"XX" + valid[2:])
+        self.assertRaises(
+            codec.CodecError, codec.decode, valid[:2] + b"\x09" + valid[3:]
+        )
+        self.assertRaises(codec.CodecError, codec.decode, valid[:-1])
+        self.assertRaises(codec.CodecError, codec.decode, valid + b"\x00")
+        self.assertRaises(codec.CodecError, codec.decode, pickle.dumps({"a": 1}))
+
+    def test_unsupported_type(self) -> None:
+        self.assertRaises(codec.CodecError, codec.encode, {"command": object()})
+        self.assertRaises(codec.CodecError, codec.encode, {"id": 2**64})
+
+    def test_older_version(self) -> None:
+        encoded = codec.dumps({"command": "auth", "email": "test_email"})
+        older = encoded[:2] + bytes([1]) + encoded[3:]
+        self.assertEqual(codec.decode(older)["email"], "test_email")
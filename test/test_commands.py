@@ -0,0 +1,39 @@
+import unittest
+
+from src.model import handlers
+from src.model.commands import COMMANDS
+from src.model.scheduler import HASH, READ, WRITE
+
+
+class TestCommands(unittest.TestCase):
+    def test_registry(self) -> None:
+        self.assertEqual(COMMANDS["auth"].cost, HASH)
+        self.assertEqual(COMMANDS["save_vault"].cost, WRITE)
+        self.assertEqual(COMMANDS["get_vault"].cost, READ)
+        self.assertTrue(COMMANDS["register"].public)
+        self.assertFalse(COMMANDS["get_vault"].public)
+        self.assertIs(COMMANDS["get_vault"].handler, handlers.get_vault)
+        self.assertEqual(
+            COMMANDS["auth"].params,
+            [
+                "ws",
+                "msg",
+                "database",
+                "hasher",
+                "sessions",
+                "binding",
+                "rhost",
+                "rport",
+            ],
+        )
+
+    def test_validate(self) -> None:
+        command = COMMANDS["update_vault_name"]
+        msg = {"vault_name": "vault", "new_vault_name": "new_vault"}
+        self.assertIsNone(command.validate(msg))
+        self.assertEqual(
+            command.validate({"vault_name": "vault"}), "Missing field new_vault_name"
+        )
+        self.assertEqual(
+            command.validate({**msg, "vault_name": 1}), "Invalid field vault_name"
+        )
@@ -0,0 +1,75 @@
+import asyncio
+import unittest
+from typing import Any, AsyncIterator, Dict, List, Optional, Union, cast
+
+from websockets import ClientConnection
+
+from src.model import codec
+from src.presenter.connection import Connection
+
+
+class FakeWebSocket:
+    def __init__(self) -> None:
+        self.sent: List[Dict[str, Any]] = []
+        self.incoming: asyncio.Queue[Optional[bytes]] = asyncio.Queue()
+
+    async def send(self, message: Union[bytes, List[bytes]]) -> None:
+        if isinstance(message, list):
+            message = b"".join(message)
+        self.sent.append(codec.decode(message))
+
+    async def close(self) -> None:
+        await self.incoming.put(None)
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        while (message := await self.incoming.get()) is not None:
+            yield message
+
+
+class TestConnection(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.websocket = FakeWebSocket()
+        self.connection = Connection(cast(ClientConnection, self.websocket))
+
+    async def asyncTearDown(self) -> None:
+        await self.connection.close()
+
+    async def reply(self, index: int, response: Dict[str, Any]) -> None:
+        request_id = self.websocket.sent[index]["id"]
+        await self.websocket.incoming.put(codec.dumps({**response, "id": request_id}))
+
+    async def test_request(self) -> None:
+        request = asyncio.create_task(self.connection.request({"command": "test"}))
+        await asyncio.sleep(0)
+        self.assertEqual(self.websocket.sent[0]["command"], "test")
+        await self.reply(0, {"status": "success"})
+        response = await request
+        self.assertEqual(response["status"], "success")
+        self.assertEqual(self.connection.waiting, {})
+
+    async def test_out_of_order_responses(self) -> None:
+        first = asyncio.create_task(self.connection.request({"command": "first"}))
+        second = asyncio.create_task(self.connection.request({"command": "second"}))
+        await asyncio.sleep(0)
+        self.assertNotEqual(self.websocket.sent[0]["id"], self.websocket.sent[1]["id"])
+        await self.reply(1, {"status": "second"})
+        self.assertEqual((await second)["status"], "second")
+        self.assertFalse(first.done())
+        await self.reply(0, {"status": "first"})
+        self.assertEqual((await first)["status"], "first")
+
+    async def test_closed_connection(self) -> None:
+        request = asyncio.create_task(self.connection.request({"command": "test"}))
+        await asyncio.sleep(0)
+        await self.websocket.close()
+        with self.assertRaises(ConnectionError):
+            await request
+
+    async def test_token_renewal(self) -> None:
+        self.connection.token = "old"
+        request = asyncio.create_task(self.connection.request({"command": "test"}))
+        await asyncio.sleep(0)
+        self.assertEqual(self.websocket.sent[0]["token"], "old")
+        await self.reply(0, {"status": "success", "token": "new"})
+        await request
+        self.assertEqual(self.connection.token, "new")
@@ -1,7 +1,12 @@
 import os
+import sqlite3
+import tempfile
 import unittest
+from pathlib import Path
+from typing import List
 
-from src.model import db
+from src.model import db, migrations
+from src.model.blob_store import BlobStore
 
 
 class TestDB(unittest.TestCase):
@@ -40,8 +45,14 @@ class TestDB(unittest.TestCase):
         self.db.add_user(self.user_email, self.user_auth_key)
         id = self.db.get_id(self.user_email)
         self.assertIsNotNone(id)
+        self.db.add_vault(id, "test_vault", "test_key", "test_data")
+        vid = self.db.get_vault_id(id, "test_vault")
+        self.db.sync_vault(id, "test_vault", 1, [{"id": 1, "data": b"record"}])
         self.db.delete_user(id)
         self.assertRaises(Exception, self.db.get_id, self.user_email)
+        self.assertRaises(Exception, self.db.get_vault, id, "test_vault")
+        self.assertEqual(self.db.get_vault_records(vid), [])
+        self.assertNotEqual(self.db.add_user(self.user_email, self.user_auth_key), id)
 
     def test_get_user(self) -> None:
         self.db.add_user(self.user_email, self.user_auth_key)
@@ -69,6 +80,42 @@ class TestDB(unittest.TestCase):
         self.assertNotEqual(user["auth_key"], self.user_auth_key)
         self.assertRaises(Exception, self.db.update_auth_key, 2, "new_auth_key")
 
+    def test_get_login(self) -> None:
+        id = self.db.add_user(self.user_email, self.user_auth_key)
+        self.assertEqual(
+            self.db.get_login(self.user_email),
+            {"id": id, "email": self.user_email, "auth_key": self.user_auth_key},
+        )
+        self.assertIsNone(self.db.get_login("test_user_2"))
+
+    def test_statement_counts(self) -> None:
+        id = self.db.add_user(self.user_email, self.user_auth_key)
+        statements: List[str] = []
+        self.db.connection.set_trace_callback(statements.append)
+        vid = self.db.add_vault(id, "test_vault", "test_key", "test_data")
+        self.assertEqual(len(statements), 1)
+        statements.clear()
+        vault = self.db.update_vault(id, "test_vault", "new_data", 1)
+        self.assertEqual(vault["id"], vid)
+        self.assertEqual(len(statements), 2)
+        statements.clear()
+        self.db.update_vault_key(id, "test_vault", "new_key")
+        self.assertEqual(len(statements), 1)
+        statements.clear()
+        self.db.get_login(self.user_email)
+        self.assertEqual(len(statements), 1)
+        statements.clear()
+        self.db.update_vault_name(id, "test_vault", "new_vault")
+        self.assertEqual(len(statements), 1)
+        statements.clear()
+        # SQLite traces a DELETE a second time when it removes rows.
+        self.db.delete_vault(id, "new_vault")
+        self.assertEqual(len(set(statements)), 1)
+        statements.clear()
+        self.db.delete_user(id)
+        self.assertEqual(len(set(statements)), 1)
+        self.db.connection.set_trace_callback(None)
+
     def test_get_id(self) -> None:
         self.db.add_user(self.user_email, self.user_auth_key)
         id = self.db.get_id(self.user_email)
@@ -89,7 +136,10 @@ class TestDB(unittest.TestCase):
         vault = self.db.get_vault(id, "test_vault")
         self.assertIsNotNone(vault)
         self.assertEqual(vault["name"], "test_vault")
-        self.assertRaises(Exception, self.db.add_vault, id, "test_vault")
+        with self.assertRaisesRegex(Exception, "already exists"):
+            self.db.add_vault(id, "test_vault", "test_key", "test_data")
+        with self.assertRaisesRegex(Exception, "does not exist"):
+            self.db.add_vault(id + 1, "test_vault", "test_key", "test_data")
 
     def test_delete_vault(self) -> None:
         self.db.add_user(self.user_email, self.user_auth_key)
@@ -107,6 +157,17 @@ class TestDB(unittest.TestCase):
         self.assertEqual(vault["name"], "test_vault")
         self.assertRaises(Exception, self.db.get_vault, id, "test_vault_2")
 
+    def test_get_vault_info(self) -> None:
+        self.db.add_user(self.user_email, self.user_auth_key)
+        id = self.db.get_id(self.user_email)
+        self.db.add_vault(id, "test_vault", "test_key", "test_data")
+        info = self.db.get_vault_info(id, "test_vault")
+        vault = self.db.get_vault(id, "test_vault")
+        self.assertEqual(info["id"], vault["id"])
+        self.assertEqual(info["version"], vault["version"])
+        self.assertEqual(info["modified"], vault["modified"])
+        self.assertRaises(Exception, self.db.get_vault_info, id, "test_vault_2")
+
     def test_get_vault_key(self) -> None:
         self.db.add_user(self.user_email, self.user_auth_key)
         id = self.db.get_id(self.user_email)
@@ -135,13 +196,16 @@ class TestDB(unittest.TestCase):
         self.db.add_user(self.user_email, self.user_auth_key)
         id = self.db.get_id(self.user_email)
         self.db.add_vault(id, "test_vault", "test_key", "test_data")
-        self.db.update_vault_name(id, "test_vault", "new_vault")
+        vid = self.db.get_vault_id(id, "test_vault")
+        self.assertEqual(self.db.update_vault_name(id, "test_vault", "new_vault"), vid)
         vault = self.db.get_vault(id, "new_vault")
         self.assertIsNotNone(vault)
         self.assertEqual(vault["name"], "new_vault")
-        self.assertRaises(
-            Exception, self.db.update_vault_name, id, "test_vault_2", "new_vault"
-        )
+        self.assertEqual(self.db.update_vault_name(id, "new_vault", "new_vault"), vid)
+        self.assertIsNone(self.db.update_vault_name(id, "test_vault_2", "new_vault"))
+        self.db.add_vault(id, "test_vault", "test_key", "test_data")
+        with self.assertRaisesRegex(Exception, "already exists"):
+            self.db.update_vault_name(id, "test_vault", "new_vault")
 
     def test_update_vault_key(self) -> None:
         self.db.add_user(self.user_email, self.user_auth_key)
@@ -151,8 +215,11 @@ class TestDB(unittest.TestCase):
         vault = self.db.get_vault(id, "test_vault")
         self.assertEqual(vault["key"], "new_key")
         self.assertNotEqual(vault["key"], "test_key")
-        self.assertRaises(
-            Exception, self.db.update_vault_key, id, "test_vault_2", "new_key"
+        self.assertIsNone(self.db.update_vault_key(id, "test_vault_2", "new_key"))
+        vid = self.db.get_vault_id(id, "test_vault")
+        self.assertEqual(self.db.update_vault_key(id, "test_vault", "new_key"), vid)
+        self.assertEqual(
+            vault["version"], self.db.get_vault(id, "test_vault")["version"]
         )
 
     def test_update_vault(self) -> None:
@@ -165,3 +232,195 @@ class TestDB(unittest.TestCase):
         self.assertRaises(
             Exception, self.db.update_vault, id, "test_vault_2", "new_data"
         )
+
+    def test_list_vaults(self) -> None:
+        self.db.add_user(self.user_email, self.user_auth_key)
+        id = self.db.get_id(self.user_email)
+        self.assertIsNone(self.db.list_vaults(id, 10))
+        for i in range(5):
+            self.db.add_vault(id, f"test_vault_{i}", "test_key", "test_data")
+        vaults = self.db.list_vaults(id, 3)
+        if vaults is None:
+            self.fail("vaults is none")
+        self.assertEqual(
+            [v["name"] for v in vaults], [f"test_vault_{i}" for i in range(3)]
+        )
+        self.assertNotIn("data", vaults[0])
+        self.assertEqual(vaults[0]["key"], "test_key")
+        self.assertEqual(vaults[0]["size"], len("test_data"))
+        self.assertEqual(vaults[0]["version"], 1)
+        self.assertGreater(float(vaults[0]["modified"]), 0)
+        vaults = self.db.list_vaults(id, 3, int(vaults[-1]["id"]))
+        if vaults is None:
+            self.fail("vaults is none")
+        self.assertEqual([v["name"] for v in vaults], ["test_vault_3", "test_vault_4"])
+
+    def test_sync_vault(self) -> None:
+        self.db.add_user(self.user_email, self.user_auth_key)
+        id = self.db.get_id(self.user_email)
+        self.db.add_vault(id, "test_vault", "test_key", "test_data")
+        vault = self.db.get_vault(id, "test_vault")
+        records = [{"id": 1, "data": b"record_1"}, {"id": 2, "data": b"record_2"}]
+        synced = self.db.sync_vault(id, "test_vault", int(vault["version"]), records)
+        self.assertEqual(synced["version"], int(vault["version"]) + 1)
+        self.assertEqual(synced["records"], 2)
+        with self.assertRaises(db.VersionConflict) as conflict:
+            self.db.sync_vault(id, "test_vault", int(vault["version"]), records)
+        self.assertEqual(conflict.exception.version, synced["version"])
+        self.db.sync_vault(
+            id, "test_vault", int(synced["version"]), [{"id": 2, "data": None}]
+        )
+        stored = self.db.get_vault_with_records(id, "test_vault")
+        self.assertEqual(
+            stored["records"],
+            [{"id": 1, "data": b"record_1"}, {"id": 2, "data": None}],
+        )
+        self.db.update_vault(id, "test_vault", "new_data")
+        self.assertEqual(self.db.get_vault_records(int(vault["id"])), [])
+        self.db.sync_vault(id, "test_vault", int(synced["version"]) + 2, records)
+        self.db.delete_vault(id, "test_vault")
+        self.assertEqual(self.db.get_vault_records(int(vault["id"])), [])
+
+    def test_vault_version(self) -> None:
+        self.db.add_user(self.user_email, self.user_auth_key)
+        id = self.db.get_id(self.user_email)
+        self.db.add_vault(id, "test_vault", "test_key", "test_data")
+        self.db.update_vault(id, "test_vault", "new_data")
+        self.db.update_vault_key(id, "test_vault", "new_key")
+        vaults = self.db.list_vaults(id, 1)
+        if vaults is None:
+            self.fail("vaults is none")
+        self.assertEqual(vaults[0]["version"], 3)
+
+    def test_update_vault_conflict(self) -> None:
+        self.db.add_user(self.user_email, self.user_auth_key)
+        id = self.db.get_id(self.user_email)
+        self.db.add_vault(id, "test_vault", "test_key", "test_data")
+        vault = self.db.update_vault(id, "test_vault", "new_data", 1)
+        self.assertEqual(vault["version"], 2)
+        with self.assertRaises(db.VersionConflict) as conflict:
+            self.db.update_vault(id, "test_vault", "other_data", 1)
+        self.assertEqual(conflict.exception.version, 2)
+        self.assertEqual(self.db.get_vault_data(id, "test_vault"), "new_data")
+        self.assertRaises(
+            Exception, self.db.update_vault, id, "test_vault_2", "new_data", 1
+        )
+
+    def test_upgrade_vaults_table(self) -> None:
+        self.db.close()
+        os.remove(self.db_file)
+        connection = sqlite3.connect(self.db_file)
+        connection.execute(
+            """CREATE TABLE users(
+                id INTEGER PRIMARY KEY,
+                email TEXT NOT NULL UNIQUE,
+                auth_key BYTES NOT NULL
+            )"""
+        )
+        connection.execute(
+            """CREATE TABLE vaults(
+                id INTEGER PRIMARY KEY,
+                uid INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                key BYTES NOT NULL,
+                data BLOB
+            )"""
+        )
+        connection.execute(
+            """CREATE TABLE records(
+                vid INTEGER NOT NULL,
+                rid INTEGER NOT NULL,
+                data BLOB,
+                PRIMARY KEY(vid, rid)
+            )"""
+        )
+        connection.execute("""INSERT INTO users(email, auth_key) VALUES ('e', 'a')""")
+        connection.executemany(
+            """INSERT INTO vaults(uid, name, key, data) VALUES (?, ?, 'k', 'd')""",
+            [(1, "a"), (1, "a"), (2, "b")],
+        )
+        connection.executemany(
+            """INSERT INTO records(vid, rid, data) VALUES (?, 1, 'r')""",
+            [(1,), (3,)],
+        )
+        connection.commit()
+        connection.close()
+        self.db = db.Database(Path(self.db_file))
+        vaults = self.db.list_vaults(1, 10)
+        if vaults is None:
+            self.fail("vaults is none")
+        self.assertEqual([v["name"] for v in vaults], ["a", "a (2)"])
+        self.assertEqual(vaults[0]["version"], 1)
+        self.assertEqual(self.db.get_vault_records(1), [{"id": 1, "data": "r"}])
+        self.assertEqual(self.db.get_vault_records(3), [])
+        self.assertEqual(
+            migrations.schema_version(self.db.connection), len(migrations.MIGRATIONS)
+        )
+        self.assertRaises(Exception, self.db.add_vault, 1, "a", "k", "d")
+        self.db.close()
+        self.db = db.Database(Path(self.db_file))
+        self.assertIsNotNone(self.db.get_vaults(1))
+
+    def test_newer_schema(self) -> None:
+        self.db.connection.execute("""PRAGMA user_version = 100""")
+        self.assertRaises(Exception, db.Database, Path(self.db_file))
+
+    def test_backup(self) -> None:
+        self.db.add_user(self.user_email, self.user_auth_key)
+        with tempfile.TemporaryDirectory() as backup_dir:
+            self.assertRaises(Exception, self.db.backup, Path(backup_dir))
+            self.db.commit()
+            backup = self.db.backup(Path(backup_dir), pages=1)
+            self.assertEqual(os.listdir(backup_dir), [backup["path"].name])
+            self.assertEqual(backup["size"], backup["path"].stat().st_size)
+            backup_db = sqlite3.connect(backup["path"])
+            emails = backup_db.execute("SELECT email FROM users").fetchall()
+            backup_db.close()
+        self.assertEqual(emails, [(self.user_email,)])
+
+    def test_blob_store(self) -> None:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            store = BlobStore(Path(temp_dir) / "blobs")
+            self.db.close()
+            self.db = db.Database(Path(self.db_file), blobs=store, blob_threshold=64)
+            self.db.add_user(self.user_email, self.user_auth_key)
+            id = self.db.get_id(self.user_email)
+            self.db.add_vault(id, "large", "key", b"large_data" * 10)
+            self.db.add_vault(id, "small", "key", b"small_data")
+            self.db.commit()
+            large = self.db.get_vault(id, "large")
+            self.assertIsInstance(large["data"], memoryview)
+            self.assertEqual(large["data"], b"large_data" * 10)
+            self.assertEqual(self.db.get_vault(id, "small")["data"], b"small_data")
+            sizes = [vault["size"] for vault in self.db.list_vaults(id, 10) or []]
+            self.assertEqual(sizes, [100, 10])
+            self.db.cursor.execute("""SELECT blob FROM vaults WHERE name = 'large'""")
+            (blob,) = self.db.cursor.fetchone()
+            self.db.update_vault(id, "large", b"new_large_data" * 10)
+            self.db.rollback()
+            self.assertTrue(store.path(blob).exists())
+            self.db.update_vault(id, "large", b"new_large_data" * 10)
+            self.db.commit()
+            self.assertFalse(store.path(blob).exists())
+            self.db.delete_vault(id, "large")
+            self.db.commit()
+            self.assertEqual(list(store.root.glob("*/*")), [])
+
+    def test_move_blobs(self) -> None:
+        self.db.add_user(self.user_email, self.user_auth_key)
+        id = self.db.get_id(self.user_email)
+        self.db.add_vault(id, "large", "key", b"large_data" * 10)
+        self.db.add_vault(id, "small", "key", b"small_data")
+        self.db.commit()
+        with tempfile.TemporaryDirectory() as temp_dir:
+            self.db.blobs = BlobStore(Path(temp_dir) / "blobs")
+            self.db.blob_threshold = 64
+            self.assertEqual(self.db.move_blobs(), 1)
+            self.assertEqual(self.db.move_blobs(), 0)
+            self.assertEqual(self.db.get_vault(id, "large")["data"], b"large_data" * 10)
+            self.db.cursor.execute("""SELECT data FROM vaults WHERE name = 'large'""")
+            self.assertIsNone(self.db.cursor.fetchone()[0])
+            self.assertEqual(self.db.collect_blobs(), 0)
+            backup = self.db.backup(Path(temp_dir))
+            self.assertEqual(len(list((Path(temp_dir) / "vault_blobs").glob("*/*"))), 1)
+            self.assertTrue(backup["path"].exists())
@@ -1,19 +1,25 @@
 import logging
 import os
-import pickle
 import unittest
-from typing import Any, Dict
+from pathlib import Path
+from typing import Any, Dict, List, Union
 from unittest.mock import AsyncMock
 
 from websockets import ClientConnection
 
-from src.model import db, handlers
+from src.model import codec, handlers
+from src.model.async_db import AsyncDatabase
+from src.model.hasher import Hasher
+from src.model.session import InvalidSession, Sessions
 
 
 class TestHandlers(unittest.IsolatedAsyncioTestCase):
     async def asyncSetUp(self) -> None:
         self.db_path = "test.db"
-        self.db = db.Database(self.db_path)
+        self.db = AsyncDatabase(Path(self.db_path))
+        self.hasher = Hasher(1)
+        self.sessions = Sessions()
+        self.binding = self.sessions.binding()
         logging.basicConfig(
             filename="test.log",
             level=logging.INFO,
@@ -24,64 +30,108 @@ class TestHandlers(unittest.IsolatedAsyncioTestCase):
 
         self.ws = AsyncMock(spec=ClientConnection)
 
-        async def send_side_effect(message: bytes) -> None:
+        async def send_side_effect(message: Union[bytes, List[bytes]]) -> None:
+            if isinstance(message, list):
+                message = b"".join(message)
             self.ws.message = message
 
         self.ws.send.side_effect = send_side_effect
 
         async def recv_side_effect() -> dict:
-            return pickle.loads(self.ws.message)
+            return codec.decode(self.ws.message)
 
         self.ws.recv.side_effect = recv_side_effect
 
     async def asyncTearDown(self) -> None:
+        self.hasher.close()
         self.db.close()
         os.remove(self.db_path)
 
     async def test_register_user(self) -> None:
         message = {"user": {"email": "test_email", "mkey": "test_master_key"}}
-        await handlers.register_user(self.ws, message, self.db, self.rhost, self.rport)
+        await handlers.register_user(
+            self.ws, message, self.db, self.hasher, self.rhost, self.rport
+        )
         response = await self.ws.recv()
         self.assertEqual(response["status"], "success", response)
-        await handlers.register_user(self.ws, message, self.db, self.rhost, self.rport)
+        await handlers.register_user(
+            self.ws, message, self.db, self.hasher, self.rhost, self.rport
+        )
         response = await self.ws.recv()
         self.assertEqual(response["status"], "failed", response)
 
     async def test_auth(self) -> None:
         registration_msg = {"user": {"email": "test_email", "mkey": "test_master_key"}}
         await handlers.register_user(
-            self.ws, registration_msg, self.db, self.rhost, self.rport
+            self.ws, registration_msg, self.db, self.hasher, self.rhost, self.rport
         )
 
         message = {"email": "test_email", "mkey": "test_master_key"}
-        await handlers.auth(self.ws, message, self.db, self.rhost, self.rport)
+        await handlers.auth(
+            self.ws,
+            message,
+            self.db,
+            self.hasher,
+            self.sessions,
+            self.binding,
+            self.rhost,
+            self.rport,
+        )
         response = await self.ws.recv()
         self.assertEqual(response["status"], "success", response)
+        uid = self.sessions.verify(response["token"], self.binding)
+        self.assertEqual(uid, response["user"]["id"])
         message = {"email": "test_email", "mkey": "wrong_master_key"}
-        await handlers.auth(self.ws, message, self.db, self.rhost, self.rport)
+        await handlers.auth(
+            self.ws,
+            message,
+            self.db,
+            self.hasher,
+            self.sessions,
+            self.binding,
+            self.rhost,
+            self.rport,
+        )
         response = await self.ws.recv()
         self.assertEqual(response["status"], "failed", response)
+        self.assertEqual(response["error"], "Invalid password")
+        message = {"email": "unknown_email", "mkey": "test_master_key"}
+        await handlers.auth(
+            self.ws,
+            message,
+            self.db,
+            self.hasher,
+            self.sessions,
+            self.binding,
+            self.rhost,
+            self.rport,
+        )
+        response = await self.ws.recv()
+        self.assertEqual(response["status"], "failed", response)
+        self.assertIn("not found", response["error"])
 
     async def test_change_email(self) -> None:
         registration_msg = {"user": {"email": "test_email", "mkey": "test_master_key"}}
         await handlers.register_user(
-            self.ws, registration_msg, self.db, self.rhost, self.rport
+            self.ws, registration_msg, self.db, self.hasher, self.rhost, self.rport
         )
 
         message = {"uid": 1, "new_email": "new_email", "new_mkey": "new_master_key"}
-        await handlers.change_email(self.ws, message, self.db, self.rhost, self.rport)
+        await handlers.change_email(
+            self.ws, message, self.db, self.hasher, self.rhost, self.rport
+        )
         response = await self.ws.recv()
         self.assertEqual(response["status"], "success", response)
 
     async def test_change_auth_key(self) -> None:
         registration_msg = {"user": {"email": "test_email", "mkey": "test_master_key"}}
         await handlers.register_user(
-            self.ws, registration_msg, self.db, self.rhost, self.rport
+            self.ws, registration_msg, self.db, self.hasher, self.rhost, self.rport
         )
 
         message = {"uid": 1, "new_mkey": "new_master_key"}
         await handlers.change_auth_key(
-            self.ws, message, self.db, self.rhost, self.rport
+            self.ws, message, self.db, self.hasher, self.rhost, self.rport
         )
         response = await self.ws.recv()
         self.assertEqual(response["status"], "success", response)
@@ -89,7 +139,7 @@ class TestHandlers(unittest.IsolatedAsyncioTestCase):
     async def test_get_vaults(self) -> None:
         registration_msg = {"user": {"email": "test_email", "mkey": "test_master_key"}}
         await handlers.register_user(
-            self.ws, registration_msg, self.db, self.rhost, self.rport
+            self.ws, registration_msg, self.db, self.hasher, self.rhost, self.rport
         )
 
         message: Dict[str, Any] = {"uid": 1}
@@ -119,7 +169,7 @@ class TestHandlers(unittest.IsolatedAsyncioTestCase):
     async def test_get_vault(self) -> None:
         registration_msg = {"user": {"email": "test_email", "mkey": "test_master_key"}}
         await handlers.register_user(
-            self.ws, registration_msg, self.db, self.rhost, self.rport
+            self.ws, registration_msg, self.db, self.hasher, self.rhost, self.rport
         )
 
         message = {
@@ -134,10 +184,27 @@ class TestHandlers(unittest.IsolatedAsyncioTestCase):
         response = await self.ws.recv()
         self.assertEqual(response["status"], "success", response)
 
+        tag = response["vault"]["tag"]
+        message = {"uid": 1, "vault_name": "test_vault", "if_none_match": tag}
+        await handlers.get_vault(self.ws, message, self.db, self.rhost, self.rport)
+        response = await self.ws.recv()
+        self.assertEqual(response["status"], "not_modified", response)
+        self.assertNotIn("vault", response)
+
+        message = {"uid": 1, "vault_name": "test_vault", "data": "new_data"}
+        await handlers.save_vault(self.ws, message, self.db, self.rhost, self.rport)
+        response = await self.ws.recv()
+        self.assertNotEqual(response["tag"], tag)
+        message = {"uid": 1, "vault_name": "test_vault", "if_none_match": tag}
+        await handlers.get_vault(self.ws, message, self.db, self.rhost, self.rport)
+        response = await self.ws.recv()
+        self.assertEqual(response["status"], "success", response)
+        self.assertEqual(response["vault"]["data"], "new_data")
+
     async def test_create_vault(self) -> None:
         registration_msg = {"user": {"email": "test_email", "mkey": "test_master_key"}}
         await handlers.register_user(
-            self.ws, registration_msg, self.db, self.rhost, self.rport
+            self.ws, registration_msg, self.db, self.hasher, self.rhost, self.rport
         )
 
         message = {
@@ -153,7 +220,7 @@ class TestHandlers(unittest.IsolatedAsyncioTestCase):
     async def test_update_vault_key(self) -> None:
         registration_msg = {"user": {"email": "test_email", "mkey": "test_master_key"}}
         await handlers.register_user(
-            self.ws, registration_msg, self.db, self.rhost, self.rport
+            self.ws, registration_msg, self.db, self.hasher, self.rhost, self.rport
         )
 
         message = {
@@ -169,11 +236,17 @@ class TestHandlers(unittest.IsolatedAsyncioTestCase):
         )
         response = await self.ws.recv()
         self.assertEqual(response["status"], "success", response)
+        message = {"uid": 1, "vault_name": "test_vault_2", "vault_key": "key"}
+        await handlers.update_vault_key(
+            self.ws, message, self.db, self.rhost, self.rport
+        )
+        response = await self.ws.recv()
+        self.assertEqual(response["status"], "failed", response)
 
     async def test_delete_vault(self) -> None:
         registration_msg = {"user": {"email": "test_email", "mkey": "test_master_key"}}
         await handlers.register_user(
-            self.ws, registration_msg, self.db, self.rhost, self.rport
+            self.ws, registration_msg, self.db, self.hasher, self.rhost, self.rport
         )
 
         message = {
@@ -187,7 +260,8 @@ class TestHandlers(unittest.IsolatedAsyncioTestCase):
         await handlers.delete_vault(self.ws, message, self.db, self.rhost, self.rport)
         response = await self.ws.recv()
         self.assertEqual(response["status"], "success", response)
-        self.assertRaises(Exception, self.db.get_vault, 1, "test_vault")
+        with self.assertRaises(Exception):
+            await self.db.get_vault(1, "test_vault")
 
     async def test_invalid_command(self) -> None:
         message = {"command": "invalid_command"}
@@ -196,6 +270,7 @@ class TestHandlers(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(response["status"], "failed", response)
 
     async def test_save_vault(self) -> None:
+        await self.db.add_user("test_user", "test_auth_key")
         message = {
             "uid": 1,
             "vault_name": "test_vault",
@@ -211,7 +286,7 @@ class TestHandlers(unittest.IsolatedAsyncioTestCase):
         await handlers.save_vault(self.ws, message, self.db, self.rhost, self.rport)
         response = await self.ws.recv()
         self.assertEqual(response["status"], "success", response)
-        vault = self.db.get_vault(1, "test_vault")
+        vault = await self.db.get_vault(1, "test_vault")
         self.assertIsNotNone(vault)
         self.assertEqual(vault["name"], "test_vault")
         self.assertEqual(vault["data"], "test_data and more data")
@@ -219,16 +294,29 @@ class TestHandlers(unittest.IsolatedAsyncioTestCase):
     async def test_delete_account(self) -> None:
         registration_msg = {"user": {"email": "test_email", "mkey": "test_master_key"}}
         await handlers.register_user(
-            self.ws, registration_msg, self.db, self.rhost, self.rport
+            self.ws, registration_msg, self.db, self.hasher, self.rhost, self.rport
         )
 
+        token = self.sessions.issue(1, self.binding)
         message = {"uid": 1, "mkey": "test_master_key"}
-        await handlers.delete_account(self.ws, message, self.db, self.rhost, self.rport)
+        await handlers.delete_account(
+            self.ws,
+            message,
+            self.db,
+            self.hasher,
+            self.sessions,
+            self.rhost,
+            self.rport,
+        )
         response = await self.ws.recv()
         self.assertEqual(response["status"], "success", response)
-        self.assertRaises(Exception, self.db.get_id, "test_email")
+        with self.assertRaises(Exception):
+            await self.db.get_id("test_email")
+        with self.assertRaises(InvalidSession):
+            self.sessions.verify(token, self.binding)
 
     async def test_update_vault_name(self) -> None:
+        await self.db.add_user("test_user", "test_auth_key")
         message = {
             "uid": 1,
             "vault_name": "test_vault",
@@ -246,4 +334,138 @@ class TestHandlers(unittest.IsolatedAsyncioTestCase):
         )
         response = await self.ws.recv()
         self.assertEqual(response["status"], "success", response)
-        self.assertRaises(Exception, self.db.get_vault, 1, "test_vault")
+        with self.assertRaises(Exception):
+            await self.db.get_vault(1, "test_vault")
+        await handlers.update_vault_name(
+            self.ws, message, self.db, self.rhost, self.rport
+        )
+        response = await self.ws.recv()
+        self.assertEqual(response["status"], "failed", response)
+        self.assertIn("not found", response["error"])
+
+    async def test_sync_vault(self) -> None:
+        registration_msg = {"user": {"email": "test_email", "mkey": "test_master_key"}}
+        await handlers.register_user(
+            self.ws, registration_msg, self.db, self.hasher, self.rhost, self.rport
+        )
+        message = {
+            "uid": 1,
+            "vault_name": "test_vault",
+            "vault_key": "test_key",
+            "vault_data": "test_data",
+        }
+        await handlers.create_vault(self.ws, message, self.db, self.rhost, self.rport)
+        records = [{"id": 1, "data": b"record"}]
+        message = {
+            "uid": 1,
+            "vault_name": "test_vault",
+            "version": 1,
+            "records": records,
+        }
+        await handlers.sync_vault(self.ws, message, self.db, self.rhost, self.rport)
+        response = await self.ws.recv()
+        self.assertEqual(response["status"], "success", response)
+        self.assertEqual(response["version"], 2)
+        self.assertFalse(response["compact"])
+
+        await handlers.sync_vault(self.ws, message, self.db, self.rhost, self.rport)
+        response = await self.ws.recv()
+        self.assertEqual(response["status"], "conflict", response)
+        self.assertEqual(response["version"], 2)
+
+        message = {"uid": 1, "vault_name": "test_vault"}
+        await handlers.get_vault(self.ws, message, self.db, self.rhost, self.rport)
+        response = await self.ws.recv()
+        self.assertEqual(response["vault"]["records"], records)
+        self.assertEqual(response["vault"]["version"], 2)
+
+    async def test_batch(self) -> None:
+        registration_msg = {"user": {"email": "test_email", "mkey": "test_master_key"}}
+        await handlers.register_user(
+            self.ws, registration_msg, self.db, self.hasher, self.rhost, self.rport
+        )
+        for name in ["vault_1", "vault_2"]:
+            message = {
+                "uid": 1,
+                "vault_name": name,
+                "vault_key": "test_key",
+                "vault_data": "test_data",
+            }
+            await handlers.create_vault(
+                self.ws, message, self.db, self.rhost, self.rport
+            )
+        operations: List[Dict[str, Any]] = [
+            {"command": "update_vault_key", "vault_name": "vault_1", "vault_key": "k1"},
+            {"command": "update_vault_key", "vault_name": "vault_2", "vault_key": "k2"},
+            {"command": "update_vault_key", "vault_name": "missing", "vault_key": "k3"},
+        ]
+        message = {"uid": 1, "operations": operations}
+        await handlers.batch(
+            self.ws, message, self.db, self.hasher, self.rhost, self.rport
+        )
+        response = await self.ws.recv()
+        self.assertEqual(response["status"], "failed", response)
+        vault = await self.db.get_vault(1, "vault_1")
+        self.assertEqual(vault["key"], "test_key")
+
+        operations[2] = {"command": "change_auth_key", "new_mkey": "new_master_key"}
+        await handlers.batch(
+            self.ws, message, self.db, self.hasher, self.rhost, self.rport
+        )
+        response = await self.ws.recv()
+        self.assertEqual(response["status"], "success", response)
+        vault = await self.db.get_vault(1, "vault_2")
+        self.assertEqual(vault["key"], "k2")
+        message = {"email": "test_email", "mkey": "new_master_key"}
+        await handlers.auth(
+            self.ws,
+            message,
+            self.db,
+            self.hasher,
+            self.sessions,
+            self.binding,
+            self.rhost,
+            self.rport,
+        )
+        response = await self.ws.recv()
+        self.assertEqual(response["status"], "success", response)
+
+    async def test_batch_rejects_auth_key(self) -> None:
+        uid = await self.db.add_user("test_email", "test_auth_key")
+        for operations in [
+            [{"command": "change_auth_key", "auth_key": "$argon2id$forged"}],
+            [
+                {
+                    "command": "change_email",
+                    "new_email": "new_email",
+                    "auth_key": "forged",
+                    "new_mkey": "new_master_key",
+                }
+            ],
+            [{"command": "change_auth_key"}],
+            [{"command": "drop_users"}],
+            ["change_auth_key"],
+        ]:
+            message = {"uid": uid, "operations": operations}
+            await handlers.batch(
+                self.ws, message, self.db, self.hasher, self.rhost, self.rport
+            )
+            response = await self.ws.recv()
+            self.assertEqual(response["status"], "failed", operations)
+        self.assertEqual(await self.db.get_auth_key(uid), "test_auth_key")
+
+    async def test_get_vaults_pages(self) -> None:
+        await self.db.add_user("test_user", "test_auth_key")
+        for i in range(handlers.PAGE_SIZE + 1):
+            await self.db.add_vault(1, f"test_vault_{i}", "test_key", "test_data")
+        message: Dict[str, Any] = {"uid": 1}
+        await handlers.get_vaults(self.ws, message, self.db, self.rhost, self.rport)
+        response = await self.ws.recv()
+        self.assertEqual(len(response["vaults"]), handlers.PAGE_SIZE)
+        self.assertNotIn("data", response["vaults"][0])
+        self.assertEqual(response["vaults"][0]["size"], len("test_data"))
+        message = {"uid": 1, "after": response["next"]}
+        await handlers.get_vaults(self.ws, message, self.db, self.rhost, self.rport)
+        response = await self.ws.recv()
+        self.assertEqual(len(response["vaults"]), 1)
+        self.assertIsNone(response["next"])
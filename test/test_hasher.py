@@ -0,0 +1,23 @@
+import unittest
+
+from src.model.hasher import Hasher
+
+
+class TestHasher(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.hasher = Hasher(1)
+
+    async def asyncTearDown(self) -> None:
+        self.hasher.close()
+
+    async def test_hash(self) -> None:
+        password = "test_password"
+        hashed_password = await self.hasher.hash(password)
+        self.assertNotEqual(password, hashed_password)
+        hashed_password_2 = await self.hasher.hash(password)
+        self.assertNotEqual(hashed_password, hashed_password_2)
+
+    async def test_verify(self) -> None:
+        hashed_password = await self.hasher.hash("test_password")
+        self.assertTrue(await self.hasher.verify(hashed_password, "test_password"))
+        self.assertFalse(await self.hasher.verify(hashed_password, "wrong_password"))
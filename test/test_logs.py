@@ -0,0 +1,89 @@
+import gzip
+import json
+import logging
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from src.model.logs import (
+    JsonFormatter,
+    RotatingLogHandler,
+    parse_levels,
+    setup_logging,
+)
+
+
+class TestLogs(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.log_file = Path(self.temp_dir.name) / "server.log"
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def test_json_formatter(self) -> None:
+        record = logging.LogRecord(
+            "ljk.access",
+            logging.INFO,
+            __file__,
+            1,
+            "%s took %.1fs",
+            ("auth", 0.5),
+            None,
+        )
+        record.command = "auth"
+        record.duration = 0.5
+        entry = json.loads(JsonFormatter().format(record))
+        self.assertEqual(entry["message"], "auth took 0.5s")
+        self.assertEqual(entry["logger"], "ljk.access")
+        self.assertEqual(entry["command"], "auth")
+        self.assertEqual(entry["duration"], 0.5)
+        self.assertNotIn("uid", entry)
+
+    def test_size_rotation(self) -> None:
+        handler = RotatingLogHandler(self.log_file, 100, 0, 2)
+        logger = logging.getLogger("ljk.test_size")
+        logger.addHandler(handler)
+        logger.propagate = False
+        for i in range(10):
+            logger.error("line %s %s", i, "x" * 40)
+        handler.close()
+        logger.removeHandler(handler)
+        backups = sorted(path.name for path in Path(self.temp_dir.name).iterdir())
+        self.assertEqual(backups, ["server.log", "server.log.1.gz", "server.log.2.gz"])
+        with gzip.open(f"{self.log_file}.1.gz", "rt") as f:
+            self.assertIn("line", f.read())
+
+    def test_time_rotation(self) -> None:
+        handler = RotatingLogHandler(self.log_file, 0, 60, 1)
+        record = logging.LogRecord("ljk", logging.INFO, __file__, 1, "msg", None, None)
+        self.assertFalse(handler.shouldRollover(record))
+        with patch("time.time", return_value=handler.rollover_at):
+            self.assertTrue(handler.shouldRollover(record))
+        handler.close()
+
+    def test_setup_logging(self) -> None:
+        root = logging.getLogger()
+        level = root.level
+        listener = setup_logging(self.log_file, "INFO", parse_levels("test=ERROR"))
+        try:
+            logging.getLogger("ljk.test").warning("hidden")
+            logging.getLogger("ljk.other").info("shown %s", 1)
+        finally:
+            listener.stop()
+            root.removeHandler(root.handlers[-1])
+            root.setLevel(level)
+            logging.getLogger("ljk.test").setLevel(logging.NOTSET)
+            for handler in listener.handlers:
+                handler.close()
+        with open(self.log_file) as f:
+            entries = [json.loads(line) for line in f]
+        self.assertEqual([entry["message"] for entry in entries], ["shown 1"])
+
+    def test_parse_levels(self) -> None:
+        self.assertEqual(
+            parse_levels("access=warning, handlers=ERROR"),
+            {"access": "WARNING", "handlers": "ERROR"},
+        )
+        self.assertEqual(parse_levels(""), {})
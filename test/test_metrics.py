@@ -0,0 +1,58 @@
+import asyncio
+import unittest
+
+from src.model import metrics
+from src.model.metrics import Histogram, Metrics
+
+
+class TestMetrics(unittest.IsolatedAsyncioTestCase):
+    def test_histogram(self) -> None:
+        histogram = Histogram((0.1, 1.0))
+        for value in [0.05, 0.1, 0.5, 2.0]:
+            histogram.observe(value)
+        self.assertEqual(histogram.counts, [2, 1, 1])
+        self.assertEqual(histogram.count, 4)
+        self.assertAlmostEqual(histogram.sum, 2.65)
+
+    def test_render(self) -> None:
+        registry = Metrics()
+        registry.observe("get_vault", 0.002, False, 40, 200)
+        registry.observe("get_vault", 0.2, True, 40, 60)
+        registry.set_gauge("ljk_backup_size_bytes", 4096, "Size of the last backup.")
+        registry.add_collector(lambda: ["ljk_test 1"])
+        text = registry.render()
+        self.assertIn(
+            'ljk_command_seconds_bucket{command="get_vault",le="0.0025"} 1', text
+        )
+        self.assertIn(
+            'ljk_command_seconds_bucket{command="get_vault",le="+Inf"} 2', text
+        )
+        self.assertIn('ljk_command_seconds_count{command="get_vault"} 2', text)
+        self.assertIn('ljk_command_errors_total{command="get_vault"} 1', text)
+        self.assertIn('ljk_request_bytes_total{command="get_vault"} 80', text)
+        self.assertIn('ljk_response_bytes_total{command="get_vault"} 260', text)
+        self.assertIn(
+            "# TYPE ljk_backup_size_bytes gauge\nljk_backup_size_bytes 4096", text
+        )
+        self.assertIn("ljk_test 1", text)
+
+    def test_record_response(self) -> None:
+        metrics.record_response("success", 10)
+        response: dict = {"status": None, "bytes": 0}
+        metrics.current_response.set(response)
+        metrics.record_response("success", 10)
+        metrics.record_response("failed", 5)
+        self.assertEqual(response, {"status": "failed", "bytes": 15})
+
+    async def test_endpoint(self) -> None:
+        registry = Metrics()
+        registry.observe("auth", 0.5, False, 10, 20)
+        server = await asyncio.start_server(registry.handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+            response = await reader.read()
+            writer.close()
+        self.assertTrue(response.startswith(b"HTTP/1.1 200 OK"))
+        self.assertIn(b'ljk_command_seconds_count{command="auth"} 1', response)
@@ -0,0 +1,37 @@
+import asyncio
+import time
+import unittest
+
+from src.model.monitor import LoopMonitor
+
+
+class TestLoopMonitor(unittest.IsolatedAsyncioTestCase):
+    async def test_stall(self) -> None:
+        monitor = LoopMonitor(0.01, 0.05)
+        task = asyncio.create_task(monitor.run())
+        await asyncio.sleep(0.05)
+        with self.assertLogs(level="ERROR") as logs:
+            time.sleep(0.2)
+            await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        self.assertEqual(monitor.stalls, 1)
+        self.assertIn("Event loop stalled", logs.output[0])
+        self.assertIn("test_stall", logs.output[0])
+        self.assertGreaterEqual(monitor.quantiles()[-1], 0.15)
+        self.assertTrue(monitor.stopped.is_set())
+
+    async def test_disabled(self) -> None:
+        monitor = LoopMonitor(0, 0.05)
+        await asyncio.wait_for(monitor.run(), 0.1)
+        self.assertEqual(monitor.count, 0)
+
+    def test_collect(self) -> None:
+        monitor = LoopMonitor()
+        for lag in [0.001, 0.002, 0.003, 0.1]:
+            monitor.observe(lag)
+        self.assertEqual(monitor.quantiles(), [0.003, 0.1, 0.1, 0.1])
+        text = "\n".join(monitor.collect())
+        self.assertIn('ljk_loop_lag_seconds{quantile="0.5"} 0.003', text)
+        self.assertIn("ljk_loop_lag_seconds_count 4", text)
+        self.assertIn("ljk_loop_stalls_total 0", text)
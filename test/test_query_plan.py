@@ -0,0 +1,179 @@
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+from typing import List, Tuple
+
+from src.model import db
+from src.model.blob_store import BlobStore
+from src.model.vault import Vault
+
+USERS = 100_000
+VAULTS = 1_000_000
+SERVICES = 10_000
+STATEMENTS = ("SELECT", "INSERT", "UPDATE", "DELETE")
+
+
+def query_plans(
+    connection: sqlite3.Connection, statements: List[str]
+) -> List[Tuple[str, str]]:
+    plans = []
+    for statement in statements:
+        if statement.split(None, 1)[0].upper() not in STATEMENTS:
+            continue
+        for row in connection.execute(f"EXPLAIN QUERY PLAN {statement}"):
+            plans.append((statement, row[3]))
+    return plans
+
+
+class QueryPlanTestCase(unittest.TestCase):
+    connection: sqlite3.Connection
+
+    def setUp(self) -> None:
+        self.statements: List[str] = []
+        self.connection.set_trace_callback(self.statements.append)
+
+    def plans(self) -> List[Tuple[str, str]]:
+        self.connection.set_trace_callback(None)
+        self.assertTrue(self.statements)
+        return query_plans(self.connection, self.statements)
+
+    def assertIndexed(self) -> None:
+        for statement, detail in self.plans():
+            if detail.startswith("SCAN") or "TEMP B-TREE" in detail:
+                self.fail(f"{detail} in: {statement}")
+
+
+class TestDatabaseQueryPlan(QueryPlanTestCase):
+    temp_dir: tempfile.TemporaryDirectory
+    db: db.Database
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.temp_dir = tempfile.TemporaryDirectory()
+        root = Path(cls.temp_dir.name)
+        cls.db = db.Database(
+            root / "plan.db", blobs=BlobStore(root / "blobs"), blob_threshold=64
+        )
+        cls.db.cursor.executemany(
+            """INSERT INTO users(id, email, auth_key) VALUES (?, ?, ?)""",
+            ((uid, f"user_{uid}", "auth_key") for uid in range(1, USERS + 1)),
+        )
+        cls.db.cursor.executemany(
+            """INSERT INTO vaults(uid, name, key, data, modified)
+            VALUES (?, ?, ?, ?, ?)""",
+            (
+                (vid % USERS + 1, f"vault_{vid // USERS}", b"key", b"data", 0.0)
+                for vid in range(VAULTS)
+            ),
+        )
+        cls.db.cursor.executemany(
+            """INSERT INTO records(vid, rid, data) VALUES (?, ?, ?)""",
+            ((vid, rid, b"record") for vid in range(1, VAULTS, 100) for rid in (1, 2)),
+        )
+        cls.db.commit()
+        cls.connection = cls.db.connection
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.db.close()
+        cls.temp_dir.cleanup()
+
+    def tearDown(self) -> None:
+        self.connection.set_trace_callback(None)
+        self.db.rollback()
+
+    def test_users(self) -> None:
+        self.db.add_user("new_user", "auth_key")
+        uid = self.db.get_id("user_2")
+        self.db.get_user(uid)
+        self.db.get_auth_key(uid)
+        self.db.update_email(uid, "new_email", "new_auth_key")
+        self.db.update_auth_key(uid, "auth_key")
+        self.db.delete_user(uid)
+        self.assertIndexed()
+
+    def test_vaults(self) -> None:
+        self.db.add_vault(1, "new_vault", "key", "data")
+        self.db.get_vaults(1)
+        self.db.list_vaults(1, 5, 1)
+        self.db.get_vault(1, "vault_1")
+        self.db.get_vault_info(1, "vault_1")
+        self.db.get_vault_id(1, "vault_1")
+        self.db.update_vault_name(1, "vault_1", "renamed_vault")
+        self.db.update_vault_key(1, "vault_2", "new_key")
+        self.db.update_vault(1, "vault_3", "new_data", 1)
+        self.db.delete_vault(1, "vault_4")
+        self.assertIndexed()
+
+    def test_records(self) -> None:
+        vault = self.db.get_vault_info(1, "vault_0")
+        self.db.sync_vault(
+            1, "vault_0", int(vault["version"]), [{"id": 3, "data": b""}]
+        )
+        self.db.get_vault_with_records(1, "vault_0")
+        self.db.get_vault_records(int(vault["id"]))
+        self.assertIndexed()
+
+    def test_blobs(self) -> None:
+        self.db.update_vault(2, "vault_0", b"large_data" * 10)
+        self.db.update_vault(2, "vault_0", b"other_data" * 10)
+        self.db.delete_vault(2, "vault_0")
+        self.db.release_blobs()
+        self.assertIndexed()
+
+    def test_batch(self) -> None:
+        self.db.batch(
+            3,
+            [
+                {
+                    "command": "update_vault_key",
+                    "vault_name": "vault_0",
+                    "vault_key": "k",
+                },
+                {
+                    "command": "update_vault_name",
+                    "vault_name": "vault_1",
+                    "new_vault_name": "renamed_vault",
+                },
+                {"command": "delete_vault", "vault_name": "vault_2"},
+                {"command": "change_auth_key", "auth_key": "new_auth_key"},
+            ],
+        )
+        self.assertIndexed()
+
+    def test_collect_blobs(self) -> None:
+        self.db.collect_blobs()
+        self.assertEqual(
+            [detail for _, detail in self.plans()],
+            ["SEARCH vaults USING COVERING INDEX vaults_blob (blob>?)"],
+        )
+
+
+class TestVaultQueryPlan(QueryPlanTestCase):
+    def setUp(self) -> None:
+        self.vault = Vault("test_vault", b"test_key")
+        for i in range(SERVICES):
+            self.vault.add(f"service_{i}", "user", "password", "notes")
+        self.connection = self.vault.connection
+        super().setUp()
+
+    def tearDown(self) -> None:
+        self.vault.rm()
+
+    def test_records(self) -> None:
+        self.vault.add("new_service", "user", "password")
+        self.vault.service(1)
+        self.vault.record(2)
+        self.vault.update(3, "service", "user", "password")
+        self.vault.apply(4, self.vault.record(5))
+        self.vault.apply(6, None)
+        self.vault.delete(7)
+        self.assertIndexed()
+
+    def test_listing(self) -> None:
+        self.vault.services()
+        self.vault.search("service_1")
+        self.assertEqual(
+            [detail for _, detail in self.plans()], ["SCAN vault", "SCAN vault"]
+        )
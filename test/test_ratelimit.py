@@ -0,0 +1,57 @@
+import multiprocessing
+import unittest
+from unittest.mock import patch
+
+from src.model import ratelimit
+from src.model.ratelimit import RateLimiter, SharedRateLimiter, shared_buckets
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_burst(self) -> None:
+        limiter = RateLimiter(1, 3)
+        with patch("time.monotonic", return_value=100.0):
+            waits = [limiter.acquire("host") for _ in range(4)]
+            self.assertEqual(waits[:3], [0.0, 0.0, 0.0])
+            self.assertAlmostEqual(waits[3], 1.0)
+            self.assertEqual(limiter.acquire("other_host"), 0.0)
+
+    def test_refill(self) -> None:
+        limiter = RateLimiter(2, 1)
+        with patch("time.monotonic", return_value=100.0):
+            self.assertEqual(limiter.acquire("host"), 0.0)
+            self.assertAlmostEqual(limiter.acquire("host"), 0.5)
+        with patch("time.monotonic", return_value=100.5):
+            self.assertEqual(limiter.acquire("host"), 0.0)
+
+    def test_disabled(self) -> None:
+        limiter = RateLimiter(0, 1)
+        self.assertEqual([limiter.acquire("host") for _ in range(10)], [0.0] * 10)
+
+    def test_prune(self) -> None:
+        limiter = RateLimiter(1, 1)
+        with patch.object(ratelimit, "MAX_BUCKETS", 2):
+            with patch("time.monotonic", return_value=100.0):
+                limiter.acquire("host_1")
+                limiter.acquire("host_2")
+            with patch("time.monotonic", return_value=200.0):
+                limiter.acquire("host_3")
+        self.assertEqual(list(limiter.buckets), ["host_3"])
+
+
+class TestSharedRateLimiter(unittest.TestCase):
+    def test_shared(self) -> None:
+        shared = shared_buckets(multiprocessing.get_context("spawn"), 16)
+        first = SharedRateLimiter(1, 2, shared)
+        second = SharedRateLimiter(1, 2, shared)
+        with patch("time.monotonic", return_value=100.0):
+            self.assertEqual(first.acquire("host"), 0.0)
+            self.assertEqual(second.acquire("host"), 0.0)
+            self.assertAlmostEqual(first.acquire("host"), 1.0)
+            self.assertAlmostEqual(second.acquire("host"), 1.0)
+        with patch("time.monotonic", return_value=101.0):
+            self.assertEqual(second.acquire("host"), 0.0)
+
+    def test_disabled(self) -> None:
+        shared = shared_buckets(multiprocessing.get_context("spawn"), 16)
+        limiter = SharedRateLimiter(0, 1, shared)
+        self.assertEqual([limiter.acquire("host") for _ in range(10)], [0.0] * 10)
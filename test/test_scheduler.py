@@ -0,0 +1,59 @@
+import asyncio
+import unittest
+
+from src.model.scheduler import HASH, READ, WRITE, Scheduler, SchedulerBusy
+
+
+class TestScheduler(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.scheduler = Scheduler(1, 1, 2, max_queued=2, timeout=0.2)
+        self.release = asyncio.Event()
+
+    async def block(self) -> None:
+        await self.release.wait()
+
+    async def noop(self) -> None:
+        pass
+
+    async def test_reads_bypass_hashing(self) -> None:
+        hashing = asyncio.create_task(self.scheduler.run(HASH, self.block))
+        queued = asyncio.create_task(self.scheduler.run(HASH, self.noop))
+        await asyncio.sleep(0)
+        await asyncio.wait_for(self.scheduler.run(READ, self.noop), 0.1)
+        self.assertFalse(queued.done())
+        self.assertEqual(self.scheduler.budgets[HASH].queued, 1)
+        self.release.set()
+        await asyncio.gather(hashing, queued)
+        self.assertEqual(self.scheduler.budgets[HASH].running, 0)
+
+    async def test_queue_limit(self) -> None:
+        running = asyncio.create_task(self.scheduler.run(WRITE, self.block))
+        queued = [
+            asyncio.create_task(self.scheduler.run(WRITE, self.noop)) for _ in range(2)
+        ]
+        await asyncio.sleep(0)
+        with self.assertRaises(SchedulerBusy):
+            await self.scheduler.run(WRITE, self.noop)
+        self.release.set()
+        await asyncio.gather(running, *queued)
+
+    async def test_timeout(self) -> None:
+        running = asyncio.create_task(self.scheduler.run(HASH, self.block))
+        await asyncio.sleep(0)
+        with self.assertRaises(SchedulerBusy):
+            await self.scheduler.run(HASH, self.noop)
+        self.assertEqual(self.scheduler.budgets[HASH].queued, 0)
+        self.release.set()
+        await running
+        await self.scheduler.run(HASH, self.noop)
+
+    async def test_hash_queue(self) -> None:
+        scheduler = Scheduler(1, 1, 1, max_queued=2, timeout=0.2, hash_queue=1)
+        running = asyncio.create_task(scheduler.run(HASH, self.block))
+        queued = asyncio.create_task(scheduler.run(HASH, self.noop))
+        await asyncio.sleep(0)
+        with self.assertRaises(SchedulerBusy):
+            await scheduler.run(HASH, self.noop)
+        self.assertEqual(scheduler.budgets[WRITE].max_queued, 2)
+        self.release.set()
+        await asyncio.gather(running, queued)
@@ -0,0 +1,68 @@
+import time
+import unittest
+from typing import Any, List
+
+from src.model.session import InvalidSession, Sessions
+
+
+class TestSessions(unittest.TestCase):
+    def setUp(self) -> None:
+        self.sessions = Sessions()
+        self.binding = self.sessions.binding()
+
+    def test_verify(self) -> None:
+        token = self.sessions.issue(7, self.binding)
+        self.assertEqual(self.sessions.verify(token, self.binding), 7)
+
+    def test_other_connection(self) -> None:
+        token = self.sessions.issue(7, self.binding)
+        with self.assertRaises(InvalidSession):
+            self.sessions.verify(token, self.sessions.binding())
+
+    def test_other_server(self) -> None:
+        token = Sessions().issue(7, self.binding)
+        with self.assertRaises(InvalidSession):
+            self.sessions.verify(token, self.binding)
+
+    def test_tampered(self) -> None:
+        token = self.sessions.issue(7, self.binding)
+        forged = Sessions(secret=b"forged").issue(8, self.binding)
+        payload = forged.split(".")[0]
+        signature = token.split(".")[1]
+        with self.assertRaises(InvalidSession):
+            self.sessions.verify(f"{payload}.{signature}", self.binding)
+        invalid_tokens: List[Any] = [
+            None,
+            "",
+            "garbage",
+            "a.b.c",
+            "!!.!!",
+            123,
+            ["a.b"],
+        ]
+        for invalid in invalid_tokens:
+            with self.assertRaises(InvalidSession):
+                self.sessions.verify(invalid, self.binding)
+
+    def test_expired(self) -> None:
+        sessions = Sessions(ttl=-1)
+        token = sessions.issue(7, self.binding)
+        with self.assertRaises(InvalidSession):
+            sessions.verify(token, self.binding)
+
+    def test_renew(self) -> None:
+        token = self.sessions.issue(7, self.binding)
+        uid, expires = self.sessions.check(token, self.binding)
+        self.assertIsNone(self.sessions.renew(uid, expires, self.binding))
+        renewed = self.sessions.renew(uid, int(time.time()) + 60, self.binding)
+        self.assertEqual(self.sessions.verify(renewed, self.binding), 7)
+
+    def test_revoke(self) -> None:
+        token = self.sessions.issue(7, self.binding)
+        other = self.sessions.issue(8, self.binding)
+        self.sessions.revoke(7)
+        with self.assertRaises(InvalidSession):
+            self.sessions.verify(token, self.binding)
+        self.assertEqual(self.sessions.verify(other, self.binding), 8)
+        token = self.sessions.issue(7, self.binding)
+        self.assertEqual(self.sessions.verify(token, self.binding), 7)
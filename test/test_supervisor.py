@@ -0,0 +1,50 @@
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from src.model.supervisor import Supervisor
+
+
+def crash_once(index: int, marker_dir: str) -> None:
+    marker = Path(marker_dir) / f"worker_{index}"
+    if not marker.exists():
+        marker.touch()
+        raise SystemExit(1)
+    (Path(marker_dir) / f"restarted_{index}").touch()
+    time.sleep(60)
+
+
+class TestSupervisor(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.supervisor = Supervisor(
+            crash_once, (self.temp_dir.name,), 2, restart_delay=0
+        )
+
+    def tearDown(self) -> None:
+        self.supervisor.stop()
+        self.temp_dir.cleanup()
+
+    def test_restart(self) -> None:
+        self.supervisor.start()
+        deadline = time.monotonic() + 30
+        while self.supervisor.restarts < 2 and time.monotonic() < deadline:
+            self.supervisor.check(0.5)
+        self.assertEqual(self.supervisor.restarts, 2)
+        while time.monotonic() < deadline:
+            if len(list(Path(self.temp_dir.name).glob("restarted_*"))) == 2:
+                break
+            time.sleep(0.1)
+        self.assertTrue(
+            all(process.is_alive() for process in self.supervisor.processes.values())
+        )
+        self.assertEqual(len(list(Path(self.temp_dir.name).glob("restarted_*"))), 2)
+
+    def test_stop(self) -> None:
+        self.supervisor.start()
+        processes = list(self.supervisor.processes.values())
+        self.supervisor.stop()
+        self.assertFalse(any(process.is_alive() for process in processes))
+        self.supervisor.check(0)
+        self.assertEqual(self.supervisor.restarts, 0)
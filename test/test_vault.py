@@ -124,5 +124,52 @@ class TestVault(unittest.TestCase):
         self.assertEqual(testvault.key, self.vault_key)
         self.assertEqual(testvault.services(), self.vault.services())
 
+    def test_changes(self) -> None:
+        search = self.vault.search("test_service")
+        if search is None:
+            self.fail("search is none")
+        id = search[0]["id"]
+        self.assertEqual(self.vault.changes, {id})
+        self.vault.changes.clear()
+        self.vault.update(id, "updated_service", "updated_user", "updated_password")
+        self.vault.add("test_service_2", "test_user_2", "test_password_2")
+        self.assertEqual(len(self.vault.changes), 2)
+        self.vault.delete(id)
+        self.assertIn(id, self.vault.changes)
+        self.assertIsNone(self.vault.record(id))
+
+    def test_apply(self) -> None:
+        search = self.vault.search("test_service")
+        if search is None:
+            self.fail("search is none")
+        id = search[0]["id"]
+        testvault = vault.Vault("test", self.vault_key)
+        testvault.apply(id, self.vault.record(id))
+        self.assertEqual(testvault.services(), self.vault.services())
+        self.assertEqual(testvault.changes, set())
+        testvault.apply(id, None)
+        self.assertIsNone(testvault.services())
+        testvault.rm()
+
+    def test_merge(self) -> None:
+        search = self.vault.search("test_service")
+        if search is None:
+            self.fail("search is none")
+        id = search[0]["id"]
+        self.vault.changes.clear()
+        self.vault.added.clear()
+        other = vault.Vault("test", self.vault_key)
+        other.load(self.vault.dump())
+        self.vault.add("local_service", "local_user", "local_password")
+        self.vault.update(id, "local_update", "test_user", "test_password")
+        other.add("remote_service", "remote_user", "remote_password")
+        other.merge(self.vault)
+        services = other.services()
+        if services is None:
+            self.fail("services is none")
+        names = [service["service"] for service in services]
+        self.assertEqual(names, ["local_update", "remote_service", "local_service"])
+        other.rm()
+
     def tearDown(self) -> None:
         self.vault.rm()